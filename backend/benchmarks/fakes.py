@@ -0,0 +1,165 @@
+# backend/benchmarks/fakes.py
+
+"""Offline stand-ins for the OpenAI LLM, SerpAPI and the embedding model.
+
+They let the benchmarks run the real pipeline without network access or API
+keys, with deterministic outputs and configurable latency:
+
+- ``HashEmbeddings``: bag-of-words feature hashing, so queries still land
+  near chunks that share their words
+- ``FakeChatModel``: answers in the section format the prompts ask for,
+  after ``latency`` seconds to the first token and ``tokens_per_second``
+  afterwards (also when streamed or asked for structured output)
+- ``fake_serpapi_transport``: an httpx transport answering SerpAPI searches
+  with canned results after ``latency`` seconds
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import httpx
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from embeddings.bm25_index import clean_text
+
+# --- Embeddings ---
+class HashEmbeddings(Embeddings):
+    """Deterministic, normalized bag-of-words embeddings via feature hashing"""
+
+    def __init__(self, size: int = 384, seconds_per_text: float = 0.0):
+        self.size = size
+        self.seconds_per_text = seconds_per_text  # Simulated model cost
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in clean_text(text).split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.seconds_per_text:
+            time.sleep(self.seconds_per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+# --- LLM ---
+FILLER = (
+    "Under the applicable provisions the offence is made out where the essential ingredients are proved "
+    "beyond reasonable doubt and the court weighs the facts of each case"
+).split()
+
+def fake_answer(output_tokens: int) -> str:
+    """An answer in the section format the pipeline parses, about ``output_tokens`` words long"""
+    per_section = max(output_tokens // 3, 1)
+    words = [FILLER[i % len(FILLER)] for i in range(per_section)]
+    body = " ".join(words) + "."
+    return (
+        f"Legal Analysis:\n{body}\n\n"
+        f"Additional Context:\n{body}\n\n"
+        f"Punishments and Fines:\n{body}\n\n"
+        "Sources:\n- [Indian Penal Code](https://www.indiacode.nic.in/)"
+    )
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that returns ``fake_answer`` with simulated generation latency"""
+
+    latency: float = 0.5  # Seconds to the first token
+    tokens_per_second: float = 50.0
+    output_tokens: int = 150
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self) -> List[str]:
+        words = fake_answer(self.output_tokens).split(" ")
+        return [f"{word} " for word in words[:-1]] + words[-1:]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generation_seconds(self) -> float:
+        return self.latency + self._token_delay() * len(self._tokens())
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._tokens())))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._generation_seconds())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self._tokens())))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens():
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._tokens():
+            await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def with_structured_output(self, schema, **kwargs):
+        """Fill every text field of the pydantic ``schema`` with filler after the generation time"""
+        def build():
+            text = " ".join(FILLER[i % len(FILLER)] for i in range(max(self.output_tokens // 3, 1)))
+            values = {
+                name: text for name, field in schema.model_fields.items()
+                if field.annotation is str
+            }
+            return schema(**values)
+
+        async def ainvoke(prompt):
+            await asyncio.sleep(self._generation_seconds())
+            return build()
+
+        def invoke(prompt):
+            time.sleep(self._generation_seconds())
+            return build()
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+# --- SerpAPI ---
+def fake_serpapi_response(query: str, results: int = 5) -> dict:
+    slug = "-".join(clean_text(query).split()[:6]) or "search"
+    return {
+        "organic_results": [
+            {
+                "title": f"{query} - legal commentary {i + 1}",
+                "link": f"https://example.org/{slug}/{i + 1}",
+                "snippet": " ".join(FILLER),
+            }
+            for i in range(results)
+        ]
+    }
+
+def fake_serpapi_transport(latency: float = 0.3, results: int = 5) -> httpx.AsyncBaseTransport:
+    """Transport for ``WebSearchClient`` answering ``/search.json`` after ``latency`` seconds"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        body = fake_serpapi_response(request.url.params.get("q", ""), results)
+        return httpx.Response(200, content=json.dumps(body), headers={"Content-Type": "application/json"})
+
+    return httpx.MockTransport(handler)
@@ -0,0 +1,140 @@
+# backend/benchmarks/index_report.py
+
+"""Recall@k / latency / memory report for the FAISS index types.
+
+Run from the backend directory after ``python ingest.py``:
+
+    python -m benchmarks.index_report [--size N] [--queries 200] [--k 4 12]
+                                      [--types flat ivf_flat ivf_pq hnsw]
+                                      [--nprobe 1 4 16 64] [--ef-search 16 32 64 128]
+                                      [--json report.json]
+
+The corpus is the exact vectors saved by ingestion. ``--size`` pads it with
+perturbed copies of those vectors to estimate a larger deployment. Queries
+are perturbed copies of sampled corpus vectors, and ground truth comes from
+an exact flat search, so no embedding model is needed. Index settings
+(IVF_NLIST, PQ_M, HNSW_M, ...) come from the environment as usual.
+"""
+
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from config import settings
+from embeddings.embedding_manager import INDEX_TYPES, build_faiss_index, configure_faiss_index, load_exact_index
+
+def perturb(vectors: np.ndarray, noise: float, rng) -> np.ndarray:
+    """Add Gaussian noise of relative scale ``noise`` and re-normalize"""
+    jitter = rng.standard_normal(vectors.shape).astype(np.float32)
+    jitter *= noise / np.linalg.norm(jitter, axis=1, keepdims=True)
+    out = vectors + jitter * np.linalg.norm(vectors, axis=1, keepdims=True)
+    return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+def load_corpus(size, noise: float, rng) -> np.ndarray:
+    exact = load_exact_index()
+    vectors = exact.reconstruct_n(0, exact.ntotal)
+    if size and size > len(vectors):
+        base = vectors[rng.integers(0, len(vectors), size - len(vectors))]
+        vectors = np.vstack([vectors, perturb(base, noise, rng)])
+    return np.ascontiguousarray(vectors[:size] if size else vectors, dtype=np.float32), exact.metric_type
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, ks) -> dict:
+    max_k = max(ks)
+    latencies = []
+    rows = np.empty((len(queries), max_k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], max_k)
+        latencies.append(time.perf_counter() - start)
+        rows[i] = found[0]
+
+    start = time.perf_counter()
+    index.search(queries, max_k)
+    batch_seconds = time.perf_counter() - start
+
+    result = {
+        f"recall@{k}": float(np.mean([
+            len(np.intersect1d(rows[i, :k], truth[i, :k])) / k for i in range(len(queries))
+        ]))
+        for k in ks
+    }
+    latencies = np.asarray(latencies) * 1000
+    result.update({
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "batch_qps": len(queries) / batch_seconds if batch_seconds else float("inf"),
+    })
+    return result
+
+def is_requested_type(index, index_type: str) -> bool:
+    # build_faiss_index falls back to flat for corpora too small to train
+    return index_type == "flat" or not isinstance(index, faiss.IndexFlat)
+
+def print_table(report: list, ks):
+    columns = ["type", "param", "build_s", "memory_mb"] + [f"recall@{k}" for k in ks] + ["p50_ms", "p95_ms", "batch_qps"]
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "|".join("---" for _ in columns) + "|")
+    for row in report:
+        cells = []
+        for column in columns:
+            value = row.get(column, "")
+            cells.append(f"{value:.3f}" if isinstance(value, float) else str(value))
+        print("| " + " | ".join(cells) + " |")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on the ingested vectors.")
+    parser.add_argument("--size", type=int, default=None, help="Corpus size; padded with synthetic vectors if larger than the index")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, nargs="+", default=[settings.RETRIEVAL_TOP_K, settings.DENSE_CANDIDATES])
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64], help="IVF nprobe values to sweep")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128], help="HNSW efSearch values to sweep")
+    parser.add_argument("--noise", type=float, default=0.5, help="Relative noise of synthetic vectors and queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    vectors, metric = load_corpus(args.size, args.noise, rng)
+    queries = perturb(vectors[rng.integers(0, len(vectors), args.queries)], args.noise, rng)
+    print(f"[INFO] {len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries")
+
+    exact = faiss.IndexFlat(vectors.shape[1], metric)
+    exact.add(vectors)
+    _, truth = exact.search(queries, max(args.k))
+
+    report = []
+    for index_type in args.types:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, metric, index_type, seed=args.seed)
+        build_seconds = time.perf_counter() - start
+        memory_mb = len(faiss.serialize_index(index)) / 2 ** 20
+
+        if faiss.try_extract_index_ivf(index) is not None:
+            sweep = [("nprobe", value, {"nprobe": value}) for value in args.nprobe]
+        elif hasattr(index, "hnsw"):
+            sweep = [("efSearch", value, {"ef_search": value}) for value in args.ef_search]
+        else:
+            sweep = [("", "", {})]
+
+        for name, value, tunables in sweep:
+            configure_faiss_index(index, **tunables)
+            row = {
+                "type": index_type if is_requested_type(index, index_type) else f"{index_type}->flat",
+                "param": f"{name}={value}" if name else "-",
+                "build_s": build_seconds,
+                "memory_mb": memory_mb,
+            }
+            row.update(measure(index, queries, truth, args.k))
+            report.append(row)
+
+    print_table(report, args.k)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
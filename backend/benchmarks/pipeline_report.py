@@ -0,0 +1,389 @@
+# backend/benchmarks/pipeline_report.py
+
+"""Offline benchmark of ingestion, retrieval and the ``/query`` endpoint.
+
+Run from the backend directory; no network access or API keys are needed:
+
+    python -m benchmarks.pipeline_report [--data-dir data] [--clients 1 4 16] [--requests 32]
+                                         [--mode multi_pass] [--llm-latency 0.3]
+                                         [--llm-tokens-per-second 200] [--web-latency 0.3]
+                                         [--json results.json] [--compare baseline.json]
+
+The real pipeline runs against the PDFs in ``--data-dir`` with the stand-ins
+from ``benchmarks.fakes`` for the LLM, SerpAPI and the embedding model, in a
+temporary working directory (index, chat history and PDFs never touch the
+real ones). It reports:
+
+- ingestion: a full build of the index from the PDFs, then a no-op sync
+- retrieval: latency percentiles of ``retrieve_documents`` and of packing
+  the prompt context
+- ``/query``: p50/p95/p99 latency and throughput for each number of
+  concurrent clients, through the FastAPI app in-process
+- ``/query/batch``: throughput of the same number of queries sent as one
+  batch (at most ``BATCH_MAX_PARALLEL`` of them answered at a time)
+
+Each request's query is distinct, so the answer cache and request
+coalescing do not hide pipeline cost; pass ``--repeat-queries`` to cycle
+through the query set and measure them instead. Save a report with
+``--json`` and diff a later run against it with ``--compare``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from utils.log import configure_logging
+
+QUERIES = [
+    ("What is the punishment for theft?", "IPC"),
+    ("Is anticipatory bail available for a non-bailable offence?", "CrPC"),
+    ("What are the ingredients of criminal breach of trust?", "IPC"),
+    ("Which court can try a case of cheating?", "CrPC"),
+    ("What is the limitation period for filing a civil suit?", "Civil"),
+    ("What is the penalty for dowry harassment?", "IPC"),
+    ("Can the police arrest without a warrant?", "CrPC"),
+    ("What are the fundamental rights under the Constitution?", "Constitution"),
+    ("What is the punishment for murder?", "IPC"),
+    ("How is a first information report registered?", "CrPC"),
+    ("What is defamation and how is it punished?", "IPC"),
+    ("What are the grounds for divorce?", "Family"),
+    ("What is the penalty for drunk driving?", "Traffic"),
+    ("When is a confession to the police admissible?", "Evidence"),
+    ("What is the punishment for forgery of documents?", "IPC"),
+    ("What are the rights of an arrested person?", "CrPC"),
+]
+
+# --- Setup ---
+def configure(workdir: str, args):
+    """Point every on-disk artifact at ``workdir`` and apply the benchmark settings"""
+    settings.VECTOR_DB_PATH = os.path.join(workdir, "vectorstore")
+    settings.EMBEDDING_CACHE_DIR = None
+    settings.EMBEDDING_MODEL = f"hash-embeddings-{args.embedding_size}"
+    settings.CHAT_HISTORY_DB_PATH = os.path.join(workdir, "chat_history.db")
+    settings.PDF_DIR = os.path.join(workdir, "pdfs")
+    settings.PIPELINE_MODE = args.mode
+    settings.ANSWER_CACHE_ENABLED = args.repeat_queries
+    settings.INDEX_WATCH_INTERVAL_SECONDS = 0
+    settings.PRELOAD_INDEX = False
+
+def install_fakes(args):
+    from benchmarks.fakes import FakeChatModel, HashEmbeddings, fake_serpapi_transport
+    from chains.rag_chain import set_llm
+    from chains.web_search import WebSearchClient, set_web_search_client
+    from embeddings.embedding_manager import set_embedding_model
+
+    set_embedding_model(HashEmbeddings(args.embedding_size, args.embedding_seconds_per_text))
+    set_llm(FakeChatModel(
+        latency=args.llm_latency,
+        tokens_per_second=args.llm_tokens_per_second,
+        output_tokens=args.llm_output_tokens,
+    ))
+    set_web_search_client(WebSearchClient(
+        api_key="offline",
+        timeout=settings.WEB_SEARCH_TIMEOUT_SECONDS,
+        cache_ttl=settings.WEB_SEARCH_CACHE_TTL_SECONDS if args.repeat_queries else 0,
+        cache_size=settings.WEB_SEARCH_CACHE_SIZE,
+        max_connections=settings.WEB_SEARCH_MAX_CONNECTIONS,
+        transport=fake_serpapi_transport(args.web_latency),
+    ))
+
+def percentiles(seconds) -> dict:
+    if not len(seconds):
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(np.mean(ms)),
+    }
+
+def request_queries(count: int, repeat: bool):
+    for i in range(count):
+        query, category = QUERIES[i % len(QUERIES)]
+        if not repeat and i >= len(QUERIES):
+            query = f"{query} (case {i // len(QUERIES)})"
+        yield query, category
+
+# --- Phases ---
+def bench_ingestion(data_dir: str, workers) -> dict:
+    from embeddings.embedding_manager import sync_vectorstores
+
+    files = sorted(Path(data_dir).rglob("*.pdf"))
+    total_bytes = sum(path.stat().st_size for path in files)
+
+    start = time.perf_counter()
+    db = sync_vectorstores(data_dir, rebuild=True, workers=workers)
+    build_seconds = time.perf_counter() - start
+    chunks = db.index.ntotal
+
+    start = time.perf_counter()
+    sync_vectorstores(data_dir, workers=workers)
+    noop_seconds = time.perf_counter() - start
+
+    return {
+        "files": len(files),
+        "megabytes": total_bytes / 2 ** 20,
+        "chunks": chunks,
+        "build_s": build_seconds,
+        "chunks_per_s": chunks / build_seconds,
+        "megabytes_per_s": total_bytes / 2 ** 20 / build_seconds,
+        "noop_sync_s": noop_seconds,
+    }
+
+async def bench_retrieval(rounds: int) -> dict:
+    from chains.rag_chain import build_context, ensure_retrieval_resources, retrieve_documents
+
+    start = time.perf_counter()
+    await ensure_retrieval_resources()
+    load_seconds = time.perf_counter() - start
+
+    retrieval, packing = [], []
+    for _ in range(rounds):
+        for query, category in QUERIES:
+            start = time.perf_counter()
+            retrieved = await retrieve_documents(query, category)
+            retrieval.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await build_context(retrieved)
+            packing.append(time.perf_counter() - start)
+
+    return {
+        "load_s": load_seconds,
+        "queries": len(retrieval),
+        "retrieve": percentiles(retrieval),
+        "pack_context": percentiles(packing),
+    }
+
+async def bench_queries(clients: int, requests: int, args) -> dict:
+    import httpx
+    from main import app
+
+    pending = list(request_queries(requests, args.repeat_queries))
+    latencies, errors, shed = [], 0, 0
+
+    async def client_loop(client: httpx.AsyncClient, worker: int):
+        nonlocal errors, shed
+        while pending:
+            query, category = pending.pop(0)
+            start = time.perf_counter()
+            response = await client.post("/query", json={
+                "query": query,
+                "category": category,
+                "use_web": not args.no_web,
+                "session_id": f"bench-{worker}",
+            })
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            elif response.status_code in (429, 503):
+                shed += 1  # Rejected by admission control (see utils/scheduler.py)
+            else:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, worker) for worker in range(clients)))
+        wall_seconds = time.perf_counter() - start
+
+    return {
+        "clients": clients,
+        "requests": requests,
+        "errors": errors,
+        "shed": shed,
+        "wall_s": wall_seconds,
+        "throughput_rps": len(latencies) / wall_seconds,
+        **percentiles(latencies),
+    }
+
+async def bench_batch(requests: int, args) -> dict:
+    import httpx
+    from main import app
+
+    queries = [{"query": query, "category": category} for query, category in request_queries(requests, args.repeat_queries)]
+    results = errors = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        start = time.perf_counter()
+        async with client.stream("POST", "/query/batch", json={"queries": queries, "use_web": not args.no_web}) as response:
+            async for line in response.aiter_lines():
+                if line == "event: result":
+                    results += 1
+                elif line == "event: error":
+                    errors += 1
+        wall_seconds = time.perf_counter() - start
+
+    return {
+        "queries": requests,
+        "errors": errors,
+        "wall_s": wall_seconds,
+        "throughput_qps": results / wall_seconds,
+    }
+
+# --- Reporting ---
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def print_table(rows: list, columns: list):
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "|".join("---" for _ in columns) + "|")
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column, "")
+            cells.append(f"{value:.3f}" if isinstance(value, float) else str(value))
+        print("| " + " | ".join(cells) + " |")
+
+def print_report(report: dict):
+    print("\nIngestion")
+    print_table([report["ingestion"]], list(report["ingestion"]))
+    print("\nRetrieval")
+    retrieval = report["retrieval"]
+    print_table(
+        [{"stage": stage, **retrieval[stage]} for stage in ("retrieve", "pack_context")],
+        ["stage", "p50_ms", "p95_ms", "p99_ms", "mean_ms"]
+    )
+    print(f"\n/query ({report['config']['mode']})")
+    print_table(report["query"], ["clients", "requests", "errors", "shed", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"])
+    if report.get("batch"):
+        print(f"\n/query/batch (BATCH_MAX_PARALLEL={settings.BATCH_MAX_PARALLEL})")
+        print_table([report["batch"]], list(report["batch"]))
+    print("\nStages")
+    print_table(
+        [{"stage": stage, **values} for stage, values in report["stats"]["stages"].items()],
+        ["stage", "count", "mean_ms"]
+    )
+
+def metrics(report: dict) -> dict:
+    """Flat ``{name: value}`` of the numbers compared between runs"""
+    flat = {
+        "ingestion.chunks_per_s": report["ingestion"]["chunks_per_s"],
+        "ingestion.noop_sync_s": report["ingestion"]["noop_sync_s"],
+    }
+    for stage in ("retrieve", "pack_context"):
+        for key in ("p50_ms", "p95_ms"):
+            flat[f"retrieval.{stage}.{key}"] = report["retrieval"][stage][key]
+    for row in report["query"]:
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            flat[f"query.c{row['clients']}.{key}"] = row[key]
+    if report.get("batch"):
+        flat["batch.throughput_qps"] = report["batch"]["throughput_qps"]
+    return flat
+
+def print_comparison(report: dict, baseline: dict):
+    print(f"\nChange since {baseline.get('commit') or 'baseline'}")
+    current, previous = metrics(report), metrics(baseline)
+    rows = []
+    for name, value in current.items():
+        before = previous.get(name)
+        if before is None or value is None:
+            continue
+        change = (value - before) / before * 100 if before else 0.0
+        rows.append({"metric": name, "baseline": before, "current": value, "change_%": change})
+    print_table(rows, ["metric", "baseline", "current", "change_%"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and /query offline.")
+    parser.add_argument("--data-dir", default=settings.DATA_DIR, help="Directory containing the PDFs to ingest")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: INGEST_WORKERS or CPU count)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16], help="Concurrent /query clients to sweep")
+    parser.add_argument("--requests", type=int, default=32, help="/query requests per client count")
+    parser.add_argument("--retrieval-rounds", type=int, default=5, help="Passes over the query set for retrieval latency")
+    parser.add_argument("--mode", choices=["multi_pass", "single_pass"], default=settings.PIPELINE_MODE)
+    parser.add_argument("--no-web", action="store_true", help="Send use_web=false")
+    parser.add_argument("--no-batch", action="store_true", help="Skip the /query/batch measurement")
+    parser.add_argument("--repeat-queries", action="store_true", help="Cycle the query set and enable the answer and web caches")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds to the first LLM token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--llm-output-tokens", type=int, default=150)
+    parser.add_argument("--web-latency", type=float, default=0.3, help="Seconds per SerpAPI request")
+    parser.add_argument("--embedding-size", type=int, default=384)
+    parser.add_argument("--embedding-seconds-per-text", type=float, default=0.0, help="Simulated embedding model cost")
+    parser.add_argument("--workdir", help="Keep index and outputs here instead of a temporary directory")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the pipeline while benchmarking")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--compare", help="Report from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    if not any(Path(args.data_dir).rglob("*.pdf")):
+        parser.error(f"No PDFs found in {args.data_dir}")
+    data_dir = os.path.abspath(args.data_dir)
+
+    configure_logging(args.log_level)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="lexgen-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    configure(workdir, args)
+    install_fakes(args)
+
+    from chains.rag_chain import answer_cache
+    from chains.web_search import close_web_search_client, get_web_search_client
+    from utils.concurrency import shutdown_executor
+    from utils.history_store import get_history_store
+    from utils.metrics import STAGE_SECONDS
+    from utils.singleflight import singleflight_stats
+
+    try:
+        print(f"[INFO] Ingesting PDFs from {data_dir} into {workdir}...")
+        report = {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare", "workdir", "log_level")},
+            "ingestion": bench_ingestion(data_dir, args.workers),
+        }
+
+        async def run():
+            report["retrieval"] = await bench_retrieval(args.retrieval_rounds)
+            report["query"] = []
+            for clients in args.clients:
+                print(f"[INFO] {args.requests} /query requests from {clients} concurrent clients...")
+                report["query"].append(await bench_queries(clients, args.requests, args))
+            if not args.no_batch:
+                print(f"[INFO] {args.requests} queries in one /query/batch request...")
+                report["batch"] = await bench_batch(args.requests, args)
+            report["stats"] = {
+                "answer_cache": answer_cache.stats() if answer_cache else None,
+                "web_search": get_web_search_client().stats(),
+                "coalescing": singleflight_stats(),
+                # Mean time per pipeline stage over the whole run
+                "stages": {
+                    stage: {"count": count, "mean_ms": total / count * 1000}
+                    for (stage,), (count, total) in sorted(STAGE_SECONDS.totals().items()) if count
+                },
+            }
+            await close_web_search_client()
+
+        asyncio.run(run())
+    finally:
+        shutdown_executor()
+        get_history_store().close()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
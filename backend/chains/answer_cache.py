@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import numpy as np
+from embeddings.bm25_index import clean_text
+from embeddings.citation_index import parse_query
+
+def normalize_query(query: str) -> str:
+    """Lower-case, strip punctuation and collapse whitespace"""
+    return " ".join(clean_text(query).split())
+
+def query_identifiers(query: str) -> frozenset:
+    """Provision and case references ("section:302") and number tokens ("302", "66a") in a query"""
+    keys = parse_query(query, []).keys
+    return frozenset(keys) | frozenset(re.findall(r"\d+[a-z]*", normalize_query(query)))
+
+class AnswerCache:
+    """LRU + TTL cache of pipeline answers.
+
+    Lookups first try an exact match on the normalized query, category,
+    web flag and pipeline mode. If ``embed`` and ``similarity_threshold`` are
+    set, a miss falls back to the most similar cached query with the same
+    category/web/mode whose cosine similarity reaches the threshold
+    (``embed`` must return normalized vectors). A similar query only matches
+    if it names exactly the same sections, articles, cases and numbers:
+    "Section 302 IPC" and "Section 307 IPC" embed almost identically.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        similarity_threshold: Optional[float] = None,
+        embed: Optional[Callable[[str], list]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed if similarity_threshold else None
+        self._entries = OrderedDict()  # key -> (expires_at, partition, identifiers, vector, value)
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _partition(category: str, use_web: bool, mode: str) -> str:
+        return f"{category.strip().lower()}|{bool(use_web)}|{mode}"
+
+    def _drop_expired(self, now: float):
+        for key in [key for key, entry in self._entries.items() if entry[0] <= now]:
+            del self._entries[key]
+            self._stats["expired"] += 1
+
+    def get(self, query: str, category: str, use_web: bool, mode: str, vector=None):
+        """Return the cached value for the query, or None; ``vector`` is the normalized query's embedding, if known"""
+        normalized = normalize_query(query)
+        partition = self._partition(category, use_web, mode)
+        key = f"{normalized}|{partition}"
+        now = time.monotonic()
+
+        with self._lock:
+            self._drop_expired(now)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                return self._entries[key][4]
+            identifiers = query_identifiers(query)
+            candidates = [
+                (entry_key, entry[3]) for entry_key, entry in self._entries.items()
+                if entry[1] == partition and entry[2] == identifiers and entry[3] is not None
+            ]
+
+        if self.embed is not None and candidates:
+            # Embed outside the lock; the model call dominates lookup cost
+            vector = np.asarray(self.embed(normalized) if vector is None else vector, dtype=np.float32)
+            similarities = np.stack([candidate for _, candidate in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                with self._lock:
+                    entry = self._entries.get(candidates[best][0])
+                    if entry is not None and entry[0] > now:
+                        self._entries.move_to_end(candidates[best][0])
+                        self._stats["semantic_hits"] += 1
+                        return entry[4]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, query: str, category: str, use_web: bool, mode: str, value, vector=None):
+        """Cache a value for the query, evicting the least recently used entries"""
+        normalized = normalize_query(query)
+        partition = self._partition(category, use_web, mode)
+        if self.embed is None:
+            vector = None
+        else:
+            vector = np.asarray(self.embed(normalized) if vector is None else vector, dtype=np.float32)
+
+        with self._lock:
+            key = f"{normalized}|{partition}"
+            self._entries[key] = (
+                time.monotonic() + self.ttl_seconds, partition, query_identifiers(query), vector, value
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
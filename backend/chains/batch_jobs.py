@@ -0,0 +1,103 @@
+"""In-memory store of asynchronous batch query jobs.
+
+A job consumes the ``(index, result, error)`` events of a batch as it runs
+in the background, so clients can poll its progress and the results
+finished so far. Jobs live in the memory of the worker that accepted them;
+with several uvicorn workers, poll the worker the job was submitted to (or
+use one worker for batch traffic). Finished jobs are dropped after
+``ttl_seconds``.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+class TooManyJobs(Exception):
+    """Every job slot is taken by a running job"""
+
+class BatchJob:
+    """Progress and results of one batch"""
+
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.status = "running"  # "running", "done", "failed" or "cancelled"
+        self.error: Optional[str] = None
+        self.results = {}  # index -> result dict
+        self.errors = {}  # index -> error message
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def completed(self) -> int:
+        return len(self.results) + len(self.errors)
+
+    async def run(self, events: AsyncIterator):
+        try:
+            async for index, result, error in events:
+                if error is None:
+                    self.results[index] = result
+                else:
+                    self.errors[index] = error
+            self.status = "done"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Batch job {self.id} failed: {str(e)}")
+            self.status, self.error = "failed", str(e)
+        finally:
+            self.finished_at = time.time()
+
+class BatchJobStore:
+    """Running and recently finished batch jobs, at most ``max_jobs`` of them"""
+
+    def __init__(self, max_jobs: int = 32, ttl_seconds: float = 6 * 3600):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs = OrderedDict()  # job id -> BatchJob, oldest first
+        self._stats = {"submitted": 0, "rejected": 0}
+
+    def _drop_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at <= cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, total: int, events: AsyncIterator) -> BatchJob:
+        """Start consuming a batch's events in the background; returns the new job"""
+        self._drop_expired()
+        if len(self._jobs) >= self.max_jobs:
+            # Make room by forgetting the oldest finished job
+            finished = next((job_id for job_id, job in self._jobs.items() if job.finished_at), None)
+            if finished is None:
+                self._stats["rejected"] += 1
+                raise TooManyJobs(f"{len(self._jobs)} batch jobs are already running")
+            del self._jobs[finished]
+
+        job = BatchJob(total)
+        # A fresh context, so the job is not attributed to the request that submitted it
+        job.task = asyncio.get_running_loop().create_task(job.run(events), context=contextvars.Context())
+        self._jobs[job.id] = job
+        self._stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self._drop_expired()
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        running = sum(1 for job in self._jobs.values() if job.finished_at is None)
+        return {**self._stats, "jobs": len(self._jobs), "running": running}
+
+    def cancel_all(self):
+        """Stop the running jobs; called on application shutdown"""
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
@@ -0,0 +1,158 @@
+"""Token-budgeted context assembly for LLM prompts.
+
+Retrieved chunks are not pasted into prompts as-is:
+
+1. Candidates are ordered by maximal marginal relevance (MMR), trading a
+   little relevance for diversity so near-duplicate chunks sink.
+2. They are packed in that order until the token budget is spent. A chunk
+   that overlaps an already packed chunk of the same source page (the text
+   splitter repeats up to ``chunk_overlap`` characters between neighbours)
+   is merged into it and only its new text is counted; chunks whose text is
+   already packed are skipped.
+
+Tokens are counted with tiktoken when its encoding is available, and
+estimated at about four characters per token otherwise.
+"""
+
+import logging
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from config import settings
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to the character estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+SEPARATOR = "\n\n"
+
+# --- Token Counting ---
+@lru_cache(maxsize=None)
+def _get_encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # The encoding file is downloaded on first use; offline hosts estimate instead
+        logger.warning(f"tiktoken encoding {name} unavailable, estimating token counts: {str(e)}")
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding(settings.CONTEXT_TOKENIZER)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: Optional[int]) -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens (no limit if None)"""
+    if not text or max_tokens is None or count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding(settings.CONTEXT_TOKENIZER)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+# --- Overlap Removal ---
+def overlap_length(left: str, right: str, min_chars: int = 20, max_chars: int = 200) -> int:
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``"""
+    for length in range(min(max_chars, len(left), len(right)), min_chars - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+def _page_key(doc: Document):
+    return doc.metadata.get("source"), doc.metadata.get("page")
+
+class _Passage:
+    """Contiguous text packed from one or more chunks of the same page"""
+
+    def __init__(self, doc: Document, text: str):
+        self.key = _page_key(doc)
+        self.text = text
+
+    def extension(self, text: str):
+        """``(new_text, merged_text)`` if ``text`` overlaps this passage, else None"""
+        if text in self.text:
+            return "", self.text
+        overlap = overlap_length(self.text, text, max_chars=settings.CONTEXT_MAX_OVERLAP_CHARS)
+        if overlap:
+            return text[overlap:], self.text + text[overlap:]
+        overlap = overlap_length(text, self.text, max_chars=settings.CONTEXT_MAX_OVERLAP_CHARS)
+        if overlap:
+            return text[:-overlap], text[:-overlap] + self.text
+        return None
+
+# --- Packing ---
+class PackedContext(NamedTuple):
+    text: str
+    documents: List[Document]  # Chunks that made it into the context, in packing order
+    tokens: int
+
+def mmr_order(query_vector, doc_vectors, lambda_mult: float) -> List[int]:
+    """Indices of all documents in maximal marginal relevance order"""
+    return maximal_marginal_relevance(
+        np.asarray(query_vector, dtype=np.float32), list(doc_vectors), lambda_mult=lambda_mult, k=len(doc_vectors)
+    )
+
+def pack_documents(docs: List[Document], budget: Optional[int]) -> PackedContext:
+    """Pack chunks in the given order into at most ``budget`` tokens, merging overlapping neighbours"""
+    passages, used, tokens = [], [], 0
+    seen_texts = set()
+    separator_tokens = count_tokens(SEPARATOR)
+
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text or text in seen_texts:
+            continue
+
+        target, new_text, merged = None, text, None
+        for passage in passages:
+            if passage.key == _page_key(doc):
+                extension = passage.extension(text)
+                if extension is not None:
+                    target, (new_text, merged) = passage, extension
+                    break
+
+        cost = count_tokens(new_text)
+        if target is None and passages:
+            cost += separator_tokens
+        if budget is not None and tokens + cost > budget:
+            if passages:
+                continue
+            # Never return an empty context: cut the best chunk down to the budget
+            new_text = truncate_to_tokens(text, budget)
+            cost = count_tokens(new_text)
+
+        seen_texts.add(text)
+        used.append(doc)
+        tokens += cost
+        if target is not None:
+            target.text = merged
+        else:
+            passages.append(_Passage(doc, new_text))
+
+    return PackedContext(SEPARATOR.join(passage.text for passage in passages), used, tokens)
+
+def pack_context(docs: List[Document], budget: Optional[int] = None, query_vector=None, doc_vectors=None,
+                 lambda_mult: Optional[float] = None) -> PackedContext:
+    """Order retrieved chunks by MMR and pack them into the token budget.
+
+    ``query_vector`` and ``doc_vectors`` are the embeddings retrieval already
+    has (the chunk vectors are read from the index); nothing is embedded here.
+    Without them the chunks are packed in retrieval order.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET if budget is None else budget
+    lambda_mult = settings.MMR_LAMBDA if lambda_mult is None else lambda_mult
+    if query_vector is not None and doc_vectors is not None and len(docs) > 1:
+        try:
+            docs = [docs[i] for i in mmr_order(query_vector, doc_vectors, lambda_mult)]
+        except Exception as e:
+            logger.warning(f"MMR ordering failed, keeping retrieval order: {str(e)}")
+    return pack_documents(docs, budget)
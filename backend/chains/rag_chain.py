@@ -1,54 +1,274 @@
 # backend/chains/rag_chain.py
 
 import re
-from rank_bm25 import BM25Okapi
-from langchain.chains import RetrievalQA
-from langchain_community.tools import Tool
-from langchain_community.utilities import SerpAPIWrapper
-from langchain_core.prompts import PromptTemplate
+import numpy as np
 from langchain.schema import BaseRetriever, Document
-from typing import Any, List, Optional, Dict
-from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from typing import Any, List, NamedTuple, Optional, Dict, Tuple
+from langchain.callbacks.manager import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_community.vectorstores.utils import DistanceStrategy
 from pydantic import BaseModel, Field
 import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 from config import settings
-from embeddings.embedding_manager import build_or_load_vectorstores
-from fpdf import FPDF
-import os
-import uuid
+from embeddings.embedding_manager import (
+    RetrievalResources, embed_queries, get_embedding_model, load_retrieval_resources,
+    search_index
+)
+from embeddings.snapshots import read_current_version
+from embeddings.citation_index import parse_query as parse_citation_query
+from utils.concurrency import get_executor, run_blocking
+from utils.history_store import get_history_store
+from utils.singleflight import get_singleflight
+from chains.answer_cache import AnswerCache, normalize_query
+from chains.context import PackedContext, count_tokens, pack_context, truncate_to_tokens
+from chains.web_search import get_web_search_client
+from utils.metrics import record_llm_tokens, record_stage, span
+from utils.scheduler import (
+    PRIORITY_BATCH, PRIORITY_DEFAULT, PRIORITY_INTERACTIVE, SchedulerRejected, get_scheduler, request_priority
+)
+from utils.pdf_store import register_pdf
+import hashlib
+import time
+from pathlib import PureWindowsPath
 from langchain_openai import ChatOpenAI
 
-# Initialize LLM
-llm = ChatOpenAI(
-    api_key=settings.OPENAI_API_KEY,
-    model="gpt-3.5-turbo",
-    temperature=0.7
+logger = logging.getLogger(__name__)
+
+# LLM, created on first use so importing this module needs no API key
+llm = None
+
+def get_llm():
+    global llm
+    if llm is None:
+        if not settings.OPENAI_API_KEY:
+            raise RuntimeError("OPENAI_API_KEY is not set")
+        llm = ChatOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            model="gpt-3.5-turbo",
+            temperature=0.7,
+            max_retries=0  # llm_scheduler retries, so every attempt is counted against the rate limits
+        )
+    return llm
+
+def set_llm(model):
+    """Replace the LLM, e.g. with a stand-in for offline benchmarks"""
+    global llm
+    llm = model
+
+# Identical concurrent prompts share one LLM call
+llm_flight = get_singleflight("llm")
+
+# Concurrency limit, priority queue, rate limits and retries for every LLM call
+llm_scheduler = get_scheduler(
+    "llm",
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff=settings.RETRY_BACKOFF_SECONDS,
+    max_backoff=settings.RETRY_BACKOFF_MAX_SECONDS,
 )
 
-# Initialize vectorstore (this should be done in main.py and passed here)
-vectorstore = None
-
-def set_vectorstore(vs):
-    global vectorstore
-    vectorstore = vs
-
-# --- Text Cleaning ---
-def clean_text(text):
-    return re.sub(r'\W+', ' ', text.lower())
+def estimate_llm_tokens(prompt: str) -> int:
+    """Tokens a call is expected to use, counted against the token quota before it runs"""
+    return count_tokens(prompt) + settings.LLM_EXPECTED_COMPLETION_TOKENS
+
+def prompt_key(prompt: str, kind: str = "text") -> str:
+    return f"{kind}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+
+def record_llm_usage(call: str, prompt: str, message=None, completion: str = ""):
+    """Count an LLM call's tokens, from the provider's usage data when it reports it"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record_llm_tokens(call, usage["input_tokens"], usage["output_tokens"])
+    else:
+        record_llm_tokens(call, count_tokens(prompt), count_tokens(completion or message.content))
+
+async def _ainvoke(model, prompt: str, call: str):
+    with span(f"llm_{call}"):
+        return await model.ainvoke(prompt)
+
+async def _apredict(prompt: str, call: str) -> str:
+    response = await llm_scheduler.run(_ainvoke, get_llm(), prompt, call, cost=estimate_llm_tokens(prompt))
+    record_llm_usage(call, prompt, response)
+    return response.content
+
+async def apredict(prompt: str, call: str = "text") -> str:
+    """Run the LLM on a prompt through the native async OpenAI client; ``call`` labels its metrics"""
+    return await llm_flight.do(prompt_key(prompt), _apredict, prompt, call)
+
+# Vectorstore, BM25 and citation indexes and category partitions of the active index snapshot.
+# They are replaced together by a single assignment, so a query that read
+# ``resources`` keeps a consistent snapshot even if a reload swaps it meanwhile.
+resources: Optional[RetrievalResources] = None
+
+def set_retrieval_resources(new_resources: Optional[RetrievalResources]):
+    global resources
+    resources = new_resources
+
+def get_retrieval_resources() -> Optional[RetrievalResources]:
+    """Resources of the snapshot being served, or None before the first load"""
+    return resources
+
+_resources_lock = asyncio.Lock()
+
+async def ensure_retrieval_resources() -> RetrievalResources:
+    """Load the current index snapshot on first use; returns the active resources"""
+    if resources is not None and resources.vectorstore is not None:
+        return resources
+    async with _resources_lock:
+        if resources is None or resources.vectorstore is None:
+            set_retrieval_resources(await run_blocking(load_retrieval_resources))
+    return resources
+
+def warm_retrieval_resources(candidate: RetrievalResources):
+    """Run the warm-up queries against a snapshot so its pages are resident before it serves"""
+    for query in settings.INDEX_WARMUP_QUERIES:
+        HybridRetriever(
+            vectorstore=candidate.vectorstore,
+            bm25_index=candidate.bm25_index,
+            citations=candidate.citations,
+            vectors=candidate.vectors,
+        ).retrieve(query)
+
+async def reload_retrieval_resources(version: Optional[str] = None) -> Dict[str, Any]:
+    """Load a snapshot (default: CURRENT) in the background, warm it, then swap it in.
+
+    Queries already running finish on the snapshot they started with; the old
+    one is released once they are done. Cached answers are dropped, as they
+    were produced from the old index.
+    """
+    version = version or read_current_version()
+    if version is None:
+        raise FileNotFoundError("No index snapshot has been published; run `python ingest.py` first")
+
+    async with _resources_lock:
+        previous = resources.version if resources is not None else None
+        if version == previous:
+            return {"previous": previous, "version": version, "reloaded": False}
+        candidate = await run_blocking(load_retrieval_resources, version)
+        await run_blocking(warm_retrieval_resources, candidate)
+        set_retrieval_resources(candidate)
+
+    if answer_cache is not None:
+        answer_cache.clear()
+    logger.info(f"Swapped index snapshot {previous} -> {version}")
+    return {"previous": previous, "version": version, "reloaded": True}
+
+async def watch_index_snapshots(interval: float):
+    """Poll CURRENT and hot-swap to newly published snapshots, for every worker process"""
+    failed_version = None
+    while True:
+        await asyncio.sleep(interval)
+        version = read_current_version()
+        # Nothing is loaded yet (the first query picks up CURRENT anyway), or a
+        # snapshot already failed to load and nothing newer has been published
+        if resources is None or version is None or version in (resources.version, failed_version):
+            continue
+        try:
+            await reload_retrieval_resources(version)
+        except Exception as e:
+            failed_version = version
+            logger.error(f"Failed to load index snapshot {version}: {str(e)}")
+
+class Retrieved(NamedTuple):
+    """A query's chunks, with the query's embedding and the chunks' index vectors (for MMR) when known"""
+    docs: List[Document]
+    query_vector: Any = None
+    doc_vectors: Any = None
+
+# --- Score Fusion ---
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low <= 1e-12:
+        return np.ones_like(scores, dtype=np.float32)
+    return (scores - low) / (high - low)
+
+def reciprocal_rank_fusion(rankings, weights, k: int = 60):
+    """Fuse ranked row lists with weighted reciprocal rank fusion.
+
+    Each ranking is a ``(rows, scores)`` pair ordered best first.
+    Returns fused rows and scores, best first.
+    """
+    fused = {}
+    for (rows, _), weight in zip(rankings, weights):
+        for rank, row in enumerate(rows):
+            fused[int(row)] = fused.get(int(row), 0.0) + weight / (k + rank + 1)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [row for row, _ in ordered], [score for _, score in ordered]
+
+def weighted_score_fusion(rankings, weights):
+    """Fuse ``(rows, scores)`` rankings by weighted sum of min-max normalized scores.
+
+    Rows missing from a ranking contribute zero for that ranking.
+    """
+    fused = {}
+    for (rows, scores), weight in zip(rankings, weights):
+        for row, score in zip(rows, _min_max(np.asarray(scores, dtype=np.float32))):
+            fused[int(row)] = fused.get(int(row), 0.0) + weight * float(score)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [row for row, _ in ordered], [score for _, score in ordered]
 
 # --- Custom Retriever ---
 class HybridRetriever(BaseRetriever):
-    """Custom retriever that combines vector similarity with BM25 ranking"""
+    """Custom retriever that combines vector similarity with BM25 ranking.
+
+    In ``fusion`` mode dense (FAISS) and lexical (BM25) retrieval run
+    independently and their rankings are merged with reciprocal rank fusion
+    or a weighted sum of normalized scores. ``rerank`` mode keeps the older
+    behaviour of re-sorting the vector candidates by BM25 alone.
+
+    With ``partitions`` and a ``category``, both searches only see that
+    category's rows.
+
+    With a ``citations`` index, provisions and cases named in the query
+    ("Section 420 IPC") are looked up exactly. A query that is little more
+    than such a reference is answered from the lookup alone; otherwise the
+    looked-up chunks are placed ahead of the searched ones.
+
+    With ``vectors`` (a flat index by row), ``retrieve`` also returns the
+    exact vectors of the retrieved chunks, so context packing never embeds.
+    """
 
     def __init__(
         self,
         vectorstore: Any,
-        top_k: int = 4,
+        top_k: Optional[int] = None,
+        bm25_index: Any = None,
+        mode: Optional[str] = None,
+        fusion_method: Optional[str] = None,
+        dense_k: Optional[int] = None,
+        lexical_k: Optional[int] = None,
+        dense_weight: Optional[float] = None,
+        lexical_weight: Optional[float] = None,
+        rrf_k: Optional[int] = None,
+        category: Optional[str] = None,
+        partitions: Any = None,
+        citations: Any = None,
+        vectors: Any = None,
     ):
-        """Initialize the hybrid retriever"""
+        """Initialize the hybrid retriever, defaulting tunables to config settings"""
         super().__init__()
         self._vectorstore = vectorstore
-        self._top_k = top_k
+        self._top_k = top_k or settings.RETRIEVAL_TOP_K
+        self._bm25_index = bm25_index
+        self._mode = mode or settings.RETRIEVAL_MODE
+        self._fusion_method = fusion_method or settings.FUSION_METHOD
+        self._dense_k = dense_k or settings.DENSE_CANDIDATES
+        self._lexical_k = lexical_k or settings.LEXICAL_CANDIDATES
+        self._dense_weight = settings.DENSE_WEIGHT if dense_weight is None else dense_weight
+        self._lexical_weight = settings.LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+        self._rrf_k = rrf_k or settings.RRF_K
+        # (rows, selector) of the category to search, or None for the whole index
+        self._partition = partitions.lookup(category) if partitions is not None else None
+        self._citations = citations
+        self._vectors = vectors
 
     @property
     def vectorstore(self):
@@ -58,6 +278,140 @@ class HybridRetriever(BaseRetriever):
     def top_k(self):
         return self._top_k
 
+    @property
+    def bm25_index(self):
+        return self._bm25_index
+
+    def _search_vectors(self, embeddings: np.ndarray, k: int):
+        """``(rows, scores)`` for every query vector, from a single FAISS search"""
+        selector = self._partition[1] if self._partition is not None else None
+        with span("faiss_search"):
+            distances, rows = search_index(self.vectorstore.index, embeddings, k, selector)
+        results = []
+        for query_rows, query_distances in zip(rows, distances):
+            keep = query_rows >= 0
+            query_rows, query_distances = query_rows[keep], query_distances[keep]
+            if self.vectorstore.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT:
+                query_distances = -query_distances
+            results.append((query_rows, query_distances))
+        return results
+
+    def _get_document(self, row: int) -> Document:
+        doc_id = self.vectorstore.index_to_docstore_id[int(row)]
+        return self.vectorstore.docstore.search(doc_id)
+
+    def _row_vectors(self, rows: List[int]):
+        """Exact vectors of ``rows`` from the index, or None if they cannot be read"""
+        if self._vectors is None or not rows:
+            return None
+        try:
+            return self._vectors.reconstruct_batch(np.asarray(rows, dtype=np.int64))
+        except Exception as e:
+            logger.warning(f"Could not read chunk vectors from the index: {str(e)}")
+            return None
+
+    def _rerank(self, query: str, dense) -> List[int]:
+        # Get initial candidates from vector similarity
+        rows = dense[0][:self._dense_k]
+
+        # Score candidates with corpus-wide BM25 statistics
+        with span("bm25_search"):
+            bm25_scores = self.bm25_index.get_scores(query, rows=rows)
+
+        # Stable sort keeps vector order between equal BM25 scores
+        best = np.argsort(-bm25_scores, kind="stable")[:self.top_k]
+        return [int(rows[i]) for i in best]
+
+    def _fuse(self, query: str, dense) -> List[int]:
+        rows, scores = dense
+        dense = (rows[:self._dense_k], scores[:self._dense_k])
+        with span("bm25_search"):
+            lexical = self.bm25_index.top_k(
+                query, self._lexical_k, rows=self._partition[0] if self._partition is not None else None
+            )
+        # Drop lexical rows with no term overlap at all
+        lexical = (lexical[0][lexical[1] > 0], lexical[1][lexical[1] > 0])
+
+        weights = (self._dense_weight, self._lexical_weight)
+        if self._fusion_method == "weighted":
+            rows, _ = weighted_score_fusion((dense, lexical), weights)
+        else:
+            rows, _ = reciprocal_rank_fusion((dense, lexical), weights, k=self._rrf_k)
+        return rows[:self.top_k]
+
+    def _lookup_citations(self, query: str):
+        """Rows defining or citing the references in the query, and whether they can replace search"""
+        if self._citations is None:
+            return [], False
+        with span("citation_lookup"):
+            parsed = parse_citation_query(query, self._citations.acts)
+            # A provision of an act that is not indexed must not be answered from another act
+            if not parsed.keys or parsed.unknown_act:
+                return [], False
+            rows = self._citations.lookup(
+                parsed.keys,
+                act=parsed.act,
+                rows=self._partition[0] if self._partition is not None else None,
+                limit=self.top_k,
+            )
+        return rows, bool(rows) and len(parsed.other_terms) <= settings.CITATION_FAST_PATH_MAX_TERMS
+
+    def retrieve(self, query: str, citations=None, query_vector=None, dense=None) -> Retrieved:
+        """Chunks for a query, with its embedding and the chunks' vectors.
+
+        ``citations``, ``query_vector`` and ``dense`` hold the query's lookup,
+        embedding and vector search if they were already computed. A query
+        answered by the citation lookup alone is not embedded.
+        """
+        cited, exact = citations if citations is not None else self._lookup_citations(query)
+        if exact:
+            rows = cited
+        else:
+            if dense is None:
+                if query_vector is None:
+                    with span("embed_query"):
+                        query_vector = self.vectorstore._embed_query(query)
+                k = self.top_k if self.bm25_index is None else max(self._dense_k, self.top_k)
+                dense = self._search_vectors(np.asarray([query_vector], dtype=np.float32), k)[0]
+            if self.bm25_index is None:
+                rows = dense[0]
+            else:
+                rows = self._rerank(query, dense) if self._mode == "rerank" else self._fuse(query, dense)
+            rows = [int(row) for row in rows]
+            if cited:
+                rows = list(dict.fromkeys(cited[:settings.CITATION_MAX_HITS] + rows))
+            rows = rows[:self.top_k]
+        return Retrieved([self._get_document(row) for row in rows], query_vector, self._row_vectors(rows))
+
+    def retrieve_batch(self, queries: List[str], embeddings=None) -> List[Retrieved]:
+        """Retrieve for many queries with one batched embedding call and one FAISS search.
+
+        ``embeddings`` may hold the queries' vectors if they were already
+        computed. Queries answered by the citation lookup are not searched.
+        """
+        try:
+            citations = [self._lookup_citations(query) for query in queries]
+            pending = [i for i, (_, exact) in enumerate(citations) if not exact]
+            vectors, dense = {}, {}
+            if pending:
+                if embeddings is None:
+                    with span("embed_batch"):
+                        pending_vectors = embed_queries(self.vectorstore.embeddings, [queries[i] for i in pending])
+                else:
+                    pending_vectors = [embeddings[i] for i in pending]
+                vectors = dict(zip(pending, pending_vectors))
+                results = self._search_vectors(
+                    np.asarray(pending_vectors, dtype=np.float32), max(self._dense_k, self.top_k)
+                )
+                dense = dict(zip(pending, results))
+            return [
+                self.retrieve(query, citations[i], vectors.get(i), dense.get(i))
+                for i, query in enumerate(queries)
+            ]
+        except Exception as e:
+            logger.error(f"Error in batch retrieval, retrieving queries one by one: {str(e)}")
+            return [Retrieved(self._get_relevant_documents(query)) for query in queries]
+
     def _get_relevant_documents(
         self,
         query: str,
@@ -66,211 +420,315 @@ class HybridRetriever(BaseRetriever):
     ) -> List[Document]:
         """Get relevant documents using hybrid search"""
         try:
-            # Get initial candidates from vector similarity
-            texts = self.vectorstore.similarity_search(query, k=30)
-
-            # Prepare corpus for BM25
-            corpus = [doc.page_content for doc in texts]
-            tokenized_corpus = [clean_text(doc).split() for doc in corpus]
-
-            bm25 = BM25Okapi(tokenized_corpus)
-
-            # Get BM25 scores
-            tokenized_query = clean_text(query).split()
-            bm25_scores = bm25.get_scores(tokenized_query)
-
-            # Combine and sort results
-            scored_docs = list(zip(texts, bm25_scores))
-            scored_docs = sorted(scored_docs, key=lambda x: x[1], reverse=True)[:self.top_k]
-
-            return [doc for doc, _ in scored_docs]
+            return self.retrieve(query).docs
         except Exception as e:
-            print(f"Error in hybrid retrieval: {str(e)}")
+            logger.error(f"Error in hybrid retrieval: {str(e)}")
             return self.vectorstore.similarity_search(query, k=self.top_k)
 
     async def _aget_relevant_documents(
         self,
         query: str,
         *,
-        run_manager: Optional[CallbackManagerForRetrieverRun] = None,
+        run_manager: Optional[AsyncCallbackManagerForRetrieverRun] = None,
     ) -> List[Document]:
-        """Async implementation of document retrieval"""
-        return self._get_relevant_documents(query, run_manager=run_manager)
-
-# --- Main RAG Chain Generator ---
-def get_rag_chain(vectorstore, llm):
-    """Create enhanced RAG chain with hybrid retriever"""
-
-    template = """You are a legal expert assistant. Use the following pieces of context to answer the question at the end.
-If you don't know the answer, just say that you don't have enough information - don't try to make up an answer.
-
-Context: {context}
-
-Question: {question}
-
-Please provide a detailed, well-structured answer with the following format:
-
-Legal Analysis:
-- Provide a comprehensive legal analysis combining information from legal documents and web sources
-- Include relevant case laws, statutes, and legal principles
-- Highlight key legal implications and interpretations
-
-Additional Context:
-- Provide detailed background information
-- Include relevant precedents and case studies
-- Explain legal concepts and their practical applications
-
-Punishments and Fines:
-- List applicable penalties, fines, or punishments if relevant
-- Include maximum and minimum punishments where applicable
-- Note any special circumstances that affect penalties
-
-Sources:
-- List all relevant legal sources with clickable links
-- Include case citations, statute references, and web sources
-- Format links as [Source Name](URL)
-
-Answer:"""
-
-    prompt = PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
-    )
-
-    retriever = HybridRetriever(vectorstore=vectorstore, top_k=4)
-
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=True,
-        chain_type_kwargs={
-            "prompt": prompt,
-            "verbose": True
-        }
-    )
-
-    return qa_chain
-
-# --- SerpAPI Fallback Tool ---
-def get_fallback_tool():
-    """Create web search tool"""
-
-    search = SerpAPIWrapper(serpapi_api_key=settings.SERPAPI_API_KEY)
-    return Tool.from_function(
-        func=search.run,
-        name="Web Search",
-        description="Search the web for legal information and recent updates"
-    )
+        """Async document retrieval, run on the shared blocking pool"""
+        return await run_blocking(self._get_relevant_documents, query)
 
+# --- Web Search ---
 async def get_web_search_results(query: str) -> str:
     """Get results from SerpAPI"""
     try:
-        search = SerpAPIWrapper(serpapi_api_key=settings.SERPAPI_API_KEY)
-        return await asyncio.to_thread(search.run, query)
+        return await get_web_search_client().search(query)
     except Exception as e:
-        print(f"Web search error: {str(e)}")
+        logger.warning(f"Web search error: {str(e)}")
+        record_failure("web_search")
         return "Web search unavailable."
 
-def merge_responses(llm, rag_answer: str, web_answer: str) -> str:
-    """Merge RAG and web search responses using OpenAI"""
+# --- Chat History Management ---
+def add_to_chat_history(user_query: str, response: str, session_id: str = "default"):
+    """Add the interaction to chat history without waiting for the write"""
+    store = get_history_store()
     try:
-        prompt = f"""As a legal expert, analyze and merge these two responses into a comprehensive answer:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
 
-LEGAL DOCUMENTS RESPONSE:
-{rag_answer}
-
-WEB SEARCH RESPONSE:
-{web_answer}
+    if loop is None:
+        _append_history(store, session_id, user_query, response)
+        return
 
-Provide a well-structured answer that:
-1. Combines key insights from both sources
-2. Highlights important legal principles
-3. Notes any discrepancies or updates
-4. Cites specific laws when available
+    future = loop.run_in_executor(get_executor(), _append_history, store, session_id, user_query, response)
+    future.add_done_callback(_log_history_error)
 
-MERGED ANSWER:"""
+def _append_history(store, session_id: str, user_query: str, response: str):
+    with span("history_write"):
+        store.append(session_id, user_query, response)
 
-        response = llm.predict(prompt)
-        return response if response else "Unable to merge responses."
-    except Exception as e:
-        print(f"Error merging responses: {str(e)}")
-        return f"Legal Documents Answer: {rag_answer}\n\nWeb Search Results: {web_answer}"
+def _log_history_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Failed to write chat history: {str(future.exception())}")
 
-# --- PDF Generation ---
-def generate_pdf(content: str, filename: str) -> str:
-    """Generate a PDF from the given content and save it"""
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_font("Arial", size=12)
-
-    for line in content.split('\n'):
-        pdf.multi_cell(0, 10, line)
-
-    pdf_path = os.path.join("pdfs", filename)
-    os.makedirs("pdfs", exist_ok=True)
-    pdf.output(pdf_path)
-    return pdf_path
-
-# --- Chat History Management ---
-chat_history = []
-
-def add_to_chat_history(user_query: str, response: str):
-    """Add the interaction to chat history"""
-    chat_history.append({
-        "query": user_query,
-        "response": response
-    })
-
-def get_chat_history() -> List[Dict[str, str]]:
-    """Retrieve the chat history"""
-    return chat_history
+def get_chat_history(session_id: str = "default", cursor: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+    """Retrieve one page of a session's chat history, newest first"""
+    items, next_cursor = get_history_store().page(session_id, cursor=cursor, limit=limit)
+    return {"items": items, "next_cursor": next_cursor}
 
 # --- Process Query ---
-async def process_query(query: str, category: str, use_web: bool = True) -> dict:
+# Pipeline steps that failed or fell back while answering the current query; a
+# degraded answer is returned but not cached. Tasks the query starts share the list.
+_failures: ContextVar[Optional[list]] = ContextVar("pipeline_failures", default=None)
+
+@contextmanager
+def track_failures():
+    """Collect the failures of the enclosed pipeline run; yields the list they are appended to"""
+    failures = []
+    token = _failures.set(failures)
     try:
-        print(f"Processing query: {query}, category: {category}")
-
-        # Get RAG results
-        rag_response = await get_rag_response(query, category)
-        print(f"RAG response: {rag_response}")
+        yield failures
+    finally:
+        _failures.reset(token)
 
-        # Get web results if enabled
-        web_response = None
-        if use_web:
-            web_response = await get_web_response(query)
-            print(f"Web response: {web_response}")
+def record_failure(step: str):
+    failures = _failures.get()
+    if failures is not None:
+        failures.append(step)
 
-        # Combine results
-        combined_response = await combine_responses(rag_response, web_response, query)
-
-        # Extract sources
-        sources = extract_sources(rag_response, web_response)
+async def run_branch(name: str, coro, timeout: float, fallback):
+    """Await a pipeline branch, returning ``fallback`` if it exceeds ``timeout`` seconds"""
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"{name} branch timed out after {timeout}s, continuing without it")
+        record_failure(f"{name.lower()}_timeout")
+        return fallback
+
+async def run_multi_pass(query: str, category: str, use_web: bool, retrieved: Optional[Retrieved] = None):
+    """RAG answer, web summary and merge as three LLM calls; returns (answer text, sources)"""
+    # Run the RAG and web branches concurrently, each under its own timeout
+    branches = [
+        run_branch(
+            "RAG",
+            get_rag_response(query, category, retrieved),
+            settings.RAG_TIMEOUT_SECONDS,
+            "No relevant information found in the legal documents.",
+        )
+    ]
+    if use_web:
+        # A slow web branch is dropped and the answer is merged without it
+        branches.append(run_branch("Web", get_web_response(query), settings.WEB_TIMEOUT_SECONDS, None))
+
+    results = await asyncio.gather(*branches)
+    rag_response = results[0]
+    web_response = results[1] if use_web else None
+    logger.debug("RAG response: %s", rag_response)
+    logger.debug("Web response: %s", web_response)
+
+    # Combine results
+    combined_response = await combine_responses(rag_response, web_response, query)
+
+    # Extract sources
+    sources = extract_sources(rag_response, web_response)
+    return combined_response, sources
+
+async def run_single_pass(query: str, category: str, use_web: bool, retrieved: Optional[Retrieved] = None):
+    """One structured LLM call over retrieved chunks and raw web results; returns (answer, text, sources)"""
+    answer, web_results = await get_structured_response(query, category, use_web, retrieved)
+    combined_response = format_structured_answer(answer)
+    sources = extract_sources(combined_response, web_results)
+    return answer, combined_response, sources
+
+# --- Answer Cache ---
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    embed=lambda text: get_embedding_model().embed_query(text),
+) if settings.ANSWER_CACHE_ENABLED else None
+
+# Identical concurrent queries share one pipeline run
+query_flight = get_singleflight("query")
+
+def query_key(query: str, category: str, use_web: bool, mode: str) -> str:
+    return f"{normalize_query(query)}|{category.strip().lower()}|{bool(use_web)}|{mode}"
+
+async def get_cached_answer(query: str, category: str, use_web: bool, mode: str, vector=None) -> Optional[dict]:
+    """Return the cached ``{"response", "result"}`` for the query, if any"""
+    if answer_cache is None:
+        return None
+    try:
+        return await run_blocking(answer_cache.get, query, category, use_web, mode, vector)
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {str(e)}")
+        return None
+
+async def cache_answer(
+    query: str, category: str, use_web: bool, mode: str, combined_response: str, result: dict, vector=None
+):
+    """Store a finished result in the answer cache"""
+    if answer_cache is None:
+        return
+    try:
+        await run_blocking(
+            answer_cache.put, query, category, use_web, mode, {"response": combined_response, "result": result}, vector
+        )
+    except Exception as e:
+        logger.warning(f"Answer cache store failed: {str(e)}")
+
+def finalize_response(combined_response: str, sections: dict, sources: list) -> dict:
+    """Register the answer PDF and build the result dict"""
+    # Name the PDF by content; it is rendered on first download
+    with span("pdf_register"):
+        pdf_path = register_pdf(combined_response)
+
+    return {
+        **sections,
+        "sources": sources,
+        "pdf_path": pdf_path,
+    }
+
+async def answer_query(query: str, category: str, use_web: bool, mode: str):
+    """Run the pipeline (or serve it from the answer cache); returns (answer text, result)"""
+    cached = await get_cached_answer(query, category, use_web, mode)
+    if cached is not None:
+        logger.debug("Answer cache hit")
+        return cached["response"], cached["result"]
+    return await run_pipeline(query, category, use_web, mode)
+
+async def run_pipeline(
+    query: str, category: str, use_web: bool, mode: str, retrieved: Optional[Retrieved] = None, vector=None
+):
+    """Answer a query that missed the answer cache and cache the result; returns (answer text, result).
+
+    ``retrieved`` and ``vector`` (the normalized query's embedding, for the
+    cache) may be passed in when they were computed for a whole batch.
+    """
+    # Shed the query before retrieval and web search if its LLM calls could not run
+    llm_scheduler.admit(estimate_llm_tokens(query))
+    with track_failures() as failures:
+        if mode == "single_pass":
+            answer, combined_response, sources = await run_single_pass(query, category, use_web, retrieved)
+            sections = {field: getattr(answer, field) for field in SECTION_TITLES}
+        else:
+            combined_response, sources = await run_multi_pass(query, category, use_web, retrieved)
+            sections = {field: extract_section(combined_response, title) for field, title in SECTION_TITLES.items()}
+
+    result = finalize_response(combined_response, sections, sources)
+    if failures:
+        # Serve the degraded answer, but let the next request try again
+        logger.warning(f"Not caching an answer degraded by: {', '.join(failures)}")
+    else:
+        await cache_answer(query, category, use_web, mode, combined_response, result, vector)
+    return combined_response, result
+
+async def process_query(
+    query: str,
+    category: str,
+    use_web: bool = True,
+    mode: Optional[str] = None,
+    session_id: str = "default",
+    priority: int = PRIORITY_DEFAULT,
+) -> dict:
+    try:
+        mode = mode or settings.PIPELINE_MODE
+        logger.debug("Processing query: %s, category: %s, mode: %s", query, category, mode)
 
-        # Generate PDF
-        pdf_filename = f"{uuid.uuid4()}.pdf"
-        pdf_path = generate_pdf(combined_response, pdf_filename)
+        with request_priority(priority):
+            combined_response, result = await query_flight.do(
+                query_key(query, category, use_web, mode), answer_query, query, category, use_web, mode
+            )
 
         # Update chat history
-        add_to_chat_history(query, combined_response)
-
-        result = {
-            "legal_analysis": extract_section(combined_response, "Legal Analysis"),
-            "additional_context": extract_section(combined_response, "Additional Context"),
-            "punishments_and_fines": extract_section(combined_response, "Punishments and Fines"),
-            "sources": sources,
-            "pdf_path": pdf_path,
-            "chat_history": get_chat_history()
-        }
+        add_to_chat_history(query, combined_response, session_id)
 
-        print(f"Final result: {result}")
-        return result
+        logger.debug("Final result: %s", result)
+        return dict(result)
 
+    except SchedulerRejected:
+        raise
     except Exception as e:
-        print(f"Error in process_query: {str(e)}")
+        logger.error(f"Error in process_query: {str(e)}")
         raise e
 
+# --- Batch Queries ---
+async def process_batch(items: List[Tuple[str, str]], use_web: bool = True, mode: Optional[str] = None):
+    """Answer many ``(query, category)`` pairs, yielding ``(index, result, error)`` as each finishes.
+
+    Identical questions are answered once. All queries are embedded in one
+    model call, which also yields the vectors the answer cache matches on;
+    cache misses are then retrieved together. Their LLM stages run at most
+    BATCH_MAX_PARALLEL at a time and at batch priority, so interactive
+    queries go first; a query shed by the LLM scheduler is retried after the
+    delay it was given. Batch answers are not added to the chat history.
+    """
+    mode = mode or settings.PIPELINE_MODE
+    groups: Dict[str, List[int]] = {}
+    for index, (query, category) in enumerate(items):
+        groups.setdefault(query_key(query, category, use_web, mode), []).append(index)
+    keys = list(groups)
+    unique = [items[groups[key][0]] for key in keys]
+    queries = [query for query, _ in unique]
+
+    current = await ensure_retrieval_resources()
+    texts = list(queries)
+    if answer_cache is not None and answer_cache.embed is not None:
+        texts += [normalize_query(query) for query in queries]
+    with span("embed_batch"):
+        vectors = await run_blocking(embed_queries, current.vectorstore.embeddings, texts)
+    cache_vectors = vectors[len(queries):] or [None] * len(queries)
+
+    misses = []
+    for position, (query, category) in enumerate(unique):
+        cached = await get_cached_answer(query, category, use_web, mode, cache_vectors[position])
+        if cached is None:
+            misses.append(position)
+            continue
+        for index in groups[keys[position]]:
+            yield index, dict(cached["result"]), None
+    if not misses:
+        return
+
+    retrieved_misses = await retrieve_documents_batch(
+        [queries[position] for position in misses],
+        [unique[position][1] for position in misses],
+        [vectors[position] for position in misses],
+    )
+
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_PARALLEL)
+
+    async def answer(position: int, retrieved: Retrieved):
+        query, category = unique[position]
+        try:
+            async with semaphore:
+                with request_priority(PRIORITY_BATCH):
+                    for attempt in range(1, settings.BATCH_MAX_ATTEMPTS + 1):
+                        try:
+                            _, result = await query_flight.do(
+                                keys[position], run_pipeline,
+                                query, category, use_web, mode, retrieved, cache_vectors[position]
+                            )
+                            return position, result, None
+                        except SchedulerRejected as e:
+                            if attempt == settings.BATCH_MAX_ATTEMPTS:
+                                raise
+                            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            logger.error(f"Batch query failed: {str(e)}")
+            return position, None, str(e)
+
+    tasks = [
+        asyncio.create_task(answer(position, query_retrieved))
+        for position, query_retrieved in zip(misses, retrieved_misses)
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            position, result, error = await finished
+            for index in groups[keys[position]]:
+                yield index, dict(result) if result is not None else None, error
+    finally:
+        # The consumer went away: stop the queries that have not finished
+        for task in tasks:
+            task.cancel()
+
 # --- Helper Functions ---
 def extract_section(text: str, section_title: str) -> str:
     """Extract a specific section from the text based on the section title"""
@@ -278,8 +736,70 @@ def extract_section(text: str, section_title: str) -> str:
     match = re.search(pattern, text, re.DOTALL)
     return match.group(1).strip() if match else ""
 
-async def get_rag_response(query: str, category: str) -> str:
-    """Get response from RAG system"""
+def context_retriever(current: RetrievalResources, category: str) -> HybridRetriever:
+    """Retriever for the candidate chunks of a query's context, searching only the query's category"""
+    return HybridRetriever(
+        vectorstore=current.vectorstore,
+        top_k=max(settings.CONTEXT_CANDIDATES, settings.RETRIEVAL_TOP_K),
+        bm25_index=current.bm25_index,
+        category=category,
+        partitions=current.partitions,
+        citations=current.citations,
+        vectors=current.vectors,
+    )
+
+async def retrieve_documents(query: str, category: str) -> Retrieved:
+    """Retrieve the candidate chunks for a query's context, searching only the query's category"""
+    current = await ensure_retrieval_resources()
+    retriever = context_retriever(current, category)
+    with span("retrieval"):
+        try:
+            return await run_blocking(retriever.retrieve, query)
+        except Exception as e:
+            logger.error(f"Error in hybrid retrieval: {str(e)}")
+            record_failure("retrieval")
+            return Retrieved(await run_blocking(retriever.vectorstore.similarity_search, query, k=retriever.top_k))
+
+async def retrieve_documents_batch(
+    queries: List[str], categories: List[str], embeddings=None
+) -> List[Retrieved]:
+    """Retrieve the candidate chunks of many queries: one embedding call, one FAISS search per category"""
+    current = await ensure_retrieval_resources()
+    if embeddings is None:
+        with span("embed_batch"):
+            embeddings = await run_blocking(embed_queries, current.vectorstore.embeddings, queries)
+
+    by_category: Dict[str, List[int]] = {}
+    for index, category in enumerate(categories):
+        by_category.setdefault(category, []).append(index)
+
+    retrieved: List[Retrieved] = [Retrieved([]) for _ in queries]
+    with span("retrieval"):
+        for category, indexes in by_category.items():
+            results = await run_blocking(
+                context_retriever(current, category).retrieve_batch,
+                [queries[index] for index in indexes],
+                [embeddings[index] for index in indexes],
+            )
+            for index, result in zip(indexes, results):
+                retrieved[index] = result
+    return retrieved
+
+async def build_context(retrieved: Retrieved) -> PackedContext:
+    """Order retrieved chunks by MMR and pack them into the prompt token budget"""
+    with span("context_pack"):
+        context = await run_blocking(
+            pack_context, retrieved.docs, None, retrieved.query_vector, retrieved.doc_vectors
+        )
+    logger.debug("Packed %d/%d chunks into %d tokens", len(context.documents), len(retrieved.docs), context.tokens)
+    return context
+
+def build_web_query(query: str) -> str:
+    """Add legal context and trusted sites to a web search query"""
+    return f"legal information about {query} in Indian law site:indiankanoon.org OR site:legislative.gov.in OR site:indiancourts.nic.in"
+
+async def get_rag_response(query: str, category: str, retrieved: Optional[Retrieved] = None) -> str:
+    """Get response from RAG system; ``retrieved`` skips retrieval with chunks retrieved beforehand"""
     try:
         # Create a prompt template for legal queries
         prompt_template = """You are a legal expert assistant. Answer the following legal question based on the provided context:
@@ -297,26 +817,31 @@ Please provide a detailed response that includes:
 Answer:"""
 
         # Get relevant documents
-        retriever = HybridRetriever(vectorstore=vectorstore, top_k=4)
-        docs = await retriever._aget_relevant_documents(query)
+        retrieved = retrieved or await retrieve_documents(query, category)
         
-        # Combine context from documents
-        context = "\n\n".join([doc.page_content for doc in docs])
+        # Pack de-duplicated, diverse chunks into the token budget
+        context = await build_context(retrieved)
         
         # Generate response using LLM
-        prompt = prompt_template.format(context=context, question=query)
-        response = llm.predict(prompt)
+        prompt = prompt_template.format(context=context.text, question=query)
+        response = await apredict(prompt, "rag")
         
-        return response if response else "No relevant information found in the legal documents."
+        if not response:
+            record_failure("rag")
+            return "No relevant information found in the legal documents."
+        return response
+    except SchedulerRejected:
+        raise
     except Exception as e:
-        print(f"Error in RAG response: {str(e)}")
+        logger.error(f"Error in RAG response: {str(e)}")
+        record_failure("rag")
         return "Error retrieving legal information."
 
 async def get_web_response(query: str) -> str:
     """Get response from web search"""
     try:
         # Add legal context to the search query
-        enhanced_query = f"legal information about {query} in Indian law site:indiankanoon.org OR site:legislative.gov.in OR site:indiancourts.nic.in"
+        enhanced_query = build_web_query(query)
         web_results = await get_web_search_results(enhanced_query)
         
         if not web_results or web_results == "Web search unavailable.":
@@ -325,7 +850,7 @@ async def get_web_response(query: str) -> str:
         # Process web results to extract structured information
         prompt = f"""Process the following web search results about legal information and structure them:
 
-{web_results}
+{truncate_to_tokens(web_results, settings.WEB_CONTEXT_TOKEN_BUDGET)}
 
 Please extract and organize the following information:
 1. Relevant legal provisions and sections
@@ -335,15 +860,22 @@ Please extract and organize the following information:
 
 Format the response with clear sections and include clickable links where available."""
 
-        processed_results = llm.predict(prompt)
-        return processed_results if processed_results else web_results
+        processed_results = await apredict(prompt, "web")
+        if not processed_results:
+            record_failure("web")
+            return web_results
+        return processed_results
+    except SchedulerRejected:
+        raise
     except Exception as e:
-        print(f"Error in web response: {str(e)}")
+        logger.error(f"Error in web response: {str(e)}")
+        record_failure("web")
         return "Error retrieving web information."
 
 def extract_sources(rag_response: str, web_response: str) -> list:
     """Extract and format sources from both RAG and web responses"""
     sources = []
+    web_response = web_response or ""
     
     try:
         # Extract sources from RAG response
@@ -386,19 +918,20 @@ def extract_sources(rag_response: str, web_response: str) -> list:
         
         return unique_sources
     except Exception as e:
-        print(f"Error extracting sources: {str(e)}")
+        logger.error(f"Error extracting sources: {str(e)}")
         return [{"name": "Error extracting sources", "url": "#"}]
 
 async def combine_responses(rag_response: str, web_response: str, original_query: str) -> str:
     """Combine RAG and web responses into a comprehensive answer"""
     try:
+        web_response = web_response or "No additional web information available."
         prompt = f"""As a legal expert, analyze and merge these two responses into a comprehensive answer:
 
 LEGAL DOCUMENTS RESPONSE:
-{rag_response}
+{truncate_to_tokens(rag_response, settings.MERGE_INPUT_TOKEN_BUDGET)}
 
 WEB SEARCH RESPONSE:
-{web_response}
+{truncate_to_tokens(web_response, settings.MERGE_INPUT_TOKEN_BUDGET)}
 
 Original Question: {original_query}
 
@@ -421,8 +954,263 @@ Include specific case citations and statute references where applicable.
 
 Answer:"""
 
-        response = llm.predict(prompt)
-        return response if response else "Unable to generate a comprehensive response."
+        response = await apredict(prompt, "merge")
+        if not response:
+            record_failure("merge")
+            return "Unable to generate a comprehensive response."
+        return response
+    except SchedulerRejected:
+        raise
     except Exception as e:
-        print(f"Error combining responses: {str(e)}")
+        logger.error(f"Error combining responses: {str(e)}")
+        record_failure("merge")
         return f"Legal Documents Answer: {rag_response}\n\nWeb Search Results: {web_response}"
+
+# --- Single-Pass Structured Generation ---
+SECTION_TITLES = {
+    "legal_analysis": "Legal Analysis",
+    "additional_context": "Additional Context",
+    "punishments_and_fines": "Punishments and Fines",
+}
+
+class AnswerSource(BaseModel):
+    name: str = Field(description="Name of the statute, case or web page")
+    url: str = Field(description="Link to the source, or '#' if none is known")
+
+class LegalAnswer(BaseModel):
+    """Structured answer to a legal question"""
+    legal_analysis: str = Field(description="Legal analysis with relevant statutes, sections, case laws and principles")
+    additional_context: str = Field(description="Background, precedents and practical application of the legal concepts")
+    punishments_and_fines: str = Field(description="Applicable penalties, fines or punishments, or a note that none apply")
+    sources: List[AnswerSource] = Field(default_factory=list, description="Legal and web sources used in the answer")
+
+STRUCTURED_PROMPT = """You are a legal expert assistant. Answer the question using the legal document excerpts and web search results below.
+If they do not contain enough information, say so instead of making up an answer.
+
+Legal document excerpts:
+{context}
+
+Web search results:
+{web_results}
+
+Question: {question}
+
+Fill in every field of the answer. Include specific sections, articles and case citations where applicable,
+and list every source you relied on with its link."""
+
+async def get_web_context(query: str) -> Optional[str]:
+    """Raw web results for ``query``, cut to WEB_CONTEXT_TOKEN_BUDGET, or None"""
+    web_results = await run_branch(
+        "Web", get_web_search_results(build_web_query(query)), settings.WEB_TIMEOUT_SECONDS, None
+    )
+    if web_results == "Web search unavailable.":
+        return None
+    return truncate_to_tokens(web_results, settings.WEB_CONTEXT_TOKEN_BUDGET)
+
+async def gather_context(query: str, category: str, use_web: bool = True, retrieved: Optional[Retrieved] = None):
+    """Retrieve chunks (unless ``retrieved`` already holds them) and raw web results concurrently.
+
+    Returns the packed document context and the web results (cut to
+    WEB_CONTEXT_TOKEN_BUDGET) or None.
+    """
+    branches = []
+    if retrieved is None:
+        branches.append(
+            run_branch("Retrieval", retrieve_documents(query, category), settings.RAG_TIMEOUT_SECONDS, Retrieved([]))
+        )
+    if use_web:
+        branches.append(get_web_context(query))
+
+    results = await asyncio.gather(*branches)
+    retrieved = retrieved or results.pop(0)
+    web_results = results[0] if use_web else None
+    context = await build_context(retrieved)
+    return context, web_results
+
+async def get_structured_response(
+    query: str, category: str, use_web: bool = True, retrieved: Optional[Retrieved] = None
+):
+    """Answer in a single LLM call returning a LegalAnswer; also returns the web results it saw"""
+    context, web_results = await gather_context(query, category, use_web, retrieved)
+
+    prompt = STRUCTURED_PROMPT.format(
+        context=context.text or "No relevant excerpts found.",
+        web_results=web_results or "No web results available.",
+        question=query,
+    )
+    try:
+        answer = await llm_flight.do(prompt_key(prompt, "structured"), _astructured, prompt)
+        if answer is None:
+            raise ValueError("no parseable answer in the model's response")
+    except SchedulerRejected:
+        raise
+    except Exception as e:
+        logger.warning(f"Structured answer failed, falling back to a plain-text answer: {str(e)}")
+        record_failure("structured")
+        answer = await get_plain_answer(query, context, web_results)
+    return answer, web_results
+
+async def get_plain_answer(query: str, context: PackedContext, web_results: Optional[str]) -> LegalAnswer:
+    """Ask for the answer as sectioned text (the streaming prompt) and parse it into a LegalAnswer"""
+    prompt = STREAM_PROMPT.format(
+        context=context.text or "No relevant excerpts found.",
+        web_results=web_results or "No web results available.",
+        question=query,
+    )
+    text = await apredict(prompt, "structured_fallback")
+    return LegalAnswer(
+        **{field: extract_section(text, title) for field, title in SECTION_TITLES.items()},
+        sources=[
+            AnswerSource(name=name, url=url)
+            for name, url in re.findall(r'\[([^\]]+)\]\(([^\)]+)\)', extract_section(text, "Sources"))
+        ],
+    )
+
+async def _astructured(prompt: str) -> LegalAnswer:
+    structured_llm = get_llm().with_structured_output(LegalAnswer, method="function_calling")
+    answer = await llm_scheduler.run(_ainvoke, structured_llm, prompt, "structured", cost=estimate_llm_tokens(prompt))
+    record_llm_usage("structured", prompt, completion=answer.model_dump_json())
+    return answer
+
+def format_structured_answer(answer: LegalAnswer) -> str:
+    """Render a LegalAnswer as sectioned text for the PDF and chat history"""
+    parts = [f"{title}:\n{getattr(answer, field).strip()}" for field, title in SECTION_TITLES.items()]
+    if answer.sources:
+        parts.append("Sources:\n" + "\n".join(f"- [{source.name}]({source.url})" for source in answer.sources))
+    return "\n\n".join(parts)
+
+# --- Streaming ---
+STREAM_PROMPT = """You are a legal expert assistant. Answer the question using the legal document excerpts and web search results below.
+If they do not contain enough information, say so instead of making up an answer.
+
+Legal document excerpts:
+{context}
+
+Web search results:
+{web_results}
+
+Question: {question}
+
+Write the answer under exactly these headings, each on its own line followed by its content:
+
+Legal Analysis:
+Additional Context:
+Punishments and Fines:
+Sources:
+
+For each source, use the format [Source Name](URL) to create clickable links."""
+
+_SECTION_HEADER = re.compile(r"^(Legal Analysis|Additional Context|Punishments and Fines|Sources):", re.MULTILINE)
+_SECTION_FIELDS = {**{title: field for field, title in SECTION_TITLES.items()}, "Sources": "sources"}
+
+def current_section(text: str) -> str:
+    """Field name of the section the streamed text is currently in"""
+    headers = _SECTION_HEADER.findall(text)
+    return _SECTION_FIELDS[headers[-1]] if headers else "legal_analysis"
+
+def document_sources(docs: List[Document]) -> list:
+    """Sources for retrieved chunks, named by PDF file and page"""
+    sources, seen = [], set()
+    for doc in docs:
+        # PureWindowsPath splits on both separators; the bundled index was built on Windows
+        name = PureWindowsPath(str(doc.metadata.get("source", "Legal document"))).name
+        if "page" in doc.metadata:
+            name = f"{name}, page {int(doc.metadata['page']) + 1}"
+        if name not in seen:
+            seen.add(name)
+            sources.append({"name": name, "url": "#"})
+    return sources
+
+async def stream_query(query: str, category: str, use_web: bool = True, session_id: str = "default"):
+    """Stream an answer as ``(event, data)`` pairs.
+
+    Emits ``sources`` with the documents once retrieval finishes, then
+    ``web_sources`` once the web search (if any) returns, ``section``
+    whenever the answer moves to a new section and ``token`` for every
+    generated token, and finally ``done`` with the same fields
+    ``process_query`` returns. The answer is generated in one streamed LLM
+    call.
+    """
+    cached = await get_cached_answer(query, category, use_web, "stream")
+    if cached is not None:
+        add_to_chat_history(query, cached["response"], session_id)
+        yield "sources", cached["result"]["sources"]
+        yield "done", dict(cached["result"])
+        return
+
+    llm_scheduler.admit(estimate_llm_tokens(query))
+    # Both branches run as tasks so they report to the tracked failures; the document
+    # sources go out as soon as retrieval is done, without waiting for the web search
+    with track_failures() as failures:
+        retrieval = asyncio.create_task(run_branch(
+            "Retrieval", retrieve_documents(query, category), settings.RAG_TIMEOUT_SECONDS, Retrieved([])
+        ))
+        web = asyncio.create_task(get_web_context(query)) if use_web else None
+    try:
+        context = await build_context(await retrieval)
+        docs = context.documents
+        yield "sources", document_sources(docs)
+        web_results = await web if web is not None else None
+    finally:
+        # The client may disconnect before the web search returns
+        for task in (retrieval, web):
+            if task is not None and not task.done():
+                task.cancel()
+    if use_web:
+        yield "web_sources", extract_sources("", web_results)
+
+    prompt = STREAM_PROMPT.format(
+        context=context.text or "No relevant excerpts found.",
+        web_results=web_results or "No web results available.",
+        question=query,
+    )
+
+    combined_response = ""
+    section = "legal_analysis"
+    yield "section", {"name": section}
+    # A stream cannot be retried once tokens are out, so it only takes a slot; it jumps
+    # ahead of queued non-streaming calls as a user is waiting for the first token.
+    # A task reads the provider stream into a queue while holding the slot, so the slot
+    # is released when generation ends, however slowly the client reads the tokens.
+    tokens = asyncio.Queue()
+
+    async def generate():
+        try:
+            async with llm_scheduler.slot(estimate_llm_tokens(prompt), priority=PRIORITY_INTERACTIVE):
+                with span("llm_stream"):
+                    start, first = time.perf_counter(), True
+                    async for chunk in get_llm().astream(prompt):
+                        if not chunk.content:
+                            continue
+                        if first:
+                            record_stage("llm_stream_first_token", time.perf_counter() - start)
+                            first = False
+                        tokens.put_nowait(chunk.content)
+        finally:
+            tokens.put_nowait(None)  # End of stream, also after an error
+
+    producer = asyncio.create_task(generate())
+    try:
+        while (token := await tokens.get()) is not None:
+            combined_response += token
+            new_section = current_section(combined_response)
+            if new_section != section:
+                section = new_section
+                yield "section", {"name": section}
+            yield "token", {"section": section, "text": token}
+        await producer  # Raises the provider's or the scheduler's error
+    finally:
+        # The client may disconnect mid-stream
+        if not producer.done():
+            producer.cancel()
+    record_llm_usage("stream", prompt, completion=combined_response)
+
+    sections = {field: extract_section(combined_response, title) for field, title in SECTION_TITLES.items()}
+    sources = document_sources(docs) + extract_sources(combined_response, web_results)
+    result = finalize_response(combined_response, sections, sources)
+    add_to_chat_history(query, combined_response, session_id)
+    if failures or not combined_response:
+        logger.warning(f"Not caching a streamed answer degraded by: {', '.join(failures) or 'empty response'}")
+    else:
+        await cache_answer(query, category, use_web, "stream", combined_response, result)
+    yield "done", dict(result)
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+import httpx
+from config import settings
+from utils.metrics import span
+from utils.scheduler import CallScheduler, get_scheduler
+from utils.singleflight import get_singleflight
+
+# --- Result Formatting ---
+def format_results(res: dict) -> str:
+    """Turn a SerpAPI Google response into text, keeping result links as [title](url)"""
+    if "error" in res:
+        raise ValueError(f"Got error from SerpAPI: {res['error']}")
+
+    parts = []
+    answer_box = res.get("answer_box")
+    if isinstance(answer_box, list):
+        answer_box = answer_box[0] if answer_box else None
+    if answer_box:
+        for field in ("answer", "snippet"):
+            if answer_box.get(field):
+                parts.append(str(answer_box[field]))
+                break
+
+    knowledge_graph = res.get("knowledge_graph") or {}
+    if knowledge_graph.get("description"):
+        title = knowledge_graph.get("title")
+        parts.append(f"{title}: {knowledge_graph['description']}" if title else knowledge_graph["description"])
+
+    for result in res.get("organic_results", []):
+        title, link, snippet = result.get("title"), result.get("link"), result.get("snippet", "")
+        if title and link:
+            parts.append(f"[{title}]({link}): {snippet}".rstrip(": "))
+        elif snippet:
+            parts.append(snippet)
+
+    return "\n".join(parts) if parts else "No good search result found"
+
+# --- Client ---
+class WebSearchClient:
+    """Async SerpAPI client over a single pooled HTTP connection pool.
+
+    Results are kept in a TTL cache keyed by the query string, and concurrent
+    searches for the same query share a single upstream request. With a
+    ``scheduler``, upstream requests are subject to its concurrency and rate
+    limits and transient errors are retried. ``base_url`` can point at a local
+    stub server for testing.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        base_url: str = "https://serpapi.com",
+        timeout: float = 8.0,
+        cache_ttl: float = 3600,
+        cache_size: int = 1024,
+        max_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        scheduler: Optional[CallScheduler] = None,
+    ):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._cache = OrderedDict()  # query -> (expires_at, text)
+        self._flight = get_singleflight("web_search")
+        self._scheduler = scheduler
+        self._stats = {"requests": 0, "cache_hits": 0, "errors": 0}
+
+    def _cached(self, query: str) -> Optional[str]:
+        entry = self._cache.get(query)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._cache[query]
+            return None
+        self._cache.move_to_end(query)
+        return entry[1]
+
+    async def _fetch(self, query: str) -> str:
+        if not self.api_key:
+            raise RuntimeError("SERPAPI_API_KEY is not set")
+        self._stats["requests"] += 1
+        params = {
+            "engine": "google",
+            "google_domain": "google.com",
+            "gl": "us",
+            "hl": "en",
+            "q": query,
+            "api_key": self.api_key,
+        }
+        try:
+            if self._scheduler is not None:
+                response = await self._scheduler.run(self._get, params)
+            else:
+                response = await self._get(params)
+            text = format_results(response.json())
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+
+        self._cache[query] = (time.monotonic() + self.cache_ttl, text)
+        self._cache.move_to_end(query)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text
+
+    async def _get(self, params: dict) -> httpx.Response:
+        with span("serpapi"):
+            response = await self._client.get("/search.json", params=params)
+        response.raise_for_status()
+        return response
+
+    async def search(self, query: str, timeout: Optional[float] = None) -> str:
+        """Search, serving from cache or joining an identical in-flight search when possible"""
+        cached = self._cached(query)
+        if cached is not None:
+            self._stats["cache_hits"] += 1
+            return cached
+
+        # A caller's timeout only abandons its own wait, not the shared search
+        return await asyncio.wait_for(self._flight.do(query, self._fetch, query), timeout or self.timeout)
+
+    def stats(self) -> dict:
+        return {**self._stats, "cache_size": len(self._cache), **self._flight.stats()}
+
+    async def aclose(self):
+        await self._client.aclose()
+
+_client: Optional[WebSearchClient] = None
+
+def get_web_search_client() -> WebSearchClient:
+    """Return the shared web search client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = WebSearchClient(
+            api_key=settings.SERPAPI_API_KEY,
+            base_url=settings.SERPAPI_BASE_URL,
+            timeout=settings.WEB_SEARCH_TIMEOUT_SECONDS,
+            cache_ttl=settings.WEB_SEARCH_CACHE_TTL_SECONDS,
+            cache_size=settings.WEB_SEARCH_CACHE_SIZE,
+            max_connections=settings.WEB_SEARCH_MAX_CONNECTIONS,
+            scheduler=get_scheduler(
+                "serpapi",
+                max_concurrency=settings.WEB_SEARCH_MAX_CONCURRENCY,
+                max_queue=settings.WEB_SEARCH_MAX_QUEUE,
+                queue_timeout=settings.WEB_SEARCH_TIMEOUT_SECONDS,
+                requests_per_minute=settings.WEB_SEARCH_REQUESTS_PER_MINUTE,
+                max_retries=settings.WEB_SEARCH_MAX_RETRIES,
+                backoff=settings.RETRY_BACKOFF_SECONDS,
+                max_backoff=settings.RETRY_BACKOFF_MAX_SECONDS,
+            ),
+        )
+    return _client
+
+def set_web_search_client(client: Optional[WebSearchClient]):
+    """Replace the shared client, e.g. with one over a stub transport for offline benchmarks"""
+    global _client
+    _client = client
+
+async def close_web_search_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -10,16 +10,152 @@ load_dotenv()
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
 class Settings(BaseSettings):
-    # Required API keys
-    OPENAI_API_KEY: str
-    SERPAPI_API_KEY: str
+    # API keys, required to answer live queries (checked on first use so the
+    # offline benchmarks in benchmarks/ run without them)
+    OPENAI_API_KEY: str | None = None
+    SERPAPI_API_KEY: str | None = None
 
     # Hugging Face optional token (for authenticated access if needed)
     HUGGINGFACEHUB_API_TOKEN: str | None = None
 
     # Model and vector store settings
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BATCH_SIZE: int = 64  # Texts per forward pass of the model
+    EMBEDDING_CACHE_DIR: str | None = "embedding_cache"  # Set empty to disable the cache
+    EMBEDDING_CACHE_DTYPE: str = "float32"  # "float16" halves cache size
+    EMBEDDING_CACHE_BATCH_SIZE: int = 1024  # Cache misses sent to the model per call
     VECTOR_DB_PATH: str = "vectorstore"
+    INDEX_MMAP: bool = True  # Map the index files read-only so workers share them through the page cache
+    INDEX_SNAPSHOTS_TO_KEEP: int = 3  # Versioned snapshots kept under VECTOR_DB_PATH/snapshots
+    INDEX_WATCH_INTERVAL_SECONDS: float = 30.0  # Poll CURRENT and hot-swap new snapshots; 0 disables
+    INDEX_WARMUP_QUERIES: list[str] = ["punishment for theft under the Indian Penal Code"]
+    ADMIN_TOKEN: str | None = None  # Required as X-Admin-Token on /admin endpoints; unset disables them
+    DATA_DIR: str = "data"
+    PRELOAD_INDEX: bool = False  # Load the index at startup instead of on the first query
+
+    # FAISS index used for search: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw".
+    # ANN indexes are built from the exact vectors at ingestion, which are kept
+    # next to them so later incremental runs never re-embed.
+    FAISS_INDEX_TYPE: str = "flat"
+    INDEX_TRAIN_SAMPLE_SIZE: int = 100_000  # Vectors sampled to train IVF / PQ
+    IVF_NLIST: int | None = None  # Inverted lists; None = 4 * sqrt(num vectors)
+    IVF_NPROBE: int = 16  # Lists scanned per query (recall vs latency)
+    PQ_M: int = 48  # PQ sub-quantizers; must divide the embedding dimension
+    PQ_NBITS: int = 8
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64  # Candidate list size per query (recall vs latency)
+
+    # Ingestion: PDF parsing processes (None = CPU count) and chunks embedded per batch
+    INGEST_WORKERS: int | None = None
+    INGEST_BATCH_SIZE: int = 256
+
+    # Categories: PDFs in DATA_DIR/<category>/ belong to that category, CATEGORY_MAP
+    # ({"file name or glob": "category"}) overrides it, and the rest are DEFAULT_CATEGORY.
+    # A query searches only its category's chunks (plus DEFAULT_CATEGORY ones if
+    # CATEGORY_INCLUDE_GENERAL); unknown categories search the whole index.
+    DEFAULT_CATEGORY: str = "general"
+    CATEGORY_MAP: dict[str, str] = {}
+    CATEGORY_INCLUDE_GENERAL: bool = True
+
+    # Hybrid retrieval settings
+    RETRIEVAL_TOP_K: int = 4
+    RETRIEVAL_MODE: str = "fusion"  # "fusion" or "rerank" (BM25 re-sort of vector candidates)
+    FUSION_METHOD: str = "rrf"  # "rrf" (reciprocal rank fusion) or "weighted"
+    DENSE_CANDIDATES: int = 12
+    LEXICAL_CANDIDATES: int = 12
+    RRF_K: int = 60
+    DENSE_WEIGHT: float = 0.6
+    LEXICAL_WEIGHT: float = 0.4
+
+    # Citation lookup: "Section 420 IPC", "Article 21" or "(2015) 5 SCC 1" in a query is
+    # looked up in a precomputed index; queries that are little more than the reference
+    # skip the vector/BM25 search, others get the looked-up chunks ahead of the searched ones
+    CITATION_LOOKUP_ENABLED: bool = True
+    CITATION_MAX_HITS: int = 2  # Looked-up chunks placed ahead of searched ones
+    CITATION_FAST_PATH_MAX_TERMS: int = 2  # Other words a query may have and still skip search
+
+    # Context packing: retrieved chunks are ordered by MMR, merged where neighbouring
+    # chunks overlap and packed into each prompt up to a token budget (None = no limit)
+    CONTEXT_CANDIDATES: int = 8  # Chunks retrieved for packing; the budget decides how many are used
+    CONTEXT_TOKEN_BUDGET: int | None = 700
+    WEB_CONTEXT_TOKEN_BUDGET: int | None = 500  # Raw web results in a prompt
+    MERGE_INPUT_TOKEN_BUDGET: int | None = 800  # Each answer pasted into the multi-pass merge prompt
+    MMR_LAMBDA: float = 0.7  # 1 = relevance only, 0 = diversity only
+    CONTEXT_MAX_OVERLAP_CHARS: int = 200  # At least the splitter's chunk_overlap
+    CONTEXT_TOKENIZER: str = "cl100k_base"
+
+    # Observability: log level (DEBUG also logs every answer), and whether responses
+    # carry a Server-Timing header with the request's per-stage breakdown
+    LOG_LEVEL: str = "INFO"
+    SERVER_TIMING_HEADER: bool = False
+
+    # Concurrency: threads for blocking retrieval/embedding/search work
+    BLOCKING_POOL_WORKERS: int = 8
+
+    # LLM call scheduling: calls beyond LLM_MAX_CONCURRENCY wait in a bounded priority
+    # queue; a full queue or a wait past LLM_QUEUE_TIMEOUT_SECONDS fails the request
+    # fast with 503 (429 once the per-minute quota is used up) instead of piling up.
+    # Set the quotas to the provider's limits for the model (None = not limited).
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_MAX_QUEUE: int = 64
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 20.0
+    LLM_REQUESTS_PER_MINUTE: float | None = None
+    LLM_TOKENS_PER_MINUTE: float | None = None
+    LLM_EXPECTED_COMPLETION_TOKENS: int = 600  # Counted against the token quota before the call
+    LLM_MAX_RETRIES: int = 3  # Rate-limit, timeout and 5xx errors, with jittered exponential backoff
+    RETRY_BACKOFF_SECONDS: float = 0.5
+    RETRY_BACKOFF_MAX_SECONDS: float = 8.0
+
+    # Per-branch timeouts (seconds); a timed-out web branch is left out of the merge
+    RAG_TIMEOUT_SECONDS: float = 45.0
+    WEB_TIMEOUT_SECONDS: float = 12.0
+
+    # Web search (SerpAPI) client
+    SERPAPI_BASE_URL: str = "https://serpapi.com"
+    WEB_SEARCH_TIMEOUT_SECONDS: float = 8.0
+    WEB_SEARCH_CACHE_TTL_SECONDS: float = 3600
+    WEB_SEARCH_CACHE_SIZE: int = 1024
+    WEB_SEARCH_MAX_CONNECTIONS: int = 20
+    WEB_SEARCH_MAX_CONCURRENCY: int = 8  # Scheduled like LLM calls; a shed search drops the web branch
+    WEB_SEARCH_MAX_QUEUE: int = 64
+    WEB_SEARCH_REQUESTS_PER_MINUTE: float | None = None
+    WEB_SEARCH_MAX_RETRIES: int = 2
+
+    # "multi_pass": RAG answer + web summary + merge (three LLM calls)
+    # "single_pass": one structured LLM call over chunks and raw web results
+    PIPELINE_MODE: str = "multi_pass"
+
+    # Batch queries (/query/batch): all queries are embedded in one model call and
+    # searched together; their LLM stages run BATCH_MAX_PARALLEL at a time at a lower
+    # priority than interactive queries. Async jobs are kept in memory by each worker.
+    BATCH_MAX_QUERIES: int = 500
+    BATCH_MAX_PARALLEL: int = 4
+    BATCH_MAX_ATTEMPTS: int = 3  # Per query, when the LLM scheduler sheds it
+    BATCH_MAX_JOBS: int = 32
+    BATCH_JOB_TTL_SECONDS: float = 6 * 3600  # Finished jobs are dropped after this
+
+    # Answer cache: exact match on the normalized query, plus optional
+    # embedding-similarity match among queries citing the same sections,
+    # cases and numbers (set the threshold empty to disable)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: float = 6 * 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float | None = 0.95
+
+    # Answer PDFs: "lazy" renders on first download, "background" right after the query
+    PDF_DIR: str = "pdfs"
+    PDF_RENDER_MODE: str = "lazy"
+    PDF_PENDING_CACHE_SIZE: int = 256  # Answers kept in memory until their PDF is rendered
+    PDF_MAX_AGE_SECONDS: float = 7 * 24 * 3600
+    PDF_MAX_TOTAL_BYTES: int = 512 * 1024 * 1024
+    PDF_CLEANUP_INTERVAL_SECONDS: float = 600
+
+    # Chat history: "sqlite" (shared by all workers) or "memory"
+    CHAT_HISTORY_BACKEND: str = "sqlite"
+    CHAT_HISTORY_DB_PATH: str = "chat_history.db"
+    CHAT_HISTORY_MAX_PER_SESSION: int = 200
+    CHAT_HISTORY_MAX_AGE_SECONDS: float | None = 30 * 24 * 3600
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,158 @@
+import os
+import re
+import shutil
+import numpy as np
+
+# Parameters matching rank_bm25.BM25Okapi defaults
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+DEFAULT_EPSILON = 0.25
+
+# --- Tokenization ---
+def clean_text(text):
+    return re.sub(r'\W+', ' ', text.lower())
+
+def tokenize(text):
+    return clean_text(text).split()
+
+# --- Corpus-wide BM25 Index ---
+class BM25Index:
+    """Okapi BM25 over the whole chunk corpus, stored as CSR postings.
+
+    Row ``i`` of the index is the ``i``-th vector of the FAISS index, so the
+    ids in ``docstore_ids`` line up with ``vectorstore.index_to_docstore_id``.
+    """
+
+    def __init__(self, vocab, indptr, postings, term_freqs, doc_lens, idf, docstore_ids,
+                 k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        self.vocab = vocab                # sorted array of terms
+        self.indptr = indptr              # postings of term t are indptr[t]:indptr[t + 1]
+        self.postings = postings          # document rows
+        self.term_freqs = term_freqs      # term frequency for each posting
+        self.doc_lens = doc_lens
+        self.idf = idf
+        self.docstore_ids = docstore_ids
+        self.k1 = k1
+        self.b = b
+        avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        # Per-document length normalisation, precomputed once
+        self._norm = k1 * (1 - b + b * doc_lens / avgdl) if avgdl else np.full(len(doc_lens), k1)
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, texts, docstore_ids, k1: float = DEFAULT_K1, b: float = DEFAULT_B,
+              epsilon: float = DEFAULT_EPSILON):
+        """Build the index from chunk texts given in FAISS row order"""
+        term_ids = {}
+        rows, cols, counts = [], [], []
+        doc_lens = np.zeros(len(texts), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens[row] = len(tokens)
+            freqs = {}
+            for token in tokens:
+                freqs[token] = freqs.get(token, 0) + 1
+            for token, count in freqs.items():
+                rows.append(row)
+                cols.append(term_ids.setdefault(token, len(term_ids)))
+                counts.append(count)
+
+        # Remap term ids so the vocabulary is sorted and can be searched with np.searchsorted
+        terms = np.array(list(term_ids.keys()), dtype=str)
+        order = np.argsort(terms, kind="stable")
+        remap = np.empty(len(order), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        vocab = terms[order]
+
+        cols = remap[np.asarray(cols, dtype=np.int64)] if cols else np.zeros(0, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int32)
+        counts = np.asarray(counts, dtype=np.float32)
+
+        # Sort postings by term to get CSR layout
+        order = np.lexsort((rows, cols))
+        postings = rows[order]
+        term_freqs = counts[order]
+        doc_freqs = np.bincount(cols, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=indptr[1:])
+
+        # Same IDF as BM25Okapi, including the epsilon floor for very common terms
+        num_docs = len(texts)
+        idf = np.log(num_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        if len(idf):
+            idf = np.where(idf < 0, epsilon * idf.mean(), idf)
+        idf = idf.astype(np.float32)
+
+        return cls(vocab, indptr, postings, term_freqs, doc_lens, idf,
+                   np.asarray(docstore_ids, dtype=str), k1=k1, b=b)
+
+    def _term_ids(self, query: str):
+        tokens = np.array(tokenize(query), dtype=str)
+        if not len(tokens) or not len(self.vocab):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.searchsorted(self.vocab, tokens)
+        positions = np.minimum(positions, len(self.vocab) - 1)
+        return positions[self.vocab[positions] == tokens]
+
+    def get_scores(self, query: str, rows=None) -> np.ndarray:
+        """BM25 scores for every document, or only for the given rows"""
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in self._term_ids(query):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            docs = self.postings[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        if rows is not None:
+            return scores[np.asarray(rows, dtype=np.int64)]
+        return scores
+
+    def top_k(self, query: str, k: int, rows=None):
+        """Rows and scores of the ``k`` best matching documents, optionally only among ``rows``"""
+        scores = self.get_scores(query, rows=rows)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        if rows is None:
+            return best, scores[best]
+        return np.asarray(rows, dtype=np.int64)[best], scores[best]
+
+    # --- Persistence ---
+    def save(self, path: str):
+        # Write to a fresh directory and swap it in: serving workers may have the old files mapped
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = {
+            "vocab": self.vocab,
+            "indptr": self.indptr,
+            "postings": self.postings,
+            "term_freqs": self.term_freqs,
+            "doc_lens": self.doc_lens,
+            "idf": self.idf,
+            "docstore_ids": self.docstore_ids,
+            "params": np.array([self.k1, self.b], dtype=np.float64),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array, allow_pickle=False)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False):
+        """Load a saved index; with ``mmap`` the arrays are mapped read-only instead of read"""
+        mmap_mode = "r" if mmap else None
+
+        def _load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+        k1, b = _load("params")
+        return cls(
+            _load("vocab"), _load("indptr"), _load("postings"), _load("term_freqs"),
+            _load("doc_lens"), _load("idf"), _load("docstore_ids"), k1=float(k1), b=float(b),
+        )
@@ -0,0 +1,276 @@
+"""Exact-lookup index of statute provisions and case citations.
+
+Maps normalized keys to the chunks that define or cite them:
+
+- ``section:420`` / ``article:21``: a chunk *defines* a provision when it
+  holds its heading ("420. Cheating and dishonestly inducing delivery of
+  property.--Whoever ..."), and *cites* it when it mentions "Section 420" or
+  "Article 21". Whether a document's headings are sections or articles is
+  decided by which of the two words it uses more.
+- ``case:2015 5 scc 1`` / ``case:air 1978 sc 597``: chunks citing a reported case
+
+Each document's act is read from its title ("THE INDIAN PENAL CODE, 1860"), so
+a query naming the act ("Section 420 IPC") only gets that act's chunks. A
+query naming an act that is not indexed ("Section 302 CrPC") gets none.
+Postings are stored in CSR form like the BM25 index, so a lookup is a
+binary search plus a slice.
+"""
+
+import json
+import os
+import re
+import shutil
+from collections import defaultdict
+from typing import List, NamedTuple, Optional
+import numpy as np
+from embeddings.bm25_index import clean_text, tokenize
+
+# Posting weights: defining chunks rank ahead of chunks that only cite
+DEFINES = 2
+CITES = 1
+# A chunk without a heading in its first characters continues the previous chunk's provision
+CONTINUATION_CHARS = 100
+
+# "Section 420", "Sections 378 and 379", "Sec. 66A", "Article 21", "Art. 19(1)(a)".
+# Queries also accept the "s. 420" and "u/s 420" shorthands, which in the
+# documents mostly appear in amendment footnotes.
+_NUMBER = r"\d{1,4}[A-Z]{0,2}\b"
+_NUMBER_LIST = rf"({_NUMBER})((?:\s*(?:,|and|or|&|/)\s*{_NUMBER})*)"
+CHUNK_REFERENCE = re.compile(rf"\b(sections?|sec\.|articles?|art\.)\s*{_NUMBER_LIST}", re.IGNORECASE)
+QUERY_REFERENCE = re.compile(rf"\b(sections?|secs?\.?|ss?\.|u/s\.?|articles?|arts?\.)\s*{_NUMBER_LIST}", re.IGNORECASE)
+
+# "(2015) 5 SCC 1", "2015 5 SCC 1", "AIR 1978 SC 597"
+CASE_CITATION = re.compile(
+    r"\(?\b((?:18|19|20)\d{2})\)?\s+(\d{1,3})\s+(SCC|SCR|SCALE)\s+(\d{1,5})\b"
+    r"|\bAIR\s+((?:18|19|20)\d{2})\s+([A-Z][A-Za-z]{1,12})\s+(\d{1,5})\b"
+)
+
+# "497. Adultery.--Whoever", "21. Protection of life and personal liberty.—No person"
+PROVISION_HEADING = re.compile(
+    r"(?m)^[ \t]*(\d{1,4}[A-Z]{0,2})\.[ \t]*[A-Z][^\n\d]{1,150}?(?:\.?[ \t]*(?:--|—|–)|\.-)[ \t]*\S"
+)
+
+# "THE INDIAN PENAL CODE, 1860", "THE MOTOR VEHICLES ACT, 1988"
+ACT_TITLE = re.compile(r"\b(?:THE\s+|The\s+)?((?:[A-Z][A-Za-z]*\s+){1,5}(?:ACT|Act|CODE|Code)),?\s+(?:18|19|20)\d{2}\b")
+
+# Words that name an act in a query; an act named this way that is not indexed must not match another act
+ACT_WORDS = {"act", "code", "sanhita", "adhiniyam"}
+ACT_ABBREVIATIONS = {
+    "ipc", "crpc", "cpc", "iea", "bns", "bnss", "bsa", "ndps", "pocso", "uapa", "pmla", "fema", "rti",
+    "mva", "hma", "sma", "cgst", "sgst", "igst", "posh",
+}
+
+QUERY_STOPWORDS = {
+    "what", "is", "are", "the", "of", "under", "in", "a", "an", "as", "per", "to", "and", "or",
+    "for", "with", "on", "by", "explain", "define", "definition", "meaning", "about", "tell", "me",
+    "provision", "provisions",
+}
+
+# --- Parsing ---
+def _provision_kind(word: str) -> str:
+    return "article" if word.lower().startswith("a") else "section"
+
+def _references(pattern, text: str):
+    """``(kind, number, span)`` for every provision reference in ``text``"""
+    for match in pattern.finditer(text):
+        kind = _provision_kind(match.group(1))
+        numbers = [match.group(2)] + re.findall(_NUMBER, match.group(3), re.IGNORECASE)
+        for number in numbers:
+            yield kind, number.upper(), match.span()
+
+def _case_key(match) -> str:
+    parts = [part for part in match.groups() if part]
+    if match.group(5):
+        parts = ["air"] + parts
+    return "case:" + " ".join(part.lower() for part in parts)
+
+def chunk_citations(text: str) -> set:
+    """Keys of the provisions and cases a chunk cites"""
+    keys = {f"{kind}:{number}" for kind, number, _ in _references(CHUNK_REFERENCE, text)}
+    keys.update(_case_key(match) for match in CASE_CITATION.finditer(text))
+    return keys
+
+def defined_provisions(text: str) -> List[str]:
+    """Numbers of the provisions whose heading is in ``text``"""
+    return [match.group(1).upper() for match in PROVISION_HEADING.finditer(text)]
+
+def detect_act(text: str) -> Optional[str]:
+    """Normalized name of the first act title in ``text`` ("indian penal code")"""
+    match = ACT_TITLE.search(text)
+    if match is None:
+        return None
+    return " ".join(word for word in clean_text(match.group(1)).split() if word != "the")
+
+def act_aliases(name: str) -> List[str]:
+    """Ways a query may name an act: "indian penal code", "ipc"; "motor vehicles act", "mva", "mv act" """
+    words = name.split()
+    aliases = [name]
+    if len(words) >= 2:
+        aliases.append("".join(word[0] for word in words))
+    if words[-1] == "act" and len(words) >= 3:
+        aliases.append("".join(word[0] for word in words[:-1]) + " act")
+    return aliases
+
+class CitationQuery(NamedTuple):
+    keys: List[str]      # Lookup keys, in the order they appear in the query
+    act: Optional[int]   # Index of the act the query names, if any
+    other_terms: List[str]  # Remaining words, to decide if the lookup can replace search
+    unknown_act: bool = False  # The query names an act that is not indexed
+
+def parse_query(query: str, acts: List[str]) -> CitationQuery:
+    """Extract the provision and case references (and the act, if named) from a query"""
+    keys, spans = [], []
+    for kind, number, span in _references(QUERY_REFERENCE, query):
+        key = f"{kind}:{number}"
+        if key not in keys:
+            keys.append(key)
+        spans.append(span)
+    for match in CASE_CITATION.finditer(query):
+        key = _case_key(match)
+        if key not in keys:
+            keys.append(key)
+        spans.append(match.span())
+
+    remaining = query
+    for start, end in sorted(set(spans), reverse=True):
+        remaining = remaining[:start] + " " + remaining[end:]
+    remaining = f" {clean_text(remaining)} "
+
+    act, best = None, ""
+    for act_id, name in enumerate(acts):
+        for alias in act_aliases(name):
+            if f" {alias} " in remaining and len(alias) > len(best):
+                act, best = act_id, alias
+    if best:
+        remaining = remaining.replace(f" {best} ", " ", 1)
+
+    other_terms = [term for term in tokenize(remaining) if term not in QUERY_STOPWORDS]
+    unknown_act = any(word in ACT_WORDS or word in ACT_ABBREVIATIONS for word in remaining.split())
+    return CitationQuery(keys, act, other_terms, unknown_act)
+
+# --- Index ---
+class CitationIndex:
+    """Citation key -> chunk rows, stored as CSR postings with a weight per posting"""
+
+    def __init__(self, keys, indptr, postings, weights, row_acts, acts: List[str]):
+        self.keys = keys            # sorted array of citation keys
+        self.indptr = indptr        # postings of key k are indptr[k]:indptr[k + 1]
+        self.postings = postings    # chunk rows
+        self.weights = weights      # DEFINES or CITES
+        self.row_acts = row_acts    # act index of every row, -1 if unknown
+        self.acts = acts            # normalized act names
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.row_acts)
+
+    @classmethod
+    def build(cls, texts, sources):
+        """Build the index from chunk texts and their ``source`` files, in FAISS row order"""
+        rows_by_source = defaultdict(list)
+        for row, source in enumerate(sources):
+            rows_by_source[source].append(row)
+
+        acts, act_ids = [], {}
+        row_acts = np.full(len(texts), -1, dtype=np.int16)
+        kinds = {}
+        for source, rows in rows_by_source.items():
+            act = detect_act("\n".join(texts[row] for row in rows[:3]))
+            if act is not None:
+                if act not in act_ids:
+                    act_ids[act] = len(acts)
+                    acts.append(act)
+                row_acts[rows] = act_ids[act]
+            document = "\n".join(texts[row] for row in rows)
+            articles = len(re.findall(r"\barticles?\b", document, re.IGNORECASE))
+            sections = len(re.findall(r"\bsections?\b", document, re.IGNORECASE))
+            kinds[source] = "article" if articles > sections else "section"
+
+        weights = {}  # (key, row) -> weight
+        for row, (text, source) in enumerate(zip(texts, sources)):
+            for key in chunk_citations(text):
+                weights.setdefault((key, row), CITES)
+            numbers = defined_provisions(text)
+            for number in numbers:
+                weights[(f"{kinds[source]}:{number}", row)] = DEFINES
+            # The last provision defined in a chunk usually continues into the next one
+            if numbers and row + 1 < len(texts) and sources[row + 1] == source:
+                heading = PROVISION_HEADING.search(texts[row + 1])
+                if heading is None or heading.start() > CONTINUATION_CHARS:
+                    weights.setdefault((f"{kinds[source]}:{numbers[-1]}", row + 1), CITES)
+
+        entries = sorted(weights.items())
+        keys = sorted({key for (key, _), _ in entries})
+        key_ids = {key: i for i, key in enumerate(keys)}
+        counts = np.bincount([key_ids[key] for (key, _), _ in entries], minlength=len(keys))
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(
+            np.asarray(keys, dtype=str),
+            indptr,
+            np.asarray([row for (_, row), _ in entries], dtype=np.int64),
+            np.asarray([weight for _, weight in entries], dtype=np.int8),
+            row_acts,
+            acts,
+        )
+
+    def _postings(self, key: str):
+        position = int(np.searchsorted(self.keys, key))
+        if position >= len(self.keys) or self.keys[position] != key:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8)
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return self.postings[start:end], self.weights[start:end]
+
+    def lookup(self, keys, act: Optional[int] = None, rows=None, limit: Optional[int] = None) -> List[int]:
+        """Rows defining or citing any of ``keys``, best first.
+
+        Rows are ranked by summed weight, so chunks defining a provision come
+        before chunks citing it. With ``act``, only rows of that act are
+        returned. With ``rows``, only those rows are returned.
+        """
+        allowed = np.asarray(rows, dtype=np.int64) if rows is not None else None
+        scores = defaultdict(int)
+        for key in keys:
+            postings, weights = self._postings(key)
+            if act is not None and len(postings):
+                in_act = self.row_acts[postings] == act
+                postings, weights = postings[in_act], weights[in_act]
+            if allowed is not None and len(postings):
+                keep = np.isin(postings, allowed)
+                postings, weights = postings[keep], weights[keep]
+            for row, weight in zip(postings.tolist(), weights.tolist()):
+                scores[row] += weight
+        ranked = sorted(scores, key=lambda row: (-scores[row], row))
+        return ranked[:limit] if limit is not None else ranked
+
+    # --- Persistence ---
+    def save(self, path: str):
+        # Write to a fresh directory and swap it in: serving workers may have the old files mapped
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = {
+            "keys": self.keys,
+            "indptr": self.indptr,
+            "postings": self.postings,
+            "weights": self.weights,
+            "row_acts": self.row_acts,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array, allow_pickle=False)
+        with open(os.path.join(tmp_path, "acts.json"), "w", encoding="utf-8") as f:
+            json.dump(self.acts, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False):
+        """Load a saved index; with ``mmap`` the arrays are mapped read-only instead of read"""
+        mmap_mode = "r" if mmap else None
+
+        def _load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+        with open(os.path.join(path, "acts.json"), encoding="utf-8") as f:
+            acts = json.load(f)
+        return cls(_load("keys"), _load("indptr"), _load("postings"), _load("weights"), _load("row_acts"), acts)
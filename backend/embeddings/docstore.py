@@ -0,0 +1,146 @@
+"""Compact, memory-mapped docstore for the chunk corpus.
+
+Replaces the pickled ``index.pkl`` docstore for serving. Everything lives in
+plain files under ``faiss_index/docstore/`` that are mapped read-only, so
+every uvicorn worker shares one copy through the page cache and loading
+never unpickles anything:
+
+- ``ids.npy``: docstore id of each FAISS row
+- ``id_order.npy``: rows sorted by id, for id lookups with ``searchsorted``
+- ``text_offsets.npy`` + ``text.bin``: chunk texts as one UTF-8 blob
+- ``metadata_codes.npy`` + ``metadata.json``: one dictionary-encoded column
+  per metadata key (code -1 means the key is absent for that chunk)
+"""
+
+import json
+import os
+import shutil
+from collections.abc import Mapping
+from typing import Optional, Union
+import numpy as np
+from langchain_core.documents import Document
+
+class RowIdMap(Mapping):
+    """Read-only FAISS row -> docstore id mapping backed by the ids array"""
+
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+
+    def __getitem__(self, row: int) -> str:
+        if not 0 <= row < len(self._ids):
+            raise KeyError(row)
+        return str(self._ids[row])
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+class ColumnarDocstore:
+    """Docstore over the columnar files written by ``write``; implements ``search`` like InMemoryDocstore"""
+
+    def __init__(self, path: str, mmap: bool = True):
+        mmap_mode = "r" if mmap else None
+
+        def _load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+
+        self.path = path
+        self.ids = _load("ids")
+        self._id_order = _load("id_order")
+        self._text_offsets = _load("text_offsets")
+        text_path = os.path.join(path, "text.bin")
+        if os.path.getsize(text_path):
+            self._text = np.memmap(text_path, dtype=np.uint8, mode="r") if mmap else np.fromfile(text_path, dtype=np.uint8)
+        else:
+            self._text = np.zeros(0, dtype=np.uint8)
+        self._metadata_codes = _load("metadata_codes")
+        with open(os.path.join(path, "metadata.json"), encoding="utf-8") as f:
+            columns = json.load(f)
+        self._keys = list(columns)
+        self._values = [columns[key] for key in self._keys]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index_to_docstore_id(self) -> RowIdMap:
+        return RowIdMap(self.ids)
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        position = int(np.searchsorted(self.ids, doc_id, sorter=self._id_order))
+        if position < len(self._id_order):
+            row = int(self._id_order[position])
+            if self.ids[row] == doc_id:
+                return row
+        return None
+
+    def document(self, row: int) -> Document:
+        start, end = self._text_offsets[row], self._text_offsets[row + 1]
+        text = self._text[start:end].tobytes().decode("utf-8")
+        metadata = {
+            key: values[code]
+            for key, values, code in zip(self._keys, self._values, self._metadata_codes[row])
+            if code >= 0
+        }
+        return Document(id=str(self.ids[row]), page_content=text, metadata=metadata)
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self.row_of(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def metadata_column(self, key: str):
+        """``(values, codes)`` of one metadata key for every row; codes index ``values``, -1 if absent"""
+        if key not in self._keys:
+            return [], np.full(len(self.ids), -1, dtype=np.int32)
+        column = self._keys.index(key)
+        return self._values[column], np.asarray(self._metadata_codes[:, column])
+
+    @staticmethod
+    def write(path: str, ids, documents):
+        """Write documents (in FAISS row order) to ``path``, replacing what is there"""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        keys, codes_by_value = [], {}
+        offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        rows = []
+        with open(os.path.join(tmp_path, "text.bin"), "wb") as text_file:
+            for row, doc in enumerate(documents):
+                encoded = doc.page_content.encode("utf-8")
+                text_file.write(encoded)
+                offsets[row + 1] = offsets[row] + len(encoded)
+                row_codes = {}
+                for key, value in doc.metadata.items():
+                    if key not in codes_by_value:
+                        keys.append(key)
+                        codes_by_value[key] = {}
+                    # JSON-encoded values as dictionary keys so unhashable values work too
+                    encoded_value = json.dumps(value, sort_keys=True, default=str)
+                    row_codes[key] = codes_by_value[key].setdefault(encoded_value, len(codes_by_value[key]))
+                rows.append(row_codes)
+
+        metadata_codes = np.full((len(documents), len(keys)), -1, dtype=np.int32)
+        for row, row_codes in enumerate(rows):
+            for column, key in enumerate(keys):
+                metadata_codes[row, column] = row_codes.get(key, -1)
+
+        ids = np.asarray(list(ids), dtype=str)
+        arrays = {
+            "ids": ids,
+            "id_order": np.argsort(ids, kind="stable").astype(np.int64),
+            "text_offsets": offsets,
+            "metadata_codes": metadata_codes,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array, allow_pickle=False)
+        columns = {key: [json.loads(value) for value in codes_by_value[key]] for key in keys}
+        with open(os.path.join(tmp_path, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(columns, f)
+
+        # Readers that already mapped the old files keep them until they let go
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
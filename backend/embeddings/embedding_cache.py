@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+# A SHA-1 hex digest and a newline: keys.txt lines have a fixed width, so row N's key is at N * KEY_LINE_BYTES
+KEY_LINE_BYTES = 41
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves previously seen texts from a disk cache.
+
+    The cache lives in ``cache_dir`` as an append-only, memory-mapped matrix
+    (``vectors.bin``) plus ``keys.txt`` holding the SHA-1 of each row's text,
+    one per line. Only cache misses are sent to the wrapped model, in batches
+    of ``batch_size``. Query embeddings are not cached.
+
+    Appends hold a thread lock and an ``fcntl`` lock on ``cache_dir/lock``, so
+    threads and processes (uvicorn workers, ``ingest.py``) can share a cache
+    directory: rows appended by other processes are read in first, texts
+    cached in the meantime are skipped, and a key's row is always its position
+    in ``vectors.bin``.
+    """
+
+    def __init__(self, base: Embeddings, cache_dir: str, dtype: str = "float32", batch_size: int = 256):
+        self.base = base
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(cache_dir, "vectors.bin")
+        self._keys_path = os.path.join(cache_dir, "keys.txt")
+        self._meta_path = os.path.join(cache_dir, "meta.json")
+        self._lock_path = os.path.join(cache_dir, "lock")
+        self._matrix = None  # read-only memmap, reopened after appends
+        self._rows = {}  # key -> row of vectors.bin
+        self._stored = 0  # rows of vectors.bin read into _rows
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dim, self.dtype = None, np.dtype(dtype)
+        with self._locked():
+            self._sync()
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive access to the cache files, across threads and processes"""
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield  # Closing the file releases the lock
+
+    def _sync(self):
+        """Read in the rows appended since the last sync, by any process; call with the lock held"""
+        if self.dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+        if not os.path.exists(self._keys_path) or not os.path.exists(self._vectors_path):
+            return
+
+        row_bytes = self.dim * self.dtype.itemsize
+        vectors_size, keys_size = os.path.getsize(self._vectors_path), os.path.getsize(self._keys_path)
+        stored = min(keys_size // KEY_LINE_BYTES, vectors_size // row_bytes)
+        # Drop any partially written tail so keys and vector rows stay aligned
+        if vectors_size != stored * row_bytes:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(stored * row_bytes)
+        if keys_size != stored * KEY_LINE_BYTES:
+            with open(self._keys_path, "r+b") as f:
+                f.truncate(stored * KEY_LINE_BYTES)
+        if stored <= self._stored:
+            return
+
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._stored * KEY_LINE_BYTES)
+            keys = f.read((stored - self._stored) * KEY_LINE_BYTES).decode("ascii").split()
+        # Count the rows before publishing their keys, so readers never see a row past the mapped matrix
+        first, self._stored = self._stored, stored
+        for row, key in enumerate(keys, start=first):
+            self._rows.setdefault(key, row)
+
+    def _matrix_view(self):
+        stored = self._stored
+        if self._matrix is None or len(self._matrix) < stored:
+            self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(stored, self.dim))
+        return self._matrix
+
+    def _append(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._locked():
+            self._sync()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+            # Another thread or process may have cached some of these texts meanwhile
+            new = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not new:
+                return
+            # Vectors first, then keys, so a crash never leaves a key without its vector
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors[new].astype(self.dtype).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write("".join(f"{keys[i]}\n" for i in new).encode("ascii"))
+            self._sync()
+
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+
+        # Encode each distinct missing text once; _append skips texts cached meanwhile
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start:start + self.batch_size]
+            self._append(batch_keys, self.base.embed_documents([missing[key] for key in batch_keys]))
+
+        if not keys:
+            return []
+        rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        matrix = self._matrix_view()
+        return matrix[rows].astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
@@ -1,44 +1,562 @@
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from config import settings
+from embeddings.bm25_index import BM25Index
+from embeddings.citation_index import CitationIndex
+from embeddings.docstore import ColumnarDocstore
+from embeddings.embedding_cache import CachedEmbeddings
+from embeddings.manifest import diff_files, hash_file, make_chunk_ids, make_version, read_manifest, write_manifest
+from embeddings.partitions import CategoryPartitions, category_for_file, normalize_category
+from embeddings.snapshots import create_snapshot_dir, get_snapshot_path, publish_snapshot, read_current_version
+from datetime import datetime, timezone
+from pathlib import Path, PureWindowsPath
+from typing import Any, NamedTuple, Optional
+import faiss
+import logging
+import math
+import numpy as np
 import os
 
+logger = logging.getLogger(__name__)
+
+_embedding_model = None
+_ingestion_embedding_model = None
+
 def get_embedding_model():
-    """Initializes the HuggingFace embedding model with CPU and normalization."""
+    """Returns the shared HuggingFace embedding model (CPU, normalized)."""
+    global _embedding_model
+    if _embedding_model is not None:
+        return _embedding_model
     try:
-        return HuggingFaceEmbeddings(
+        _embedding_model = HuggingFaceEmbeddings(
             model_name=settings.EMBEDDING_MODEL,
             model_kwargs={'device': 'cpu'},  # Ensure consistent device usage
-            encode_kwargs={'normalize_embeddings': True}  # Improves similarity search
+            encode_kwargs={
+                'normalize_embeddings': True,  # Improves similarity search
+                'batch_size': settings.EMBEDDING_BATCH_SIZE
+            }
         )
+        return _embedding_model
     except Exception as e:
-        print(f"[ERROR] Failed to initialize embeddings: {str(e)}")
+        logger.error(f"Failed to initialize embeddings: {str(e)}")
         raise
 
-def build_or_load_vectorstores(chunks):
-    """Builds or loads a FAISS vector store from provided document chunks."""
-    try:
+def get_ingestion_embedding_model():
+    """Returns the shared embedding model behind the chunk embedding disk cache, if enabled.
+
+    Only ingestion embeds chunks, so serving workers never open the cache.
+    """
+    global _ingestion_embedding_model
+    if _ingestion_embedding_model is None:
         embeddings = get_embedding_model()
+        if settings.EMBEDDING_CACHE_DIR:
+            cache_dir = os.path.join(settings.EMBEDDING_CACHE_DIR, settings.EMBEDDING_MODEL.replace("/", "__"))
+            embeddings = CachedEmbeddings(
+                embeddings,
+                cache_dir,
+                dtype=settings.EMBEDDING_CACHE_DTYPE,
+                batch_size=settings.EMBEDDING_CACHE_BATCH_SIZE
+            )
+        _ingestion_embedding_model = embeddings
+    return _ingestion_embedding_model
 
-        # Ensure vector store directory exists
-        os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+def set_embedding_model(embeddings):
+    """Replace the shared embedding model, e.g. with a stand-in for offline benchmarks"""
+    global _embedding_model, _ingestion_embedding_model
+    _embedding_model = embeddings
+    _ingestion_embedding_model = None
 
-        vector_store_path = os.path.join(settings.VECTOR_DB_PATH, "faiss_index")
+def embed_queries(embeddings, texts):
+    """Embeds many queries in one batched model call."""
+    return embeddings.embed_documents(list(texts))
 
-        if os.path.exists(vector_store_path):
-            print('[INFO] Loading existing FAISS index...')
-            db = FAISS.load_local(
-                vector_store_path,
-                embeddings=embeddings,
-                allow_dangerous_deserialization=True  # Safe if controlled
-            )
+def get_vector_store_path(snapshot_path=None):
+    return os.path.join(snapshot_path or get_snapshot_path(), "faiss_index")
+
+def get_bm25_path(snapshot_path=None):
+    return os.path.join(snapshot_path or get_snapshot_path(), "bm25_index")
+
+def get_citation_path(snapshot_path=None):
+    return os.path.join(snapshot_path or get_snapshot_path(), "citation_index")
+
+# Exact vectors kept next to an ANN index, so incremental ingestion can add and
+# delete vectors and rebuild the ANN index without re-embedding
+EXACT_VECTORS_FILE = "vectors.faiss"
+# Columnar docstore (see embeddings/docstore.py); indexes without it use the pickled index.pkl
+DOCSTORE_DIR = "docstore"
+
+def read_faiss_index(path: str, mmap: bool = False):
+    """Reads a FAISS index; with ``mmap`` its vectors / codes are mapped read-only instead of copied"""
+    if not mmap:
+        return faiss.read_index(path)
+    return faiss.read_index(path, getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY)
+
+def write_faiss_index(index, path: str):
+    # Replace rather than overwrite: serving workers may have the old file mapped
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+def get_row_ids(vectorstore) -> np.ndarray:
+    """Docstore ids in FAISS row order"""
+    if isinstance(vectorstore.docstore, ColumnarDocstore):
+        return vectorstore.docstore.ids
+    return np.asarray([vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)], dtype=str)
+
+# --- FAISS Index Factory ---
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+def is_flat_index(index) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+def default_nlist(num_vectors: int) -> int:
+    return max(1, int(4 * math.sqrt(num_vectors)))
+
+def build_faiss_index(vectors, metric=faiss.METRIC_L2, index_type=None, nlist=None, seed: int = 0):
+    """Builds a FAISS index of ``index_type`` (default FAISS_INDEX_TYPE) over ``vectors``.
+
+    IVF quantizers and PQ codebooks are trained on at most
+    INDEX_TRAIN_SAMPLE_SIZE randomly sampled vectors. Falls back to a flat
+    index when there are too few vectors to train on.
+    """
+    index_type = index_type or settings.FAISS_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}; expected one of {INDEX_TYPES}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, settings.HNSW_M, metric)
+        index.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = min(nlist or settings.IVF_NLIST or default_nlist(num_vectors), max(num_vectors, 1))
+        quantizer = faiss.IndexFlat(dim, metric)
+        if index_type == "ivf_pq":
+            if dim % settings.PQ_M:
+                raise ValueError(f"PQ_M={settings.PQ_M} does not divide the embedding dimension {dim}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, settings.PQ_M, settings.PQ_NBITS, metric)
+            min_train = max(nlist, 2 ** settings.PQ_NBITS)
         else:
-            print("[INFO] Building new FAISS index...")
-            db = FAISS.from_documents(chunks, embeddings)
-            db.save_local(vector_store_path)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+            min_train = nlist
+        if num_vectors < min_train:
+            logger.warning(f"{num_vectors} vectors are too few to train {index_type}, using a flat index")
+            return build_faiss_index(vectors, metric, "flat")
+
+        sample = vectors
+        if num_vectors > settings.INDEX_TRAIN_SAMPLE_SIZE:
+            rows = np.random.default_rng(seed).choice(num_vectors, settings.INDEX_TRAIN_SAMPLE_SIZE, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(sample)
+    else:
+        index = faiss.IndexFlat(dim, metric)
+
+    index.add(vectors)
+    return configure_faiss_index(index)
+
+def configure_faiss_index(index, nprobe=None, ef_search=None):
+    """Applies the query-time tunables (IVF nprobe, HNSW efSearch) to an index"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or settings.IVF_NPROBE, ivf.nlist)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search or settings.HNSW_EF_SEARCH
+    return index
+
+def search_parameters(index, selector=None):
+    """Per-query search parameters carrying the index's own tunables.
+
+    FAISS resets nprobe / efSearch to its defaults when parameters are passed,
+    so they are copied from the index.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(nprobe=ivf.nprobe)
+    elif hasattr(index, "hnsw"):
+        params = faiss.SearchParametersHNSW(efSearch=index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+def search_index(index, embeddings, k: int, selector=None):
+    """Searches ``index``, optionally only among the rows accepted by ``selector``.
+
+    A filtered IVF or HNSW search only sees the selected rows inside the lists
+    or graph neighbourhood it visits, so a small partition can come back short;
+    the search is then repeated over every list, or with a wider candidate list.
+    """
+    if selector is None:
+        return index.search(embeddings, k)
+
+    params = search_parameters(index, selector)
+    distances, rows = index.search(embeddings, k, params=params)
+    if (rows >= 0).sum(axis=1).min() >= min(k, index.ntotal) or is_flat_index(index):
+        return distances, rows
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params.nprobe = ivf.nlist
+    else:
+        params.efSearch = max(params.efSearch * 8, k)
+    return index.search(embeddings, k, params=params)
+
+def load_exact_index(snapshot_path=None):
+    """Reads the persisted exact (flat) vectors without loading the docstore (memory-mapped with INDEX_MMAP)."""
+    vector_store_path = get_vector_store_path(snapshot_path)
+    vectors_path = os.path.join(vector_store_path, EXACT_VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        return read_faiss_index(vectors_path, mmap=settings.INDEX_MMAP)
+    index = read_faiss_index(os.path.join(vector_store_path, "index.faiss"), mmap=settings.INDEX_MMAP)
+    if not is_flat_index(index):
+        raise FileNotFoundError(f"No exact vectors saved next to the {type(index).__name__} index")
+    return index
+
+def save_vectorstores(db, files: dict) -> dict:
+    """Saves the FAISS index, columnar docstore, fresh BM25 and citation indexes and the manifest
+    as a new snapshot, then publishes it as the current one; returns the manifest.
+
+    ``db`` must hold the exact (flat) vectors. For other FAISS_INDEX_TYPE
+    settings the ANN index is built from them and saved as the search index,
+    with the exact vectors kept alongside; ``db`` is left holding the ANN index.
+    """
+    built_at = datetime.now(timezone.utc)
+    snapshot_path = create_snapshot_dir(make_version(built_at))
+    vector_store_path = get_vector_store_path(snapshot_path)
+    os.makedirs(vector_store_path)
+    exact = db.index
+    if settings.FAISS_INDEX_TYPE != "flat":
+        logger.info(f"Building {settings.FAISS_INDEX_TYPE} index over {exact.ntotal} vectors...")
+        db.index = build_faiss_index(exact.reconstruct_n(0, exact.ntotal), exact.metric_type)
+
+    write_faiss_index(db.index, os.path.join(vector_store_path, "index.faiss"))
+    vectors_path = os.path.join(vector_store_path, EXACT_VECTORS_FILE)
+    if not is_flat_index(db.index):
+        write_faiss_index(exact, vectors_path)
+    elif os.path.exists(vectors_path):
+        os.remove(vectors_path)
+
+    ids = [db.index_to_docstore_id[row] for row in range(db.index.ntotal)]
+    ColumnarDocstore.write(
+        os.path.join(vector_store_path, DOCSTORE_DIR), ids, [db.docstore.search(doc_id) for doc_id in ids]
+    )
+
+    logger.info("Building BM25 index...")
+    build_bm25_index(db).save(get_bm25_path(snapshot_path))
+    logger.info("Building citation index...")
+    build_citation_index(db).save(get_citation_path(snapshot_path))
+
+    manifest = write_manifest(
+        files, index_type=settings.FAISS_INDEX_TYPE, snapshot_path=snapshot_path, built_at=built_at
+    )
+    publish_snapshot(manifest["version"])
+    logger.info(f"Saved index version {manifest['version']} ({manifest['num_chunks']} chunks)")
+    return manifest
+
+def _adopt_legacy_index(db, file_hashes: dict) -> dict:
+    """Builds manifest entries for an index saved before manifests existed.
+
+    Chunks are grouped by their ``source`` metadata; current files are assumed
+    to be the ones that were embedded.
+    """
+    chunk_ids = {}
+    categories = {}
+    for row in range(db.index.ntotal):
+        doc_id = db.index_to_docstore_id[row]
+        metadata = db.docstore.search(doc_id).metadata
+        # PureWindowsPath splits on both separators; older indexes were built on Windows
+        name = PureWindowsPath(metadata.get("source", "")).name
+        chunk_ids.setdefault(name, []).append(doc_id)
+        categories.setdefault(name, normalize_category(metadata.get("category")))
+    return {
+        name: {"sha256": file_hashes.get(name, ""), "category": categories[name], "chunk_ids": ids}
+        for name, ids in chunk_ids.items()
+    }
+
+def _recategorize(db, manifest_files: dict, categories: dict) -> int:
+    """Re-tags chunks of already indexed files whose category changed; returns files updated.
+
+    Only chunk metadata changes, so nothing is re-embedded.
+    """
+    updated = 0
+    for name, entry in manifest_files.items():
+        category = categories.get(name)
+        if category is None or entry.get("category") == category:
+            continue
+        for chunk_id in entry["chunk_ids"]:
+            doc = db.docstore.search(chunk_id)
+            if hasattr(doc, "metadata"):
+                doc.metadata["category"] = category
+        entry["category"] = category
+        updated += 1
+    return updated
+
+def sync_vectorstores(pdf_dir: str, rebuild: bool = False, workers=None, batch_size=None):
+    """Brings the persisted indexes in line with the PDFs in ``pdf_dir``.
+
+    PDFs are found recursively and keyed by their path relative to ``pdf_dir``;
+    each chunk is tagged with its file's category (``category_for_file``).
+    Only added or changed files are parsed and embedded; vectors of changed
+    and deleted files are removed from the FAISS index and docstore. A full
+    rebuild happens when ``rebuild`` is set, no index exists yet, or the
+    embedding model changed. PDFs are parsed on ``workers`` processes and
+    embedded ``batch_size`` chunks at a time (defaults from settings).
+    Returns the up-to-date vector store.
+    """
+    # Imported here so serving never pulls in the PDF loaders otherwise
+    from utils.pdfProcessing import iter_split_pdfs
+
+    try:
+        files = {path.relative_to(pdf_dir).as_posix(): path for path in sorted(Path(pdf_dir).rglob("*.pdf"))}
+        file_hashes = {name: hash_file(path) for name, path in files.items()}
+        categories = {name: category_for_file(name) for name in files}
+
+        manifest = read_manifest()
+        db = None
+        manifest_files = {}
+        # Indexes saved before versioned snapshots are moved into one
+        legacy_format = read_current_version() is None
+        if not rebuild and os.path.exists(get_vector_store_path()):
+            if manifest is not None and manifest.get("embedding_model") != settings.EMBEDDING_MODEL:
+                logger.info("Embedding model changed, rebuilding the index...")
+            else:
+                db = load_vectorstores(for_update=True)
+                if not is_flat_index(db.index):
+                    logger.warning("No exact vectors saved with the index, rebuilding the index...")
+                    db = None
+                elif manifest is None:
+                    logger.info("No manifest found, adopting the existing index...")
+                    manifest_files = _adopt_legacy_index(db, file_hashes)
+                else:
+                    manifest_files = manifest["files"]
+
+        added, changed, removed = diff_files(manifest_files, file_hashes)
+        recategorized = 0
+        index_changed = False
+        if db is not None:
+            unchanged = {name: entry for name, entry in manifest_files.items() if name not in changed + removed}
+            recategorized = _recategorize(db, unchanged, categories)
+            index_changed = (manifest or {}).get("index_type", "flat") != settings.FAISS_INDEX_TYPE
+            if index_changed:
+                logger.info(f"Index type changed to {settings.FAISS_INDEX_TYPE}, rebuilding from the saved vectors...")
+            if legacy_format:
+                logger.info("Converting the index to a versioned snapshot...")
+        if db is not None and not (added or changed or removed or recategorized or index_changed or legacy_format):
+            if manifest is None:
+                write_manifest(manifest_files)
+            logger.info("Index is up to date")
+            return db
 
+        logger.info(
+            f"{len(added)} added, {len(changed)} changed, {len(removed)} removed, "
+            f"{recategorized} recategorized files"
+        )
+
+        # Drop vectors of changed and deleted files
+        stale_ids = [
+            chunk_id
+            for name in changed + removed
+            for chunk_id in manifest_files[name]["chunk_ids"]
+        ]
+        if db is not None and stale_ids:
+            db.delete(stale_ids)
+        for name in changed + removed:
+            manifest_files.pop(name)
+
+        # Parse and embed only new content, streaming chunks in bounded batches
+        workers = settings.INGEST_WORKERS if workers is None else workers
+        batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        batch, batch_ids = [], []
+
+        def flush(count):
+            nonlocal db
+            docs, ids = batch[:count], batch_ids[:count]
+            del batch[:count], batch_ids[:count]
+            logger.info(f"Embedding {len(docs)} chunks...")
+            if db is None:
+                db = FAISS.from_documents(docs, get_ingestion_embedding_model(), ids=ids)
+            else:
+                db.add_documents(docs, ids=ids)
+
+        names = {path: name for name, path in files.items()}
+        for path, file_chunks in iter_split_pdfs([files[name] for name in added + changed], workers):
+            name = names[path]
+            for chunk in file_chunks:
+                chunk.metadata["category"] = categories[name]
+            ids = make_chunk_ids(name, file_hashes[name], len(file_chunks))
+            manifest_files[name] = {"sha256": file_hashes[name], "category": categories[name], "chunk_ids": ids}
+            batch.extend(file_chunks)
+            batch_ids.extend(ids)
+            while len(batch) >= batch_size:
+                flush(batch_size)
+        if batch:
+            flush(len(batch))
+
+        if db is None:
+            raise ValueError(f"No PDFs found in {pdf_dir}")
+
+        save_vectorstores(db, manifest_files)
         return db
 
     except Exception as e:
-        print(f"[ERROR] Failed to build/load vector store: {str(e)}")
+        logger.error(f"Failed to sync vector store: {str(e)}")
+        raise
+
+def load_vectorstores(for_update: bool = False, snapshot_path=None):
+    """Loads a persisted FAISS vector store (default: the current snapshot) without touching the source PDFs.
+
+    For serving, the index and columnar docstore are memory-mapped read-only
+    (INDEX_MMAP) and nothing is unpickled. With ``for_update`` the store is
+    read into memory as a mutable docstore holding the exact vectors (for
+    ingestion) instead of the ANN search index.
+    """
+    vector_store_path = get_vector_store_path(snapshot_path)
+    if not os.path.exists(vector_store_path):
+        raise FileNotFoundError(f"No FAISS index at {vector_store_path}; run `python ingest.py` first")
+
+    logger.info('Loading existing FAISS index...')
+    # Ingestion embeds new chunks with the store's model, through the embedding cache
+    embeddings = get_ingestion_embedding_model() if for_update else get_embedding_model()
+    docstore_path = os.path.join(vector_store_path, DOCSTORE_DIR)
+    vectors_path = os.path.join(vector_store_path, EXACT_VECTORS_FILE)
+    if not os.path.exists(docstore_path):
+        # Saved before the columnar docstore existed
+        db = FAISS.load_local(
+            vector_store_path,
+            embeddings=embeddings,
+            allow_dangerous_deserialization=True  # Safe if controlled
+        )
+    elif for_update:
+        docstore = ColumnarDocstore(docstore_path, mmap=False)
+        ids = [str(doc_id) for doc_id in docstore.ids]
+        db = FAISS(
+            embeddings,
+            faiss.read_index(os.path.join(vector_store_path, "index.faiss")),
+            InMemoryDocstore({doc_id: docstore.document(row) for row, doc_id in enumerate(ids)}),
+            dict(enumerate(ids)),
+        )
+    else:
+        docstore = ColumnarDocstore(docstore_path, mmap=settings.INDEX_MMAP)
+        db = FAISS(
+            embeddings,
+            read_faiss_index(os.path.join(vector_store_path, "index.faiss"), mmap=settings.INDEX_MMAP),
+            docstore,
+            docstore.index_to_docstore_id(),
+        )
+
+    if for_update and os.path.exists(vectors_path):
+        db.index = faiss.read_index(vectors_path)
+    else:
+        configure_faiss_index(db.index)
+    return db
+
+class RetrievalResources(NamedTuple):
+    """Everything retrieval needs from one index snapshot, swapped as a unit"""
+    version: Optional[str]
+    vectorstore: Any
+    bm25_index: Any
+    partitions: Any
+    citations: Any = None
+    vectors: Any = None  # Flat index of the exact chunk vectors by row, for MMR
+
+def load_row_vectors(db, snapshot_path=None):
+    """Flat index to read chunk vectors from by row: the search index if flat, else the saved exact vectors"""
+    if is_flat_index(db.index):
+        return db.index
+    try:
+        return load_exact_index(snapshot_path)
+    except Exception as e:
+        logger.warning(f"No exact vectors for the {type(db.index).__name__} index, context is packed in retrieval order: {str(e)}")
+        return None
+
+def load_retrieval_resources(version: Optional[str] = None) -> RetrievalResources:
+    """Loads the vector store, BM25 and citation indexes and category partitions of a snapshot for serving.
+
+    Without ``version`` the current snapshot is used. Nothing is ingested here:
+    raises FileNotFoundError if ``python ingest.py`` has not built an index yet.
+    """
+    try:
+        snapshot_path = get_snapshot_path(version)
+        db = load_vectorstores(snapshot_path=snapshot_path)
+
+        manifest = read_manifest(snapshot_path)
+        if manifest:
+            logger.info(f"Using index version {manifest['version']}")
+        partitions = CategoryPartitions.from_vectorstore(db)
+        logger.info(f"Chunks per category: {partitions.categories()}")
+        return RetrievalResources(
+            manifest["version"] if manifest else None,
+            db,
+            build_or_load_bm25_index(db, snapshot_path),
+            partitions,
+            build_or_load_citation_index(db, snapshot_path),
+            load_row_vectors(db, snapshot_path),
+        )
+
+    except Exception as e:
+        logger.error(f"Failed to load retrieval resources: {str(e)}")
+        raise
+
+def build_bm25_index(vectorstore):
+    """Builds a corpus-wide BM25 index over every chunk in the FAISS docstore."""
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    texts = [vectorstore.docstore.search(doc_id).page_content for doc_id in ids]
+    return BM25Index.build(texts, ids)
+
+def build_or_load_bm25_index(vectorstore, snapshot_path=None):
+    """Loads the BM25 index saved next to the FAISS index, rebuilding it if stale."""
+    try:
+        bm25_path = get_bm25_path(snapshot_path)
+
+        if os.path.exists(bm25_path):
+            logger.info("Loading existing BM25 index...")
+            index = BM25Index.load(bm25_path, mmap=settings.INDEX_MMAP)
+            if np.array_equal(index.docstore_ids, get_row_ids(vectorstore)):
+                return index
+            logger.info("BM25 index does not match FAISS index, rebuilding...")
+        else:
+            logger.info("Building new BM25 index...")
+
+        index = build_bm25_index(vectorstore)
+        index.save(bm25_path)
+        return index
+
+    except Exception as e:
+        logger.error(f"Failed to build/load BM25 index: {str(e)}")
         raise
+
+def build_citation_index(vectorstore):
+    """Builds the statute/case citation index over every chunk in the FAISS docstore."""
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    docs = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    return CitationIndex.build([doc.page_content for doc in docs], [doc.metadata.get("source") for doc in docs])
+
+def build_or_load_citation_index(vectorstore, snapshot_path=None):
+    """Loads the citation index saved next to the FAISS index, rebuilding it if stale.
+
+    The index only adds a fast path to retrieval, so failures are logged and
+    ``None`` is returned instead of raising.
+    """
+    if not settings.CITATION_LOOKUP_ENABLED:
+        return None
+    try:
+        citation_path = get_citation_path(snapshot_path)
+
+        if os.path.exists(citation_path):
+            logger.info("Loading existing citation index...")
+            index = CitationIndex.load(citation_path, mmap=settings.INDEX_MMAP)
+            if index.num_rows == vectorstore.index.ntotal:
+                return index
+            logger.info("Citation index does not match FAISS index, rebuilding...")
+        else:
+            logger.info("Building new citation index...")
+
+        index = build_citation_index(vectorstore)
+        index.save(citation_path)
+        return index
+
+    except Exception as e:
+        logger.warning(f"Citation lookup disabled, failed to build/load citation index: {str(e)}")
+        return None
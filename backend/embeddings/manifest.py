@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from config import settings
+from embeddings.snapshots import get_snapshot_path
+
+# Manifest layout (<snapshot>/manifest.json, see embeddings/snapshots.py):
+# {
+#   "version": "...", "built_at": "...", "embedding_model": "...", "index_type": "flat", "num_chunks": N,
+#   "files": {"data1.pdf": {"sha256": "...", "category": "general",
+#                           "chunk_ids": ["<path hash>-<sha prefix>-00000", ...]}}
+# }
+
+def get_manifest_path(snapshot_path=None):
+    return os.path.join(snapshot_path or get_snapshot_path(), "manifest.json")
+
+def make_version(built_at: datetime) -> str:
+    return built_at.strftime("%Y%m%dT%H%M%S%fZ")
+
+def hash_file(path, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_chunk_ids(name: str, file_hash: str, count: int):
+    """Deterministic chunk ids derived from the file's relative path and content hash.
+
+    The path keeps the ids of byte-identical PDFs in different folders apart.
+    """
+    path_hash = hashlib.sha256(name.encode("utf-8")).hexdigest()[:12]
+    return [f"{path_hash}-{file_hash[:16]}-{i:05d}" for i in range(count)]
+
+def read_manifest(snapshot_path=None):
+    """Returns the manifest of a snapshot (default: the current one), if any"""
+    try:
+        with open(get_manifest_path(snapshot_path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_manifest(files: dict, index_type: str = "flat", snapshot_path=None, built_at=None) -> dict:
+    """Writes a manifest for the given per-file entries, stamped with the version of ``built_at``"""
+    built_at = built_at or datetime.now(timezone.utc)
+    manifest = {
+        "version": make_version(built_at),
+        "built_at": built_at.isoformat(),
+        "embedding_model": settings.EMBEDDING_MODEL,
+        "index_type": index_type,
+        "num_chunks": sum(len(entry["chunk_ids"]) for entry in files.values()),
+        "files": dict(sorted(files.items())),
+    }
+    # Write then rename so readers never see a partial manifest
+    manifest_path = get_manifest_path(snapshot_path)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+def diff_files(manifest_files: dict, file_hashes: dict):
+    """Compare current file hashes against the manifest.
+
+    Returns ``(added, changed, removed)`` lists of file names.
+    """
+    added = sorted(name for name in file_hashes if name not in manifest_files)
+    changed = sorted(
+        name for name, file_hash in file_hashes.items()
+        if name in manifest_files and manifest_files[name]["sha256"] != file_hash
+    )
+    removed = sorted(name for name in manifest_files if name not in file_hashes)
+    return added, changed, removed
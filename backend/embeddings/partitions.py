@@ -0,0 +1,89 @@
+"""Category partitions of the chunk corpus.
+
+Ingestion tags every chunk with a ``category`` metadata field (see
+``category_for_file``). At serving time ``CategoryPartitions`` maps each
+category to its FAISS rows, so dense search can be restricted with a FAISS
+ID selector and BM25 scoring with the same rows.
+"""
+
+import fnmatch
+import threading
+from pathlib import PurePosixPath
+from typing import Optional
+import faiss
+import numpy as np
+from config import settings
+
+def normalize_category(category: Optional[str]) -> str:
+    return (category or "").strip().lower() or settings.DEFAULT_CATEGORY
+
+def category_for_file(relative_path: str) -> str:
+    """Category of a PDF from its path relative to the data directory.
+
+    A ``CATEGORY_MAP`` entry matching the path or file name wins; otherwise a
+    PDF under a subdirectory belongs to the category named by that directory,
+    and top-level PDFs get ``DEFAULT_CATEGORY``.
+    """
+    path = PurePosixPath(relative_path)
+    for pattern, category in settings.CATEGORY_MAP.items():
+        if fnmatch.fnmatch(path.as_posix(), pattern) or fnmatch.fnmatch(path.name, pattern):
+            return normalize_category(category)
+    if len(path.parts) > 1:
+        return normalize_category(path.parts[0])
+    return settings.DEFAULT_CATEGORY
+
+class CategoryPartitions:
+    """FAISS rows of each category, with cached ID selectors for filtered search"""
+
+    def __init__(self, rows_by_category: dict, num_rows: int):
+        self._rows = rows_by_category
+        self.num_rows = num_rows
+        self._resolved = {}  # known category -> (rows, selector) or None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        """Group rows by the ``category`` metadata of their chunks (untagged chunks are DEFAULT_CATEGORY)"""
+        rows_by_category = {}
+        if hasattr(vectorstore.docstore, "metadata_column"):
+            # Columnar docstore: read the category column without building documents
+            values, codes = vectorstore.docstore.metadata_column("category")
+            for code in np.unique(codes):
+                category = normalize_category(values[code] if code >= 0 else None)
+                rows_by_category.setdefault(category, []).extend(np.flatnonzero(codes == code).tolist())
+        else:
+            for row in range(vectorstore.index.ntotal):
+                doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[row])
+                category = normalize_category(doc.metadata.get("category"))
+                rows_by_category.setdefault(category, []).append(row)
+        return cls(
+            {category: np.sort(np.asarray(rows, dtype=np.int64)) for category, rows in rows_by_category.items()},
+            vectorstore.index.ntotal,
+        )
+
+    def categories(self) -> dict:
+        """Number of chunks per category"""
+        return {category: len(rows) for category, rows in sorted(self._rows.items())}
+
+    def lookup(self, category: Optional[str]):
+        """Return ``(rows, selector)`` to search for ``category``, or None to search everything"""
+        category = normalize_category(category)
+        if category not in self._rows:
+            # Unknown categories search everything; not caching them keeps _resolved bounded
+            # by the indexed categories, whatever categories clients send
+            return None
+        with self._lock:
+            if category not in self._resolved:
+                self._resolved[category] = self._resolve(category)
+            return self._resolved[category]
+
+    def _resolve(self, category: str):
+        rows = self._rows[category]
+        if category == settings.DEFAULT_CATEGORY:
+            return None
+        general = self._rows.get(settings.DEFAULT_CATEGORY)
+        if settings.CATEGORY_INCLUDE_GENERAL and general is not None:
+            rows = np.union1d(rows, general)
+        if len(rows) >= self.num_rows:
+            return None
+        return rows, faiss.IDSelectorBatch(rows)
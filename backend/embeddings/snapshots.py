@@ -0,0 +1,71 @@
+"""Versioned index snapshots.
+
+Every ingestion run writes a complete snapshot directory
+``VECTOR_DB_PATH/snapshots/<version>/`` (``faiss_index/``, ``bm25_index/``,
+``manifest.json``) that is never modified afterwards, then points
+``VECTOR_DB_PATH/CURRENT`` at it with an atomic rename. Readers resolve
+``CURRENT`` once and keep using that directory, so they never see a
+half-written index. Indexes saved before snapshots existed live directly in
+``VECTOR_DB_PATH`` and are used while there is no ``CURRENT`` file.
+"""
+
+import os
+import shutil
+from typing import List, Optional
+from config import settings
+
+def get_snapshots_dir() -> str:
+    return os.path.join(settings.VECTOR_DB_PATH, "snapshots")
+
+def get_current_file() -> str:
+    return os.path.join(settings.VECTOR_DB_PATH, "CURRENT")
+
+def read_current_version() -> Optional[str]:
+    """Version named by the CURRENT file, or None if no snapshot was published yet"""
+    try:
+        with open(get_current_file(), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def get_snapshot_path(version: Optional[str] = None) -> str:
+    """Directory of a snapshot (default: the current one, or the legacy unversioned layout)"""
+    version = version or read_current_version()
+    if version is None:
+        return settings.VECTOR_DB_PATH
+    return os.path.join(get_snapshots_dir(), version)
+
+def create_snapshot_dir(version: str) -> str:
+    path = os.path.join(get_snapshots_dir(), version)
+    os.makedirs(path)
+    return path
+
+def list_snapshots() -> List[str]:
+    """Versions on disk, oldest first (versions are UTC timestamps)"""
+    try:
+        return sorted(
+            name for name in os.listdir(get_snapshots_dir())
+            if os.path.isdir(os.path.join(get_snapshots_dir(), name))
+        )
+    except FileNotFoundError:
+        return []
+
+def publish_snapshot(version: str):
+    """Make ``version`` the current snapshot, then drop snapshots beyond INDEX_SNAPSHOTS_TO_KEEP"""
+    tmp_path = f"{get_current_file()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, get_current_file())
+    prune_snapshots(settings.INDEX_SNAPSHOTS_TO_KEEP)
+
+def prune_snapshots(keep: int) -> List[str]:
+    """Delete the oldest snapshots so at most ``keep`` remain; never the current one.
+
+    Servers still using a deleted snapshot keep their open and mapped files.
+    """
+    current = read_current_version()
+    old = [version for version in list_snapshots() if version != current]
+    removed = old[:max(len(old) - max(keep - 1, 0), 0)]
+    for version in removed:
+        shutil.rmtree(os.path.join(get_snapshots_dir(), version), ignore_errors=True)
+    return removed
@@ -0,0 +1,44 @@
+# backend/ingest.py
+
+"""Offline ingestion: parse the PDFs and build a new version of the indexes.
+
+Run from the backend directory:
+
+    python ingest.py [--data-dir data] [--rebuild] [--workers N] [--batch-size N]
+
+Ingestion is incremental: only PDFs whose content hash changed since the
+last run are parsed and embedded, and vectors of deleted PDFs are removed.
+The server only loads the artifacts written here (see
+``embeddings.embedding_manager.load_retrieval_resources``).
+"""
+
+import argparse
+import logging
+import time
+from pathlib import Path
+
+from config import settings
+from embeddings.embedding_manager import sync_vectorstores
+from utils.log import configure_logging
+
+logger = logging.getLogger("ingest")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the FAISS and BM25 indexes from a directory of PDFs.")
+    parser.add_argument("--data-dir", default=settings.DATA_DIR, help="Directory containing the PDFs to ingest")
+    parser.add_argument("--rebuild", action="store_true", help="Re-embed every PDF instead of only new or changed ones")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: INGEST_WORKERS or CPU count)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks embedded per batch (default: INGEST_BATCH_SIZE)")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not any(Path(args.data_dir).rglob("*.pdf")):
+        parser.error(f"No PDFs found in {args.data_dir}")
+
+    start = time.perf_counter()
+    logger.info(f"Syncing index with PDFs in {args.data_dir}...")
+    db = sync_vectorstores(args.data_dir, rebuild=args.rebuild, workers=args.workers, batch_size=args.batch_size)
+    logger.info(f"Index holds {db.index.ntotal} chunks ({time.perf_counter() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,37 @@
 # backend/main.py
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import hmac
+import logging
 import os
-from pathlib import Path
+import json
+import time
 
-from utils.pdfProcessing import load_and_split_pdfs
-from embeddings.embedding_manager import build_or_load_vectorstores
-from chains.rag_chain import get_rag_chain, process_query, set_vectorstore, get_chat_history
+from chains.rag_chain import (
+    process_query, process_batch, stream_query, ensure_retrieval_resources, get_chat_history, answer_cache,
+    get_retrieval_resources, reload_retrieval_resources, watch_index_snapshots
+)
+from chains.batch_jobs import BatchJobStore, TooManyJobs
+from embeddings.snapshots import list_snapshots, publish_snapshot, read_current_version
+from utils.concurrency import run_blocking, shutdown_executor
+from utils.pdf_store import ensure_pdf
+from utils.history_store import get_history_store
+from utils.log import configure_logging
+from utils.metrics import REQUEST_SECONDS, render_metrics, server_timing, track_request
+from utils.scheduler import SchedulerRejected, scheduler_stats
+from utils.singleflight import singleflight_stats
+from chains.web_search import close_web_search_client, get_web_search_client
 from config import settings
-from langchain_openai import ChatOpenAI
 
 # ---------- Initialize FastAPI ----------
+configure_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="LEXGEN API")
 
 app.add_middleware(
@@ -25,11 +42,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------- Request Timing ----------
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Record request latency and, if enabled, return the per-stage breakdown as Server-Timing"""
+    start = time.perf_counter()
+    with track_request() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    # The route template, not the raw path, so /download-pdf/<file> stays one series
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.observe(elapsed, method=request.method, path=path, status=response.status_code)
+    if settings.SERVER_TIMING_HEADER:
+        response.headers["Server-Timing"] = server_timing(timings + [("total", elapsed)])
+    return response
+
 # ---------- Pydantic Schema ----------
 class QueryRequest(BaseModel):
     query: str
     category: str
     use_web: Optional[bool] = True
+    mode: Optional[Literal["multi_pass", "single_pass"]] = None  # Defaults to settings.PIPELINE_MODE
+    session_id: str = "default"
 
 class Source(BaseModel):
     name: str
@@ -42,86 +78,247 @@ class QueryResponse(BaseModel):
     sources: List[Source]
     pdf_path: Optional[str] = None
 
-# ---------- Global Resources ----------
-print("[INFO] Loading documents...")
-try:
-    chunks = load_and_split_pdfs("data")  # <-- You can replace with settings.DATA_DIR
-    vectorstore = build_or_load_vectorstores(chunks)
-    set_vectorstore(vectorstore)
-except Exception as e:
-    print(f"[ERROR] Failed to load vectorstore: {str(e)}")
-    raise RuntimeError("Failed during vectorstore initialization.")
-
-print("[INFO] Initializing LLM...")
-try:
-    llm = ChatOpenAI(
-        api_key=settings.OPENAI_API_KEY,
-        model="gpt-3.5-turbo",  # Optional: use settings.LLM_MODEL
-        temperature=0.7
-    )
-except Exception as e:
-    print(f"[ERROR] Failed to initialize LLM: {str(e)}")
-    raise RuntimeError("LLM initialization failed.")
+class BatchQuery(BaseModel):
+    query: str
+    category: str
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQuery]
+    use_web: Optional[bool] = True
+    mode: Optional[Literal["multi_pass", "single_pass"]] = None  # Defaults to settings.PIPELINE_MODE
 
-print("[INFO] Setting up QA chain...")
-try:
-    qa_chain = get_rag_chain(vectorstore, llm)
-except Exception as e:
-    print(f"[ERROR] Failed to set up RAG chain: {str(e)}")
-    raise RuntimeError("QA chain setup failed.")
+# ---------- Lifecycle ----------
+# The vectorstore and BM25 index are built offline by ingest.py and loaded
+# lazily on the first query, so startup never parses PDFs. New snapshots
+# published by ingest.py are picked up without a restart.
+index_watcher = None
 
-# Add this near the top of the file, after imports
-PDF_DIR = Path("pdfs")
-PDF_DIR.mkdir(exist_ok=True)  # Create pdfs directory if it doesn't exist
+@app.on_event("startup")
+async def startup():
+    global index_watcher
+    if settings.PRELOAD_INDEX:
+        await ensure_retrieval_resources()
+    if settings.INDEX_WATCH_INTERVAL_SECONDS > 0:
+        index_watcher = asyncio.create_task(watch_index_snapshots(settings.INDEX_WATCH_INTERVAL_SECONDS))
+
+@app.on_event("shutdown")
+async def shutdown():
+    if index_watcher is not None:
+        index_watcher.cancel()
+    batch_jobs.cancel_all()
+    await close_web_search_client()
+    shutdown_executor()
+    get_history_store().close()
+
+# ---------- Load Shedding ----------
+def rejection_error(e: SchedulerRejected) -> HTTPException:
+    """503 (overloaded) or 429 (provider quota used up) with a Retry-After hint"""
+    logger.warning(f"Shedding query: {str(e)}")
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 # ---------- Query Endpoint ----------
+def format_query_response(response: dict) -> dict:
+    """Shape a pipeline result for the API: defaults for missing sections, PDF file name only"""
+    # Ensure response is a dictionary
+    if not isinstance(response, dict):
+        raise HTTPException(status_code=500, detail="Invalid response format")
+
+    # Handle PDF path if it exists
+    if "pdf_path" in response and response["pdf_path"]:
+        # Ensure the PDF is in the correct directory
+        pdf_filename = os.path.basename(response["pdf_path"])
+        response["pdf_path"] = pdf_filename  # Store only the filename
+
+    # Format the response with default values
+    formatted_response = {
+        "legal_analysis": str(response.get("legal_analysis", "No legal analysis available")),
+        "additional_context": str(response.get("additional_context", "No additional context available")),
+        "punishments_and_fines": str(response.get("punishments_and_fines", "No information about punishments and fines available")),
+        "sources": response.get("sources", []),
+        "pdf_path": response.get("pdf_path")
+    }
+
+    # Validate the response structure
+    if not all(isinstance(formatted_response[field], str) for field in ["legal_analysis", "additional_context", "punishments_and_fines"]):
+        raise HTTPException(status_code=500, detail="Invalid response structure")
+
+    return formatted_response
+
 @app.post("/query", response_model=QueryResponse)
 async def query_endpoint(request: QueryRequest):
     try:
         response = await process_query(
             query=request.query,
             category=request.category,
-            use_web=request.use_web
+            use_web=request.use_web,
+            mode=request.mode,
+            session_id=request.session_id
         )
-        
-        # Ensure response is a dictionary
-        if not isinstance(response, dict):
-            response = {"error": "Invalid response format from process_query"}
-            raise HTTPException(status_code=500, detail="Invalid response format")
-
-        # Handle PDF path if it exists
-        if "pdf_path" in response and response["pdf_path"]:
-            # Ensure the PDF is in the correct directory
-            pdf_filename = os.path.basename(response["pdf_path"])
-            response["pdf_path"] = pdf_filename  # Store only the filename
-
-        # Format the response with default values
-        formatted_response = {
-            "legal_analysis": str(response.get("legal_analysis", "No legal analysis available")),
-            "additional_context": str(response.get("additional_context", "No additional context available")),
-            "punishments_and_fines": str(response.get("punishments_and_fines", "No information about punishments and fines available")),
-            "sources": response.get("sources", []),
-            "pdf_path": response.get("pdf_path")
-        }
-
-        # Validate the response structure
-        if not all(isinstance(formatted_response[field], str) for field in ["legal_analysis", "additional_context", "punishments_and_fines"]):
-            raise HTTPException(status_code=500, detail="Invalid response structure")
-
-        return formatted_response
+        return format_query_response(response)
 
+    except SchedulerRejected as e:
+        raise rejection_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ---------- Streaming Query Endpoint ----------
+def format_sse(event: str, data) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    """Stream the answer as Server-Sent Events.
+
+    Events: ``sources`` (as soon as retrieval finishes), ``web_sources``
+    (once the web search returns), ``section`` and ``token`` while the
+    answer is generated, then ``done`` with the same fields as ``/query``,
+    or ``error`` if the pipeline fails. A query shed
+    by admission control gets a 503/429 response instead of a stream.
+    """
+    events = stream_query(
+        query=request.query,
+        category=request.category,
+        use_web=request.use_web,
+        session_id=request.session_id
+    )
+    # Run up to the first event before responding, so shedding can still set the status
+    first, error = None, None
+    try:
+        first = await events.__anext__()
+    except SchedulerRejected as e:
+        raise rejection_error(e)
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        error = e
+
+    async def event_stream():
+        try:
+            if error is not None:
+                raise error
+            event = first
+            while event is not None:
+                name, data = event
+                if name == "done" and data.get("pdf_path"):
+                    data["pdf_path"] = os.path.basename(data["pdf_path"])
+                yield format_sse(name, data)
+                event = await anext(events, None)
+        except Exception as e:
+            logger.error(f"Streaming query failed: {str(e)}")
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ---------- Batch Query Endpoints ----------
+# Spreadsheets of questions: one embedding call and one FAISS search for the
+# whole batch, identical questions answered once, LLM stages in parallel
+batch_jobs = BatchJobStore(max_jobs=settings.BATCH_MAX_JOBS, ttl_seconds=settings.BATCH_JOB_TTL_SECONDS)
+
+def batch_events(request: BatchQueryRequest):
+    if not request.queries:
+        raise HTTPException(status_code=422, detail="No queries given")
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch")
+    return process_batch(
+        [(item.query, item.category) for item in request.queries],
+        use_web=request.use_web,
+        mode=request.mode
+    )
+
+@app.post("/query/batch")
+async def query_batch_endpoint(request: BatchQueryRequest):
+    """Answer a batch of queries, streaming Server-Sent Events as answers finish.
+
+    Events: ``result`` (the ``/query`` fields plus the query's ``index`` in
+    the batch) or ``error`` (``index`` and ``detail``) for every query, in
+    completion order, then ``done`` with the counts.
+    """
+    events = batch_events(request)
+
+    async def event_stream():
+        succeeded = failed = 0
+        try:
+            async for index, result, error in events:
+                if error is None:
+                    succeeded += 1
+                    yield format_sse("result", {"index": index, **format_query_response(result)})
+                else:
+                    failed += 1
+                    yield format_sse("error", {"index": index, "detail": error})
+            yield format_sse("done", {"total": len(request.queries), "succeeded": succeeded, "failed": failed})
+        except Exception as e:
+            logger.error(f"Batch query failed: {str(e)}")
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch/jobs", status_code=202)
+async def submit_batch_job(request: BatchQueryRequest):
+    """Run a batch in the background; poll ``GET /query/batch/jobs/{job_id}`` for its results"""
+    events = batch_events(request)
+    try:
+        job = batch_jobs.submit(len(request.queries), events)
+    except TooManyJobs as e:
+        await events.aclose()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "60"})
+    return {"job_id": job.id, "status": job.status, "total": job.total}
+
+@app.get("/query/batch/jobs/{job_id}")
+async def batch_job_status(job_id: str):
+    """A job's status and the results finished so far, in batch order"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch job not found. It may have expired: {job_id}")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "error": job.error,
+        "total": job.total,
+        "completed": job.completed,
+        "results": [{"index": index, **format_query_response(dict(job.results[index]))} for index in sorted(job.results)],
+        "errors": [{"index": index, "detail": job.errors[index]} for index in sorted(job.errors)]
+    }
+
 # ---------- Chat History Endpoint ----------
 @app.get("/chat-history")
-async def get_chat_history():
+async def chat_history_endpoint(
+    session_id: str = "default",
+    cursor: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """One page of a session's history, newest first; pass ``next_cursor`` back as ``cursor``"""
     try:
-        return get_chat_history()
+        return await run_blocking(get_chat_history, session_id, cursor, limit)
     except Exception as e:
-        print(f"[ERROR] Failed to get chat history: {str(e)}")
+        logger.error(f"Failed to get chat history: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve chat history")
 
+# ---------- Cache Stats Endpoint ----------
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "web_search": get_web_search_client().stats(),
+        "coalescing": singleflight_stats(),
+        "scheduling": scheduler_stats(),
+        "batch_jobs": batch_jobs.stats()
+    }
+
+# ---------- Metrics Endpoint ----------
+@app.get("/metrics")
+async def metrics():
+    """Stage and request latency histograms and LLM token counts, in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ---------- PDF Download Endpoint ----------
 @app.get("/download-pdf/{pdf_path}")
 async def download_pdf(pdf_path: str):
@@ -129,14 +326,14 @@ async def download_pdf(pdf_path: str):
         # Clean the path to prevent directory traversal
         pdf_path = os.path.basename(pdf_path)
         
-        # Construct the full path
-        full_path = PDF_DIR / pdf_path
+        # Render the PDF on first download
+        full_path = await run_blocking(ensure_pdf, pdf_path)
         
-        if not full_path.exists():
-            print(f"[ERROR] PDF not found at path: {full_path}")
+        if full_path is None:
+            logger.error(f"PDF not found: {pdf_path}")
             raise HTTPException(
                 status_code=404, 
-                detail=f"PDF file not found. Please ensure the file exists at: {pdf_path}"
+                detail=f"PDF file not found. It may have expired: {pdf_path}"
             )
             
         return FileResponse(
@@ -147,6 +344,46 @@ async def download_pdf(pdf_path: str):
                 "Content-Disposition": f"attachment; filename=legal_response.pdf"
             }
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to download PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ---------- Admin Endpoints ----------
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Without a configured token the admin endpoints do not exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+async def index_status():
+    current = get_retrieval_resources()
+    return {
+        "serving_version": current.version if current else None,
+        "current_version": read_current_version(),
+        "snapshots": list_snapshots(),
+        "categories": current.partitions.categories() if current and current.partitions else None
+    }
+
+@app.post("/admin/reload-index", dependencies=[Depends(require_admin)])
+async def reload_index(version: Optional[str] = None):
+    """Load a snapshot in the background and swap it in without dropping queries.
+
+    Without ``version`` the CURRENT snapshot is loaded; with one (e.g. to roll
+    back) that snapshot is first made CURRENT. This worker swaps immediately,
+    the others within INDEX_WATCH_INTERVAL_SECONDS.
+    """
+    if version is not None and version not in list_snapshots():
+        raise HTTPException(status_code=404, detail=f"Unknown index snapshot: {version}")
+    try:
+        if version is not None:
+            await run_blocking(publish_snapshot, version)
+        return await reload_retrieval_resources(version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        print(f"[ERROR] Failed to download PDF: {str(e)}")
+        logger.error(f"Failed to reload index: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
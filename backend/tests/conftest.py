@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other from the backend directory (``from config import settings``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import math
+import numpy as np
+import pytest
+from embeddings.bm25_index import BM25Index, tokenize
+
+TEXTS = [
+    "Whoever commits theft shall be punished with imprisonment.",
+    "Theft of a motor vehicle: the vehicle is seized.",
+    "Murder is punished with death or imprisonment for life.",
+    "The court may impose a fine.",
+    "",
+]
+IDS = [f"chunk-{i}" for i in range(len(TEXTS))]
+
+def reference_scores(texts, query, k1=1.5, b=0.75, epsilon=0.25):
+    """Okapi BM25 computed term by term, as rank_bm25.BM25Okapi does"""
+    docs = [tokenize(text) for text in texts]
+    avgdl = sum(len(doc) for doc in docs) / len(docs)
+    doc_freqs = {}
+    for doc in docs:
+        for term in set(doc):
+            doc_freqs[term] = doc_freqs.get(term, 0) + 1
+    idf = {term: math.log(len(docs) - df + 0.5) - math.log(df + 0.5) for term, df in doc_freqs.items()}
+    floor = epsilon * sum(idf.values()) / len(idf)
+    idf = {term: floor if value < 0 else value for term, value in idf.items()}
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in tokenize(query):
+            tf = doc.count(term)
+            score += idf.get(term, 0.0) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return np.array(scores)
+
+@pytest.fixture(scope="module")
+def index():
+    return BM25Index.build(TEXTS, IDS)
+
+@pytest.mark.parametrize("query", ["theft", "Theft punished with imprisonment", "vehicle vehicle", "the fine"])
+def test_scores_match_reference(index, query):
+    np.testing.assert_allclose(index.get_scores(query), reference_scores(TEXTS, query), rtol=1e-5, atol=1e-6)
+
+def test_unknown_terms_score_zero(index):
+    assert not index.get_scores("defamation").any()
+    assert not index.get_scores("").any()
+
+def test_scores_restricted_to_rows(index):
+    full = index.get_scores("theft imprisonment")
+    np.testing.assert_array_equal(index.get_scores("theft imprisonment", rows=[2, 0]), full[[2, 0]])
+
+def test_top_k(index):
+    rows, scores = index.top_k("theft imprisonment", 2)
+    assert rows.tolist() == [0, 1]
+    assert scores[0] > scores[1] > 0
+    assert len(index.top_k("theft", 100)[0]) == len(TEXTS)
+
+def test_top_k_among_rows_returns_index_rows(index):
+    rows, _ = index.top_k("theft imprisonment", 2, rows=[1, 2, 3])
+    assert rows.tolist() == [1, 2]
+    assert len(index.top_k("theft", 5, rows=[])[0]) == 0
+
+def test_empty_corpus():
+    empty = BM25Index.build([], [])
+    assert empty.num_docs == 0
+    assert len(empty.get_scores("theft")) == 0
+
+def test_save_and_load(index, tmp_path):
+    path = str(tmp_path / "bm25_index")
+    index.save(path)
+    index.save(path)  # Overwrites in place
+    for mmap in (False, True):
+        loaded = BM25Index.load(path, mmap=mmap)
+        assert loaded.docstore_ids.tolist() == IDS
+        np.testing.assert_array_equal(loaded.get_scores("theft vehicle"), index.get_scores("theft vehicle"))
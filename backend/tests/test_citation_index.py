@@ -0,0 +1,86 @@
+import pytest
+from embeddings.citation_index import CitationIndex, chunk_citations, defined_provisions, parse_query
+
+IPC_TEXTS = [
+    "THE INDIAN PENAL CODE, 1860\nACT NO. 45 OF 1860\nThis section and the next section extend the Code to India.",
+    "302. Punishment for murder.--Whoever commits murder shall be punished with death, or imprisonment for life.",
+    "and shall also be liable to fine, as the court may decide in the circumstances of the case.",
+    "307. Attempt to murder.--Whoever does any act with such intention, see Section 302 and Section 300.",
+    "The guidelines laid down in (2015) 5 SCC 1 and AIR 1978 SC 597 apply to every section of this Code.",
+]
+MV_TEXTS = [
+    "THE MOTOR VEHICLES ACT, 1988\nAn Act to consolidate the law relating to motor vehicles; see section 2.",
+    "138. Power of State Government to make rules.--The State Government may make rules for this section.",
+]
+
+@pytest.fixture(scope="module")
+def index():
+    texts = IPC_TEXTS + MV_TEXTS
+    sources = ["ipc.pdf"] * len(IPC_TEXTS) + ["mv.pdf"] * len(MV_TEXTS)
+    return CitationIndex.build(texts, sources)
+
+def act_id(index, name):
+    return index.acts.index(name)
+
+def test_chunk_parsing():
+    assert defined_provisions(IPC_TEXTS[1]) == ["302"]
+    assert chunk_citations(IPC_TEXTS[3]) == {"section:302", "section:300"}
+    assert chunk_citations(IPC_TEXTS[4]) == {"case:2015 5 scc 1", "case:air 1978 sc 597"}
+
+def test_acts_are_read_from_titles(index):
+    assert sorted(index.acts) == ["indian penal code", "motor vehicles act"]
+
+def test_parse_query(index):
+    parsed = parse_query("What is Section 302 IPC?", index.acts)
+    assert parsed.keys == ["section:302"]
+    assert parsed.act == act_id(index, "indian penal code")
+    assert parsed.other_terms == []
+    assert not parsed.unknown_act
+
+    assert parse_query("Sections 378 and 379", index.acts).keys == ["section:378", "section:379"]
+    assert parse_query("u/s 66A", index.acts).keys == ["section:66A"]
+    assert parse_query("Art. 21 right to life", index.acts).keys == ["article:21"]
+    assert parse_query("(2015) 5 SCC 1", index.acts).keys == ["case:2015 5 scc 1"]
+
+def test_lookup_ranks_defining_chunks_first(index):
+    rows = index.lookup(["section:302"])
+    assert rows[0] == 1
+    # The chunk citing it and the chunk continuing its text follow
+    assert set(rows[1:]) == {2, 3}
+
+def test_lookup_case_citation(index):
+    assert index.lookup(["case:air 1978 sc 597"]) == [4]
+
+def test_lookup_only_returns_rows_of_the_named_act(index):
+    assert index.lookup(["section:138"], act=act_id(index, "motor vehicles act")) == [6]
+    assert index.lookup(["section:138"], act=act_id(index, "indian penal code")) == []
+
+def test_lookup_restricted_to_rows(index):
+    assert index.lookup(["section:302"], rows=[3, 6]) == [3]
+
+@pytest.mark.parametrize("query", ["section 302 crpc", "Section 138 NI Act", "Section 302 of the Code of Civil Procedure"])
+def test_query_naming_an_unindexed_act(index, query):
+    parsed = parse_query(query, index.acts)
+    assert parsed.act is None
+    assert parsed.unknown_act
+
+@pytest.mark.parametrize("query", ["section 302", "Section 302 IPC", "section 138 of the motor vehicles act"])
+def test_query_naming_no_or_an_indexed_act(index, query):
+    assert not parse_query(query, index.acts).unknown_act
+
+def test_retriever_skips_lookup_for_unindexed_act(index):
+    from chains.rag_chain import HybridRetriever
+
+    retriever = HybridRetriever(vectorstore=None, citations=index)
+    assert retriever._lookup_citations("section 302 crpc") == ([], False)
+    assert retriever._lookup_citations("Section 138 NI Act") == ([], False)
+    rows, exact = retriever._lookup_citations("Section 302 IPC")
+    assert rows[0] == 1 and exact
+
+def test_save_and_load(index, tmp_path):
+    path = str(tmp_path / "citation_index")
+    index.save(path)
+    for mmap in (False, True):
+        loaded = CitationIndex.load(path, mmap=mmap)
+        assert loaded.acts == index.acts
+        assert loaded.lookup(["section:302"]) == index.lookup(["section:302"])
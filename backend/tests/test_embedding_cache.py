@@ -0,0 +1,113 @@
+import os
+import threading
+import numpy as np
+import pytest
+from embeddings.embedding_cache import KEY_LINE_BYTES, CachedEmbeddings
+
+class CountingEmbeddings:
+    """Deterministic 3-d vectors, recording every text sent to the model"""
+
+    def __init__(self):
+        self.seen = []
+
+    @staticmethod
+    def vector(text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 0.5]
+
+    def embed_documents(self, texts):
+        self.seen.extend(texts)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.vector(text)
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "embedding_cache")
+
+def test_only_misses_are_embedded(cache_dir):
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base, cache_dir)
+    assert cache.embed_documents(["a", "bb", "a"]) == [base.vector(t) for t in ["a", "bb", "a"]]
+    assert base.seen == ["a", "bb"]
+    assert cache.embed_documents(["bb", "ccc"]) == [base.vector("bb"), base.vector("ccc")]
+    assert base.seen == ["a", "bb", "ccc"]
+    assert cache.size == 3
+    assert cache.embed_documents([]) == []
+
+def test_misses_are_embedded_in_batches(cache_dir):
+    calls = []
+
+    class Recording(CountingEmbeddings):
+        def embed_documents(self, texts):
+            calls.append(len(texts))
+            return super().embed_documents(texts)
+
+    CachedEmbeddings(Recording(), cache_dir, batch_size=2).embed_documents([str(i) for i in range(5)])
+    assert calls == [2, 2, 1]
+
+def test_queries_are_not_cached(cache_dir):
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base, cache_dir)
+    assert cache.embed_query("q") == base.vector("q")
+    assert cache.size == 0
+
+def test_cache_persists_across_instances(cache_dir):
+    CachedEmbeddings(CountingEmbeddings(), cache_dir).embed_documents(["a", "bb"])
+    base = CountingEmbeddings()
+    reopened = CachedEmbeddings(base, cache_dir)
+    assert reopened.size == 2
+    assert reopened.embed_documents(["bb", "a"]) == [base.vector("bb"), base.vector("a")]
+    assert base.seen == []
+
+def test_float16_cache(cache_dir):
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base, cache_dir, dtype="float16")
+    cache.embed_documents(["a", "bb"])
+    assert os.path.getsize(os.path.join(cache_dir, "vectors.bin")) == 2 * 3 * 2
+    reopened = CachedEmbeddings(CountingEmbeddings(), cache_dir, dtype="float32")
+    np.testing.assert_allclose(reopened.embed_documents(["bb"])[0], base.vector("bb"), rtol=1e-3)
+
+def test_instances_sharing_a_directory_see_each_others_rows(cache_dir):
+    first = CachedEmbeddings(CountingEmbeddings(), cache_dir)
+    second = CachedEmbeddings(CountingEmbeddings(), cache_dir)
+    first.embed_documents(["a"])
+    second.embed_documents(["bb", "a"])  # "a" was cached by the other instance meanwhile
+    first.embed_documents(["ccc"])
+    with open(os.path.join(cache_dir, "keys.txt")) as f:
+        keys = f.read().split()
+    assert len(keys) == len(set(keys)) == 3
+    base = CountingEmbeddings()
+    reopened = CachedEmbeddings(base, cache_dir)
+    assert reopened.embed_documents(["a", "bb", "ccc"]) == [base.vector(t) for t in ["a", "bb", "ccc"]]
+
+def test_concurrent_threads(cache_dir):
+    base = CountingEmbeddings()
+    cache = CachedEmbeddings(base, cache_dir, batch_size=3)
+    texts = [f"text {i}" for i in range(50)]
+    results = {}
+
+    def work(worker):
+        results[worker] = cache.embed_documents(texts[worker::2] + texts[:10])
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for worker, vectors in results.items():
+        assert vectors == [base.vector(t) for t in texts[worker::2] + texts[:10]]
+    assert cache.size == 50
+
+def test_partially_written_tail_is_dropped(cache_dir):
+    CachedEmbeddings(CountingEmbeddings(), cache_dir).embed_documents(["a", "bb"])
+    # A crash after writing a vector row but before its key, and mid-way through a key line
+    with open(os.path.join(cache_dir, "vectors.bin"), "ab") as f:
+        f.write(np.zeros(3, dtype=np.float32).tobytes())
+    with open(os.path.join(cache_dir, "keys.txt"), "ab") as f:
+        f.write(b"0123")
+    base = CountingEmbeddings()
+    reopened = CachedEmbeddings(base, cache_dir)
+    assert reopened.size == 2
+    assert os.path.getsize(os.path.join(cache_dir, "keys.txt")) == 2 * KEY_LINE_BYTES
+    assert reopened.embed_documents(["ccc", "a"]) == [base.vector("ccc"), base.vector("a")]
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from config import settings
+from embeddings.partitions import CategoryPartitions, category_for_file
+
+@pytest.fixture
+def partitions():
+    rows = {settings.DEFAULT_CATEGORY: np.array([0, 1]), "ipc": np.array([2, 3]), "mv": np.array([4])}
+    return CategoryPartitions(rows, 5)
+
+def test_category_for_file():
+    assert category_for_file("IPC/ipc.pdf") == "ipc"
+    assert category_for_file("constitution.pdf") == settings.DEFAULT_CATEGORY
+
+def test_lookup_includes_general_rows(partitions):
+    rows, selector = partitions.lookup(" IPC ")
+    assert rows.tolist() == [0, 1, 2, 3]
+    assert partitions.lookup("ipc")[1] is selector
+
+def test_general_and_unknown_categories_search_everything(partitions):
+    assert partitions.lookup(None) is None
+    assert partitions.lookup(settings.DEFAULT_CATEGORY) is None
+    assert partitions.lookup("unknown") is None
+
+def test_unknown_categories_are_not_cached(partitions):
+    for i in range(100):
+        partitions.lookup(f"category {i}")
+    partitions.lookup("mv")
+    assert set(partitions._resolved) == {"mv"}
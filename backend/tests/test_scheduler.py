@@ -0,0 +1,221 @@
+import asyncio
+import httpx
+import pytest
+from utils import scheduler as scheduler_module
+from utils.scheduler import (
+    CallScheduler, QueueFull, QueueTimeout, RateLimited, TokenBucket, is_retryable, request_priority,
+)
+
+class ProviderError(Exception):
+    def __init__(self, status_code, code=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.code = code
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Manually advanced stand-in for time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now[0])
+    return now
+
+async def hold(scheduler, held: asyncio.Event, release: asyncio.Event):
+    async with scheduler.slot():
+        held.set()
+        await release.wait()
+
+# --- Token Buckets ---
+def test_token_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60)  # One token per second
+    assert bucket.reserve(60) == 0
+    assert bucket.wait_time(30) == pytest.approx(30)
+    clock[0] += 10
+    assert bucket.wait_time(30) == pytest.approx(20)
+    clock[0] += 1000
+    assert bucket.wait_time(60) == 0  # Never refills past its capacity
+
+def test_token_bucket_reservations_run_into_debt(clock):
+    bucket = TokenBucket(60)
+    bucket.reserve(60)
+    assert bucket.reserve(6) == pytest.approx(6)
+    assert bucket.wait_time(6) == pytest.approx(12)
+    # A call larger than the whole quota waits for a full bucket, not forever
+    assert bucket.wait_time(1000) == pytest.approx(bucket.wait_time(60))
+
+# --- Admission ---
+def test_concurrency_limit():
+    async def main():
+        scheduler = CallScheduler("test", max_concurrency=2)
+        running, peak = 0, 0
+
+        async def call():
+            nonlocal running, peak
+            async with scheduler.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak, scheduler.stats()
+
+    peak, stats = asyncio.run(main())
+    assert peak == 2
+    assert stats["calls"] == 6 and stats["active"] == 0 and stats["queued"] == 0
+
+def test_waiters_run_by_priority_then_request_start():
+    async def main():
+        scheduler = CallScheduler("test", max_concurrency=1)
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, held, release))
+        await held.wait()
+        order = []
+
+        async def call(name, priority):
+            with request_priority(priority):
+                async with scheduler.slot():
+                    order.append(name)
+
+        calls = []
+        for name, priority in [("batch", 2), ("default", 1), ("interactive", 0), ("default later", 1)]:
+            calls.append(asyncio.create_task(call(name, priority)))
+            await asyncio.sleep(0.001)
+        release.set()
+        await asyncio.gather(holder, *calls)
+        return order
+
+    assert asyncio.run(main()) == ["interactive", "default", "default later", "batch"]
+
+def test_admit_sheds_requests_when_queue_is_full():
+    async def main():
+        scheduler = CallScheduler("test", max_concurrency=1, max_queue=1)
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, held, release))
+        await held.wait()
+        waiter = asyncio.create_task(scheduler.run(asyncio.sleep, 0))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFull) as admit_error:
+            scheduler.admit()
+        # Calls of requests that were never admitted are shed too
+        with pytest.raises(QueueFull):
+            await scheduler.run(asyncio.sleep, 0)
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return admit_error.value, scheduler.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.status_code == 503 and error.retry_after >= 1
+    assert stats["queue_full"] == 2
+
+def test_calls_of_admitted_requests_queue_past_the_limit():
+    async def main():
+        scheduler = CallScheduler("test", max_concurrency=1, max_queue=1)
+        scheduler.admit()
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, held, release))
+        await held.wait()
+        calls = [asyncio.create_task(scheduler.run(asyncio.sleep, 0)) for _ in range(3)]
+        await asyncio.sleep(0)
+        queued = scheduler.stats()["queued"]
+        release.set()
+        await asyncio.gather(holder, *calls)
+        return queued, scheduler.stats()
+
+    queued, stats = asyncio.run(main())
+    assert queued == 3
+    assert stats["calls"] == 4 and stats["queue_full"] == 0
+
+def test_queue_timeout():
+    async def main():
+        scheduler = CallScheduler("test", max_concurrency=1, queue_timeout=0.02)
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, held, release))
+        await held.wait()
+        with pytest.raises(QueueTimeout):
+            async with scheduler.slot():
+                pass
+        stats = scheduler.stats()
+        release.set()
+        await holder
+        return stats, scheduler.stats()
+
+    during, after = asyncio.run(main())
+    assert during["queue_timeout"] == 1 and during["queued"] == 0
+    assert after["active"] == 0
+
+def test_rate_limited_calls_are_rejected_with_429():
+    async def main():
+        scheduler = CallScheduler("test", queue_timeout=1.0, requests_per_minute=1, tokens_per_minute=1000)
+        await scheduler.run(asyncio.sleep, 0)
+        with pytest.raises(RateLimited) as admit_error:
+            scheduler.admit()
+        with pytest.raises(RateLimited):
+            await scheduler.run(asyncio.sleep, 0)
+        return admit_error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 429
+    assert 1 < error.retry_after <= 60
+
+def test_token_quota_is_checked_at_admission():
+    scheduler = CallScheduler("test", queue_timeout=1.0, tokens_per_minute=1000)
+    scheduler.admit(cost=500)
+    scheduler._tokens.reserve(1000)
+    with pytest.raises(RateLimited):
+        scheduler.admit(cost=500)
+
+# --- Retries ---
+def test_transient_errors_are_retried():
+    async def main():
+        scheduler = CallScheduler("test", max_retries=3, backoff=0.001)
+        errors = [httpx.ConnectError("refused"), ProviderError(503)]
+
+        async def call():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        return await scheduler.run(call), scheduler.stats()
+
+    result, stats = asyncio.run(main())
+    assert result == "ok" and stats["retries"] == 2
+
+def test_permanent_errors_are_not_retried():
+    async def main():
+        scheduler = CallScheduler("test", max_retries=3, backoff=0.001)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            raise ProviderError(400)
+
+        with pytest.raises(ProviderError):
+            await scheduler.run(call)
+        return attempts
+
+    assert asyncio.run(main()) == 1
+
+def test_persistent_rate_limit_raises_rate_limited():
+    async def main():
+        scheduler = CallScheduler("test", max_retries=1, backoff=0.001)
+
+        async def call():
+            raise ProviderError(429)
+
+        await scheduler.run(call)
+
+    with pytest.raises(RateLimited):
+        asyncio.run(main())
+
+@pytest.mark.parametrize("error, retryable", [
+    (ProviderError(429), True),
+    (ProviderError(502), True),
+    (ProviderError(404), False),
+    (ProviderError(429, code="insufficient_quota"), False),
+    (asyncio.TimeoutError(), True),
+    (QueueFull("test"), False),
+    (ValueError("bad"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
@@ -0,0 +1,54 @@
+"""Concurrency model for the query pipeline.
+
+Every request is served on the single uvicorn event loop, which must never
+block:
+
+- LLM calls go through ``ChatOpenAI``'s native async client (``ainvoke``), and
+  SerpAPI calls through a shared ``httpx.AsyncClient``
+  (``chains.web_search``), so waiting on either provider costs no thread at
+  all.
+- Blocking or CPU-bound work (query embedding, FAISS search, BM25 scoring)
+  runs on one shared, bounded thread pool of
+  ``settings.BLOCKING_POOL_WORKERS`` threads. NumPy, FAISS and the embedding
+  model release the GIL for their heavy lifting, so these threads do run in
+  parallel.
+
+A single worker therefore keeps many queries in flight at once: concurrency
+is bounded by the pool size for blocking stages and only by the provider for
+LLM stages.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+
+_executor: ThreadPoolExecutor | None = None
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared pool for blocking work, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BLOCKING_POOL_WORKERS,
+            thread_name_prefix="blocking",
+        )
+    return _executor
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the shared pool without blocking the event loop.
+
+    The callable runs in a copy of the caller's context, so its timing spans
+    are attributed to the caller's request.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+def shutdown_executor():
+    """Stop the shared pool; called on application shutdown"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
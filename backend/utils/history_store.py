@@ -0,0 +1,137 @@
+"""Chat-history storage.
+
+``ChatHistoryStore`` is the pluggable interface; ``SQLiteChatHistoryStore``
+is the default and is shared by every worker that points at the same file,
+while ``InMemoryChatHistoryStore`` suits tests and single-process runs.
+Both keep at most ``max_per_session`` entries per session and page newest
+first with an opaque integer cursor (the id of the last entry returned).
+"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional
+from config import settings
+
+class ChatHistoryStore(ABC):
+    @abstractmethod
+    def append(self, session_id: str, query: str, response: str):
+        """Record one interaction"""
+
+    @abstractmethod
+    def page(self, session_id: str, cursor: Optional[int] = None, limit: int = 20):
+        """Return ``(items, next_cursor)``, newest first; ``next_cursor`` is None on the last page"""
+
+    def close(self):
+        pass
+
+class InMemoryChatHistoryStore(ChatHistoryStore):
+    def __init__(self, max_per_session: int = 200):
+        self.max_per_session = max_per_session
+        self._sessions = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def append(self, session_id: str, query: str, response: str):
+        with self._lock:
+            entries = self._sessions.setdefault(session_id, deque(maxlen=self.max_per_session))
+            entries.append({"id": self._next_id, "query": query, "response": response, "created_at": time.time()})
+            self._next_id += 1
+
+    def page(self, session_id: str, cursor: Optional[int] = None, limit: int = 20):
+        with self._lock:
+            entries = list(self._sessions.get(session_id, ()))
+        newer_first = [entry for entry in reversed(entries) if cursor is None or entry["id"] < cursor]
+        items = newer_first[:limit]
+        next_cursor = items[-1]["id"] if len(newer_first) > limit else None
+        return items, next_cursor
+
+class SQLiteChatHistoryStore(ChatHistoryStore):
+    def __init__(self, path: str, max_per_session: int = 200, max_age_seconds: Optional[float] = None):
+        self.path = path
+        self.max_per_session = max_per_session
+        self.max_age_seconds = max_age_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS chat_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_session ON chat_history (session_id, id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers and the writer proceed together
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, query: str, response: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO chat_history (session_id, query, response, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, query, response, now),
+            )
+            # Keep only the newest max_per_session entries of this session
+            conn.execute(
+                """DELETE FROM chat_history WHERE session_id = ? AND id <= (
+                    SELECT id FROM chat_history WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+                )""",
+                (session_id, session_id, self.max_per_session),
+            )
+            if self.max_age_seconds:
+                conn.execute(
+                    "DELETE FROM chat_history WHERE session_id = ? AND created_at < ?",
+                    (session_id, now - self.max_age_seconds),
+                )
+
+    def page(self, session_id: str, cursor: Optional[int] = None, limit: int = 20):
+        conn = self._connect()
+        rows = conn.execute(
+            """SELECT id, query, response, created_at FROM chat_history
+               WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?""",
+            (session_id, cursor if cursor is not None else 2 ** 63 - 1, limit + 1),
+        ).fetchall()
+        items = [
+            {"id": row[0], "query": row[1], "response": row[2], "created_at": row[3]}
+            for row in rows[:limit]
+        ]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return items, next_cursor
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+_store: Optional[ChatHistoryStore] = None
+
+def get_history_store() -> ChatHistoryStore:
+    """Return the configured chat-history store, creating it on first use"""
+    global _store
+    if _store is None:
+        if settings.CHAT_HISTORY_BACKEND == "memory":
+            _store = InMemoryChatHistoryStore(settings.CHAT_HISTORY_MAX_PER_SESSION)
+        else:
+            _store = SQLiteChatHistoryStore(
+                settings.CHAT_HISTORY_DB_PATH,
+                max_per_session=settings.CHAT_HISTORY_MAX_PER_SESSION,
+                max_age_seconds=settings.CHAT_HISTORY_MAX_AGE_SECONDS,
+            )
+    return _store
+
+def set_history_store(store: ChatHistoryStore):
+    global _store
+    _store = store
@@ -0,0 +1,9 @@
+"""Logging setup shared by the server and the command-line tools"""
+
+import logging
+from typing import Optional
+from config import settings
+
+def configure_logging(level: Optional[str] = None):
+    """Log to stderr as ``[LEVEL] message`` at ``level`` (default: LOG_LEVEL)"""
+    logging.basicConfig(level=(level or settings.LOG_LEVEL).upper(), format="[%(levelname)s] %(message)s")
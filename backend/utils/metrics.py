@@ -0,0 +1,179 @@
+"""Latency histograms and counters for the query pipeline.
+
+Pipeline stages are timed with ``span``:
+
+    with span("faiss_search"):
+        ...
+
+Every span is recorded in the ``lexgen_stage_duration_seconds`` histogram.
+While a request is being served inside ``track_request``, spans are also
+added to that request's timing breakdown, which main.py returns as a
+``Server-Timing`` header. The breakdown follows the request into tasks it
+starts and into ``run_blocking`` calls, which copy the current context.
+
+Metrics are kept per process and rendered in the Prometheus text format by
+``render_metrics`` (served at ``/metrics``). With several uvicorn workers,
+each scrape sees the worker that answered it.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+INF_BUCKET = 'le="+Inf"'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+# --- Metric Types ---
+class Counter:
+    """Monotonic counter, one series per label combination"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def totals(self) -> Dict[tuple, Tuple[int, float]]:
+        """``(count, sum)`` of every series, keyed by its label values"""
+        with self._lock:
+            return {key: (series[-1], series[-2]) for key, series in self._series.items()}
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, INF_BUCKET)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+# --- Registry ---
+_registry: Dict[str, object] = {}
+
+def counter(name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+    """Return the named counter, creating it on first use"""
+    if name not in _registry:
+        _registry[name] = Counter(name, documentation, label_names)
+    return _registry[name]
+
+def histogram(name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Return the named histogram, creating it on first use"""
+    if name not in _registry:
+        _registry[name] = Histogram(name, documentation, label_names, buckets)
+    return _registry[name]
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = histogram(
+    "lexgen_stage_duration_seconds", "Duration of query pipeline stages", ("stage",)
+)
+LLM_TOKENS = counter(
+    "lexgen_llm_tokens_total", "LLM tokens by call and direction (prompt or completion)", ("call", "direction")
+)
+REQUEST_SECONDS = histogram(
+    "lexgen_request_duration_seconds", "HTTP request duration until the response headers", ("method", "path", "status")
+)
+
+# --- Spans ---
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as ``stage`` (also usable as a function decorator)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def record_llm_tokens(call: str, prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.inc(prompt_tokens, call=call, direction="prompt")
+    LLM_TOKENS.inc(completion_tokens, call=call, direction="completion")
+
+@contextmanager
+def track_request():
+    """Collect the spans of the current request; yields the list they are appended to"""
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+def server_timing(timings: list) -> str:
+    """``Server-Timing`` header value; repeated stages are summed"""
+    durations = {}
+    for stage, seconds in list(timings):
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items())
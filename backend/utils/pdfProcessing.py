@@ -1,13 +1,36 @@
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pathlib import Path
-
-def load_and_split_pdfs(pdf_dir:str):
-    documents = []
-    for file in Path(pdf_dir).glob("*.pdf"):
-        loader = PyPDFLoader(str(file))
-        docs = loader.load()
-        documents.extend(docs)
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    chunks = splitter.split_documents(documents)
-    return chunks
\ No newline at end of file
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import os
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+
+def load_and_split_pdf(path):
+    """Load a single PDF and split it into chunks"""
+    docs = PyPDFLoader(str(path)).load()
+    return get_text_splitter().split_documents(docs)
+
+def iter_split_pdfs(paths, workers=None):
+    """Parse and chunk PDFs across a process pool, yielding ``(path, chunks)`` as files finish.
+
+    At most ``2 * workers`` files are in flight at once, so memory stays bounded
+    by the largest few files rather than the whole corpus.
+    """
+    paths = iter(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for path in paths:
+            yield path, load_and_split_pdf(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(load_and_split_pdf, path): path for path in islice(paths, 2 * workers)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                for next_path in islice(paths, 1):
+                    pending[pool.submit(load_and_split_pdf, next_path)] = next_path
+                yield path, future.result()
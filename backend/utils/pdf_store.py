@@ -0,0 +1,150 @@
+"""Content-addressed, lazily rendered answer PDFs.
+
+``register_pdf`` only names the PDF after a hash of its content and
+remembers the text: in memory, and in a small ``<hash>.txt`` sidecar
+written off the request path so any worker can render it. The PDF itself
+is rendered on the first download (``ensure_pdf``), or right after the
+sidecar is written when ``PDF_RENDER_MODE`` is ``"background"``. Identical
+answers share one file, and ``cleanup_pdfs`` keeps the directory within
+age and size limits.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from fpdf import FPDF
+from config import settings
+from utils.concurrency import get_executor
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+_pending = OrderedDict()  # filename -> content, for PDFs not yet persisted or rendered
+_lock = threading.Lock()
+_last_cleanup = 0.0
+
+def get_pdf_dir() -> Path:
+    path = Path(settings.PDF_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def pdf_filename(content: str) -> str:
+    return f"{hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]}.pdf"
+
+# --- PDF Generation ---
+@span("pdf_render")
+def generate_pdf(content: str, filename: str) -> str:
+    """Generate a PDF from the given content and save it"""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_font("Arial", size=12)
+
+    # One multi_cell for the whole text; it handles line breaks itself.
+    # The core fonts are latin-1 only.
+    pdf.multi_cell(0, 10, content.encode("latin-1", "replace").decode("latin-1"))
+
+    pdf_path = get_pdf_dir() / filename
+    tmp_path = pdf_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    pdf.output(str(tmp_path))
+    os.replace(tmp_path, pdf_path)
+    return str(pdf_path)
+
+# --- Registration and Lazy Rendering ---
+def register_pdf(content: str) -> str:
+    """Name the PDF for ``content`` and schedule persisting it; returns its path"""
+    filename = pdf_filename(content)
+    with _lock:
+        _pending[filename] = content
+        _pending.move_to_end(filename)
+        while len(_pending) > settings.PDF_PENDING_CACHE_SIZE:
+            _pending.popitem(last=False)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        # Fire and forget: the query response does not wait for disk writes
+        loop.run_in_executor(get_executor(), _persist, filename, content)
+    else:
+        _persist(filename, content)
+    return os.path.join(settings.PDF_DIR, filename)
+
+def _persist(filename: str, content: str):
+    try:
+        pdf_path = get_pdf_dir() / filename
+        if not pdf_path.exists():
+            sidecar = pdf_path.with_suffix(".txt")
+            if not sidecar.exists():
+                tmp_path = sidecar.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp_path.write_text(content, encoding="utf-8")
+                os.replace(tmp_path, sidecar)
+            if settings.PDF_RENDER_MODE == "background":
+                generate_pdf(content, filename)
+        maybe_cleanup_pdfs()
+    except Exception as e:
+        logger.error(f"Failed to persist PDF {filename}: {str(e)}")
+
+def ensure_pdf(filename: str) -> Optional[Path]:
+    """Return the path of a rendered PDF, rendering it now if needed; None if unknown"""
+    pdf_path = get_pdf_dir() / os.path.basename(filename)
+    if pdf_path.exists():
+        return pdf_path
+
+    with _lock:
+        content = _pending.get(pdf_path.name)
+    if content is None:
+        sidecar = pdf_path.with_suffix(".txt")
+        if not sidecar.exists():
+            return None
+        content = sidecar.read_text(encoding="utf-8")
+
+    generate_pdf(content, pdf_path.name)
+    return pdf_path
+
+# --- Retention ---
+def cleanup_pdfs(max_age_seconds: float, max_total_bytes: int) -> int:
+    """Delete PDFs and sidecars older than ``max_age_seconds``, then the oldest
+    until the directory is under ``max_total_bytes``. Returns files removed."""
+    now = time.time()
+    files = []
+    for path in get_pdf_dir().iterdir():
+        if path.suffix in (".pdf", ".txt"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    removed = 0
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if now - mtime <= max_age_seconds and total <= max_total_bytes:
+            break
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return removed
+
+def maybe_cleanup_pdfs():
+    """Run cleanup_pdfs with the configured limits, at most once per interval"""
+    global _last_cleanup
+    now = time.monotonic()
+    with _lock:
+        if now - _last_cleanup < settings.PDF_CLEANUP_INTERVAL_SECONDS:
+            return
+        _last_cleanup = now
+    removed = cleanup_pdfs(settings.PDF_MAX_AGE_SECONDS, settings.PDF_MAX_TOTAL_BYTES)
+    if removed:
+        logger.info(f"Removed {removed} old PDF files")
@@ -0,0 +1,297 @@
+"""Admission control and rate limiting for calls to rate-limited providers.
+
+Every LLM (and SerpAPI) call goes through a ``CallScheduler``:
+
+- At most ``max_concurrency`` calls run at once. Further calls wait in a
+  bounded priority queue: lower ``priority`` first, then the call whose
+  request started earliest, so a request already past its first LLM call
+  finishes before new ones start theirs.
+- A request arriving when ``max_queue`` calls are already waiting is
+  rejected by ``admit`` with ``QueueFull`` (served as 503) before it does
+  any work. Calls of admitted requests always join the queue, so requests
+  are shed on arrival rather than halfway through; a call that cannot start
+  within ``queue_timeout`` seconds fails with ``QueueTimeout`` (also 503).
+- Token buckets keep calls under the provider's requests- and tokens-per-
+  minute quota. A call whose share of the quota would only free up after its
+  deadline is rejected with ``RateLimited`` (served as 429).
+- Rate-limit, timeout and 5xx errors are retried with jittered exponential
+  backoff, honouring the provider's ``Retry-After`` header.
+
+Requests set their priority with ``request_priority``; calls made while
+serving the request inherit it, including calls in tasks it starts.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+import httpx
+import openai
+from utils.metrics import counter, histogram, record_stage
+
+PRIORITY_INTERACTIVE = 0  # Streamed answers: a user is watching the tokens arrive
+PRIORITY_DEFAULT = 1
+PRIORITY_BATCH = 2
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+SCHEDULER_WAIT_SECONDS = histogram(
+    "lexgen_scheduler_wait_seconds", "Time calls waited for a concurrency slot and rate-limit quota", ("scheduler",)
+)
+SCHEDULER_REJECTIONS = counter(
+    "lexgen_scheduler_rejections_total", "Calls rejected by admission control", ("scheduler", "reason")
+)
+SCHEDULER_RETRIES = counter(
+    "lexgen_scheduler_retries_total", "Provider calls retried after a transient error", ("scheduler",)
+)
+
+# --- Errors ---
+class SchedulerRejected(Exception):
+    """A call was shed instead of queued; ``status_code`` and ``retry_after`` describe the HTTP response"""
+
+    status_code = 503
+    reason = "rejected"
+
+    def __init__(self, scheduler: str, retry_after: float = 1.0):
+        self.scheduler = scheduler
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{scheduler} {self.reason}, retry in {self.retry_after}s")
+
+class QueueFull(SchedulerRejected):
+    reason = "queue_full"
+
+class QueueTimeout(SchedulerRejected):
+    reason = "queue_timeout"
+
+class RateLimited(SchedulerRejected):
+    status_code = 429
+    reason = "rate_limited"
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a provider error is transient (rate limit, timeout, connection or server error)"""
+    if isinstance(exc, SchedulerRejected):
+        return False
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    # An exhausted billing quota is reported as a 429 too, but waiting does not help
+    if getattr(exc, "code", None) == "insufficient_quota":
+        return False
+    return _status_code(exc) in RETRYABLE_STATUS
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait before retrying, if it said"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+# --- Request Priority ---
+_request_priority: ContextVar[Optional[Tuple[int, float]]] = ContextVar("request_priority", default=None)
+_admitted: ContextVar[frozenset] = ContextVar("admitted", default=frozenset())
+
+@contextmanager
+def request_priority(priority: int = PRIORITY_DEFAULT):
+    """Schedule the calls made inside the block at ``priority``, ordered by the block's start time"""
+    token = _request_priority.set((priority, time.monotonic()))
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """Per-minute quota refilled continuously; reservations may run it into debt"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` could be taken"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self._tokens) / self.rate)
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` now and return how long to wait before using it"""
+        wait = self.wait_time(amount)
+        self._tokens -= min(amount, self.capacity)
+        return wait
+
+# --- Scheduler ---
+class CallScheduler:
+    """Concurrency limit, bounded priority queue, rate limits and retries for one provider"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 8,
+        max_queue: int = 64,
+        queue_timeout: float = 20.0,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._active = 0
+        self._waiters = []  # heap of [priority, request start, seq, future]
+        self._seq = itertools.count()
+        self._stats = {"calls": 0, "retries": 0, "queue_full": 0, "queue_timeout": 0, "rate_limited": 0}
+
+    def _reject(self, error: SchedulerRejected):
+        self._stats[error.reason] += 1
+        SCHEDULER_REJECTIONS.inc(scheduler=self.name, reason=error.reason)
+        raise error
+
+    def _quota_wait(self, cost: float) -> float:
+        return max(
+            self._requests.wait_time(1) if self._requests else 0.0,
+            self._tokens.wait_time(cost) if self._tokens else 0.0,
+        )
+
+    def admit(self, cost: float = 0):
+        """Admit the current request, or shed it before it does work its calls depend on.
+
+        Raises if the queue is full, or if a call costing ``cost`` tokens could
+        not get its quota before the queue timeout. Once admitted, the calls
+        made in the current context queue even past ``max_queue``.
+        """
+        if len(self._waiters) >= self.max_queue:
+            self._reject(QueueFull(self.name))
+        wait = self._quota_wait(cost)
+        if wait > self.queue_timeout:
+            self._reject(RateLimited(self.name, wait))
+        _admitted.set(_admitted.get() | {self.name})
+
+    async def _acquire_slot(self, priority: Optional[int], deadline: float):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue and self.name not in _admitted.get():
+            self._reject(QueueFull(self.name))
+
+        inherited, started = _request_priority.get() or (PRIORITY_DEFAULT, time.monotonic())
+        future = asyncio.get_running_loop().create_future()
+        entry = [inherited if priority is None else priority, started, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                self._release()  # The slot was handed over just as we gave up
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(QueueTimeout(self.name))
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, so newcomers cannot jump the queue
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[-1]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def _acquire_quota(self, cost: float, deadline: float):
+        wait = self._quota_wait(cost)
+        if wait > deadline - time.monotonic():
+            self._reject(RateLimited(self.name, wait))
+        if self._requests:
+            self._requests.reserve(1)
+        if self._tokens:
+            self._tokens.reserve(cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 0, priority: Optional[int] = None):
+        """Hold a concurrency slot and ``cost`` tokens of quota for the enclosed call (no retries)"""
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        await self._acquire_slot(priority, deadline)
+        try:
+            await self._acquire_quota(cost, deadline)
+            waited = time.monotonic() - start
+            SCHEDULER_WAIT_SECONDS.observe(waited, scheduler=self.name)
+            record_stage(f"{self.name}_wait", waited)
+            self._stats["calls"] += 1
+            yield
+        finally:
+            self._release()
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        # "Full jitter": spreads out the retries of calls that failed together
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(delay, retry_after(exc) or 0.0)
+
+    async def run(self, func, *args, cost: float = 0, priority: Optional[int] = None, **kwargs):
+        """Await ``func(*args, **kwargs)`` under the limits, retrying transient errors.
+
+        Every attempt uses up quota. If the provider still reports a rate limit
+        after the last retry, ``RateLimited`` is raised.
+        """
+        async with self.slot(cost, priority):
+            attempt = 0
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        if _status_code(e) == 429:
+                            self._reject(RateLimited(self.name, retry_after(e) or self.backoff))
+                        raise
+                    delay = self._backoff(attempt, e)
+                    attempt += 1
+                    self._stats["retries"] += 1
+                    SCHEDULER_RETRIES.inc(scheduler=self.name)
+                await asyncio.sleep(delay)
+                await self._acquire_quota(cost, time.monotonic() + self.queue_timeout)
+
+    def stats(self) -> dict:
+        return {**self._stats, "active": self._active, "queued": len(self._waiters)}
+
+_schedulers = {}
+
+def get_scheduler(name: str, **options) -> CallScheduler:
+    """Return the named scheduler, creating it with ``options`` on first use"""
+    if name not in _schedulers:
+        _schedulers[name] = CallScheduler(name, **options)
+    return _schedulers[name]
+
+def scheduler_stats() -> dict:
+    """Stats of every scheduler, keyed by name"""
+    return {name: scheduler.stats() for name, scheduler in _schedulers.items()}
@@ -0,0 +1,51 @@
+"""Request coalescing ("single flight") for identical concurrent work.
+
+Callers that ask for the same key while a call is already running await
+that call's result instead of starting their own. The shared call runs as
+its own task, so a caller that is cancelled or times out does not cancel it
+for the others. Results are shared, not copied; callers must not mutate them.
+"""
+
+import asyncio
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # key -> asyncio.Task
+        self._stats = {"executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key, func, *args, **kwargs):
+        """Await ``func(*args, **kwargs)``, sharing one execution per key"""
+        task = self._inflight.get(key)
+        if task is None:
+            self._stats["executions"] += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception retrieved even if every caller already gave up
+        if not task.cancelled() and task.exception() is not None:
+            self._stats["errors"] += 1
+
+    def stats(self) -> dict:
+        return {**self._stats, "inflight": len(self._inflight)}
+
+_groups = {}
+
+def get_singleflight(name: str) -> SingleFlight:
+    """Return the named coalescing group, creating it on first use"""
+    if name not in _groups:
+        _groups[name] = SingleFlight(name)
+    return _groups[name]
+
+def singleflight_stats() -> dict:
+    """Stats of every coalescing group, keyed by group name"""
+    return {name: group.stats() for name, group in _groups.items()}